@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class FitnessConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'fitness'
+
+    def ready(self):
+        from . import metrics
+
+        metrics.install()
@@ -0,0 +1,137 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.http import JsonResponse
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.request import Request
+
+from . import leaderboard, stats
+from .models import Activity, Leaderboard
+from .pagination import ActivityPagination, LeaderboardPagination
+from .repository import find_sorted
+from .representation import compile_representation
+from .routing import read_db
+from .serializers import ActivitySerializer, LeaderboardSerializer
+
+# pymongo is blocking, so async views hand their Mongo calls to a bounded
+# pool of threads and await the result. The event loop stays free to serve
+# other requests while a round trip is in flight, and the pool size caps how
+# many connections the async views can hold at once.
+DEFAULT_WORKERS = 16
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'ASYNC_DB_WORKERS', DEFAULT_WORKERS),
+                    thread_name_prefix='async-db',
+                )
+    return _executor
+
+
+async def run_db(func, *args, **kwargs):
+    """
+    Run a blocking database call on the pool.
+
+    The call runs in a copy of the caller's context, so per-request state
+    such as the Server-Timing counters follows it into the thread.
+    """
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    return await asyncio.get_running_loop().run_in_executor(executor(), call)
+
+
+def async_endpoint(view):
+    """
+    Accept only GET and turn DRF API exceptions into JSON error responses,
+    as DRF's exception handler does for the sync views.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=405)
+        try:
+            return await view(Request(request), *args, **kwargs)
+        except APIException as exc:
+            detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+            return JsonResponse(detail, status=exc.status_code, safe=False)
+    return wrapper
+
+
+def _keyset_page(pagination_class, serializer_class, model, collection, query, request):
+    paginator = pagination_class()
+
+    def fetch(position, limit):
+        return find_sorted(read_db(collection)[collection], query, paginator.ordering, limit, position)
+
+    documents = paginator.paginate_documents(fetch, request, model)
+    represent = compile_representation(serializer_class, documents=True)
+    return {
+        'next': paginator.get_next_link(),
+        'results': [represent(document) for document in documents],
+    }
+
+
+@async_endpoint
+async def leaderboard_list(request):
+    """
+    Leaderboard entries by rank, optionally of one ``type``, keyset paginated
+    like /api/leaderboard/.
+    """
+    entry_type = request.query_params.get('type')
+    if entry_type not in (None, leaderboard.USER, leaderboard.TEAM):
+        raise ValidationError({'type': [f'Expected {leaderboard.USER!r} or {leaderboard.TEAM!r}.']})
+    query = {} if entry_type is None else {'type': entry_type}
+    page = await run_db(
+        _keyset_page, LeaderboardPagination, LeaderboardSerializer, Leaderboard,
+        'leaderboard', query, request,
+    )
+    return JsonResponse(page)
+
+
+@async_endpoint
+async def activity_list(request):
+    """
+    Activities newest first, optionally for one ``user_email`` and bounded by
+    ``from``/``to``, keyset paginated like /api/activities/.
+    """
+    query = stats.date_range_match(request.query_params)
+    user_email = request.query_params.get('user_email')
+    if user_email:
+        query['user_email'] = user_email
+    page = await run_db(
+        _keyset_page, ActivityPagination, ActivitySerializer, Activity,
+        'activities', query, request,
+    )
+    return JsonResponse(page)
+
+
+BREAKDOWNS = {
+    'users': stats.user_pipeline,
+    'teams': stats.team_pipeline,
+    'activity-types': stats.activity_type_pipeline,
+}
+
+
+@async_endpoint
+async def stats_view(request, breakdown=None):
+    """
+    The same totals and breakdowns as /api/stats/.
+    """
+    match = stats.date_range_match(request.query_params)
+    if breakdown is None:
+        return JsonResponse(await run_db(stats.overall, match))
+    if breakdown not in BREAKDOWNS:
+        return JsonResponse({'detail': 'Not found.'}, status=404)
+    pipeline = BREAKDOWNS[breakdown](match, stats.limit_param(request.query_params))
+    return JsonResponse(await run_db(stats.aggregate, pipeline), safe=False)
@@ -0,0 +1,100 @@
+import contextvars
+import re
+
+from rest_framework.exceptions import ValidationError
+from rest_framework.settings import api_settings
+
+from . import repository
+from .async_views import executor
+from .cache import cached_data
+from .pagination import ActivityPagination, KeysetPagination, UserPagination
+from .representation import compile_representation
+from .routing import read_db
+from .serializers import TeamSerializer, UserSerializer, WorkoutSerializer
+
+MAX_PARTS = 10
+SPEC = re.compile(r'^(?P<name>[a-z]+)(?::(?P<verb>[a-z]*)(?P<limit>\d+))?$')
+
+
+class Part:
+    """
+    One resource a batch request can include, read as ``name`` or
+    ``name:<verb><limit>`` (e.g. ``leaderboard:top10``).
+    """
+
+    def __init__(self, collection, read, verb='', default_limit=api_settings.PAGE_SIZE,
+                 max_limit=KeysetPagination.max_page_size):
+        self.collection = collection
+        self.read = read
+        self.verb = verb
+        self.default_limit = default_limit
+        self.max_limit = max_limit
+
+
+def _first_page(serializer_class, ordering):
+    def read(limit, db):
+        model = serializer_class.Meta.model
+        documents = repository.find_sorted(db[model._meta.db_table], {}, ordering, limit)
+        represent = compile_representation(serializer_class, documents=True)
+        return [represent(document) for document in documents]
+    return read
+
+
+PARTS = {
+    'users': Part('users', _first_page(UserSerializer, UserPagination.ordering)),
+    'teams': Part('teams', _first_page(TeamSerializer, ('-total_points', '_id'))),
+    'workouts': Part('workouts', _first_page(WorkoutSerializer, ('_id',))),
+    'leaderboard': Part(
+        'leaderboard',
+        lambda limit, db: repository.leaderboard_top(limit=limit, db=db),
+        verb='top', default_limit=10, max_limit=100,
+    ),
+    'activities': Part(
+        'activities',
+        lambda limit, db: repository.activities(limit=limit, db=db),
+        verb='recent', default_limit=ActivityPagination.page_size,
+    ),
+}
+
+
+def parse(include):
+    """
+    Parse an ``include`` param into (spec, part, limit) triples, one per
+    distinct spec.
+    """
+    specs = [spec.strip() for spec in include.split(',') if spec.strip()]
+    if not specs:
+        raise ValidationError({'include': ['Expected a comma-separated list of parts.']})
+    if len(specs) > MAX_PARTS:
+        raise ValidationError({'include': [f'Expected at most {MAX_PARTS} parts.']})
+    parsed = []
+    for spec in dict.fromkeys(specs):
+        match = SPEC.match(spec)
+        part = PARTS.get(match['name']) if match else None
+        if part is None or match['verb'] not in (None, '', part.verb):
+            choices = ', '.join(f'{name}:{known.verb}N' for name, known in PARTS.items())
+            raise ValidationError({'include': [f'Unknown part {spec!r}; expected one of: {choices}.']})
+        limit = int(match['limit']) if match['limit'] else part.default_limit
+        if not 1 <= limit <= part.max_limit:
+            raise ValidationError({'include': [f'{spec!r}: expected a limit from 1 to {part.max_limit}.']})
+        parsed.append((spec, part, limit))
+    return parsed
+
+
+def read(parsed, db=None):
+    """
+    Read every part concurrently on the shared database pool and return
+    {spec: data}. Each part is cached under its collection's version, so a
+    part served recently costs no database round trip at all. Without a
+    ``db``, each part reads from the database routing picks for it.
+    """
+    pool = executor()
+    futures = {}
+    for spec, part, limit in parsed:
+        def compute(part=part, limit=limit):
+            return part.read(limit, db if db is not None else read_db(part.collection))
+        # Each part runs in its own copy of the request context, so its
+        # database time is counted in the request's Server-Timing
+        context = contextvars.copy_context()
+        futures[spec] = pool.submit(context.run, cached_data, part.collection, f'batch:{limit}', compute)
+    return {spec: future.result() for spec, future in futures.items()}
@@ -0,0 +1,448 @@
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from bson import ObjectId
+from django.urls import reverse
+
+from . import indexes, leaderboard, repository, synthetic
+from .cache import invalidate_all
+from .ingest import ingest_activities
+from .models import Activity, Leaderboard, User
+from .representation import represent_many
+from .serializers import ActivitySerializer, LeaderboardSerializer, UserSerializer
+
+SUITES = {}
+DEFAULT_SIZES = (1000, 10000, 100000)
+COLLECTIONS = ('users', 'teams', 'activities', 'leaderboard', 'workouts')
+BENCH_SEED = 800
+
+
+def suite(name, orm=False):
+    """
+    Register a benchmark suite. A suite takes a list of dataset sizes and a
+    pymongo Database and returns a list of result dicts.
+
+    Suites marked ``orm`` go through Django and djongo, so they need the
+    database to be the default connection rather than an in-memory stand-in.
+    """
+    def register(func):
+        func.orm = orm
+        SUITES[name] = func
+        return func
+    return register
+
+
+def best_of(func, repeat=3, setup=None):
+    """
+    Best wall-clock time of ``repeat`` calls to ``func``, in seconds.
+
+    ``setup`` runs untimed before every call.
+    """
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def reset(db):
+    for name in COLLECTIONS:
+        db[name].delete_many({})
+
+
+def make_activity(i, start=datetime(2024, 1, 1, tzinfo=dt_timezone.utc)):
+    return Activity(
+        _id=ObjectId(),
+        user_email=f'user{i % 1000}@bench.com',
+        activity_type=('Running', 'Cycling', 'Yoga')[i % 3],
+        duration=20 + i % 70,
+        calories=200 + i % 700,
+        points=20 + i % 70,
+        date=start + timedelta(minutes=i),
+        notes=f'Benchmark session {i}',
+    )
+
+
+def make_user(i, start=datetime(2024, 1, 1, tzinfo=dt_timezone.utc)):
+    return User(
+        _id=ObjectId(),
+        name=f'Bench User {i}',
+        email=f'user{i}@bench.com',
+        team=f'Team {i % 10}',
+        total_points=i % 5000,
+        created_at=start + timedelta(seconds=i),
+    )
+
+
+def make_workout(i):
+    return {
+        'name': f'Bench Workout {i}',
+        'description': f'Benchmark workout {i}',
+        'category': ('Cardio', 'Strength', 'Core')[i % 3],
+        'difficulty': ('Easy', 'Medium', 'Hard')[i % 3],
+        'duration': 20 + i % 40,
+        'calories_per_session': 200 + i % 300,
+        'points_per_session': 20 + i % 50,
+        'created_at': datetime(2024, 1, 1, tzinfo=dt_timezone.utc),
+    }
+
+
+def as_document(instance):
+    return {field.attname: getattr(instance, field.attname) for field in instance._meta.concrete_fields}
+
+
+@suite('serializers')
+def serializers_suite(sizes, db=None):
+    """
+    DRF ModelSerializer(many=True).data against the compiled representation,
+    from model instances and from raw documents.
+    """
+    results = []
+    for name, serializer_class, factory in (
+        ('activity', ActivitySerializer, make_activity),
+        ('user', UserSerializer, make_user),
+    ):
+        for size in sizes:
+            instances = [factory(i) for i in range(size)]
+            documents = [as_document(instance) for instance in instances]
+            drf = best_of(lambda: serializer_class(instances, many=True).data)
+            compiled = best_of(lambda: represent_many(serializer_class, instances))
+            raw = best_of(lambda: represent_many(serializer_class, documents, documents=True))
+            results.append({
+                'suite': 'serializers',
+                'case': name,
+                'rows': size,
+                'drf_seconds': drf,
+                'compiled_seconds': compiled,
+                'compiled_documents_seconds': raw,
+                'speedup': drf / compiled if compiled else None,
+            })
+    return results
+
+
+def seed_dataset(db, activities, activities_per_user=10):
+    """
+    Fill the collections with ``activities`` synthetic activities, their users
+    and teams, both leaderboards and some workouts.
+    """
+    reset(db)
+    users = max(activities // activities_per_user, 1)
+    for _ in synthetic.populate(users, 10, activities_per_user, 30, BENCH_SEED, db=db):
+        pass
+    leaderboard.rebuild(db)
+    db.workouts.insert_many([make_workout(i) for i in range(max(activities // 100, 10))])
+    return users
+
+
+def _create_payloads():
+    counter = iter(range(10 ** 9))
+    return {
+        'user': lambda: {
+            'name': 'New Athlete',
+            'email': f'new{next(counter)}@bench.com',
+            'team': synthetic.team_name(1),
+        },
+        'team': lambda: {'name': f'New Team {next(counter)}', 'description': 'Benchmark team'},
+        'activity': lambda: {
+            'user_email': 'athlete0@octofit.app',
+            'activity_type': 'Running',
+            'duration': 30,
+            'calories': 300,
+            'points': 30,
+            'date': '2024-01-01T10:00:00Z',
+        },
+        'leaderboard': lambda: {
+            'type': 'user',
+            'name': 'New Athlete',
+            'email': f'new{next(counter)}@bench.com',
+            'points': 0,
+            'rank': 0,
+        },
+        'workout': lambda: {
+            key: value for key, value in make_workout(next(counter)).items() if key != 'created_at'
+        },
+    }
+
+
+@suite('api', orm=True)
+def api_suite(sizes, db, creates=20):
+    """
+    list (first page, cold cache), retrieve and create latency of every
+    viewset through the full Django request stack.
+    """
+    from rest_framework.test import APIClient
+
+    client = APIClient()
+    payloads = _create_payloads()
+
+    def request(method, url, data=None):
+        response = getattr(client, method)(url, data, format='json')
+        if response.status_code >= 400:
+            raise AssertionError(f'{method.upper()} {url} returned {response.status_code}')
+
+    indexes.sync(db)
+    results = []
+    for size in sizes:
+        seed_dataset(db, size)
+        for collection, basename in zip(COLLECTIONS, ('user', 'team', 'activity', 'leaderboard', 'workout')):
+            list_url = reverse(f'{basename}-list')
+            document = db[collection].find_one({}, {'_id': 1})
+            detail_url = reverse(f'{basename}-detail', args=[str(document['_id'])])
+            payload = payloads[basename]
+            result = {
+                'suite': 'api',
+                'case': collection,
+                'rows': db[collection].count_documents({}),
+                'list_seconds': best_of(lambda: request('get', list_url), setup=invalidate_all),
+                'list_cached_seconds': best_of(lambda: request('get', list_url)),
+                'retrieve_seconds': best_of(lambda: request('get', detail_url), setup=invalidate_all),
+            }
+            create = best_of(lambda: [request('post', list_url, payload()) for _ in range(creates)])
+            result['create_seconds'] = create / creates
+            results.append(result)
+    reset(db)
+    return results
+
+
+@suite('ranking')
+def ranking_suite(sizes, db, updates=100):
+    """
+    Full leaderboard rebuild against single-user incremental rank updates.
+    """
+    indexes.sync(db)
+    end = synthetic.end_of_window()
+    results = []
+    for size in sizes:
+        reset(db)
+        db.users.insert_many([
+            synthetic.generate_user(i, BENCH_SEED, 10, 1, 30, end)[0] for i in range(size)
+        ])
+        db.teams.insert_many([
+            {'name': synthetic.team_name(i), 'total_points': 0} for i in range(1, 11)
+        ])
+        rebuild = best_of(lambda: leaderboard.rebuild(db))
+        start = time.perf_counter()
+        for i in range(updates):
+            leaderboard.apply_point_deltas({f'athlete{i * 7919 % size}@octofit.app': i % 50 + 1}, db)
+        incremental = (time.perf_counter() - start) / updates
+        results.append({
+            'suite': 'ranking',
+            'case': 'leaderboard',
+            'rows': size,
+            'rebuild_seconds': rebuild,
+            'update_seconds': incremental,
+        })
+    reset(db)
+    return results
+
+
+@suite('ingest')
+def ingest_suite(sizes, db, activities_per_user=10):
+    """
+    populate_db's synthetic insert rate and the validated bulk ingest rate.
+    """
+    indexes.sync(db)
+    results = []
+    for size in sizes:
+        reset(db)
+        users = max(size // activities_per_user, 1)
+        start = time.perf_counter()
+        for _ in synthetic.populate(users, 10, activities_per_user, 30, BENCH_SEED, db=db):
+            pass
+        populate = time.perf_counter() - start
+
+        rows = [
+            {
+                'user_email': f'athlete{i % users}@octofit.app',
+                'activity_type': 'Running',
+                'duration': 30,
+                'calories': 300,
+                'points': 30,
+                'date': datetime(2024, 1, 1, tzinfo=dt_timezone.utc) + timedelta(minutes=i),
+            }
+            for i in range(size)
+        ]
+        start = time.perf_counter()
+        ingest_activities(rows, db=db)
+        bulk = time.perf_counter() - start
+
+        results.append({
+            'suite': 'ingest',
+            'case': 'activities',
+            'rows': users * activities_per_user,
+            'populate_seconds': populate,
+            'populate_per_second': users * activities_per_user / populate,
+            'bulk_ingest_seconds': bulk,
+            'bulk_ingest_per_second': size / bulk,
+        })
+    reset(db)
+    return results
+
+
+@suite('repository', orm=True)
+def repository_suite(sizes, db, calls=50):
+    """
+    Hot reads through the ORM and djongo against the pymongo repository,
+    per call, with identical output.
+    """
+    from rest_framework.test import APIClient
+    from .views import ActivityViewSet
+
+    client = APIClient()
+    email = 'athlete0@octofit.app'
+    cases = (
+        (
+            'activities_by_user',
+            lambda: represent_many(
+                ActivitySerializer,
+                Activity.objects.filter(user_email=email).order_by('-date', '-_id')[:50],
+            ),
+            lambda: repository.activities(email, limit=50),
+        ),
+        (
+            'leaderboard_top',
+            lambda: represent_many(
+                LeaderboardSerializer,
+                Leaderboard.objects.filter(type=leaderboard.USER).order_by('rank', '_id')[:10],
+            ),
+            lambda: repository.leaderboard_top(leaderboard.USER, 10),
+        ),
+        (
+            'user_by_email',
+            lambda: represent_many(UserSerializer, [User.objects.get(email=email)])[0],
+            lambda: repository.user_by_email(email),
+        ),
+    )
+
+    def per_call(func):
+        return best_of(lambda: [func() for _ in range(calls)]) / calls
+
+    def list_activities():
+        response = client.get(reverse('activity-list'))
+        if response.status_code != 200:
+            raise AssertionError(f'activity list returned {response.status_code}')
+
+    indexes.sync(db)
+    results = []
+    for size in sizes:
+        seed_dataset(db, size)
+        for case, orm, native in cases:
+            if orm() != native():
+                raise AssertionError(f'{case}: repository output differs from the ORM')
+            orm_seconds, native_seconds = per_call(orm), per_call(native)
+            results.append({
+                'suite': 'repository',
+                'case': case,
+                'rows': size,
+                'orm_seconds': orm_seconds,
+                'native_seconds': native_seconds,
+                'saved_seconds': orm_seconds - native_seconds,
+                'speedup': orm_seconds / native_seconds if native_seconds else None,
+            })
+
+        timings = {}
+        for native_list in (False, True):
+            ActivityViewSet.native_list = native_list
+            try:
+                timings[native_list] = best_of(list_activities, setup=invalidate_all)
+            finally:
+                del ActivityViewSet.native_list
+        results.append({
+            'suite': 'repository',
+            'case': 'activity_list_request',
+            'rows': size,
+            'orm_seconds': timings[False],
+            'native_seconds': timings[True],
+            'saved_seconds': timings[False] - timings[True],
+            'speedup': timings[False] / timings[True] if timings[True] else None,
+        })
+    reset(db)
+    return results
+
+
+@suite('formats')
+def formats_suite(sizes, db=None):
+    """
+    Encode and decode time and payload size of activity and leaderboard pages
+    in JSON against MessagePack and CBOR, for the binary formats whose
+    packages are installed.
+    """
+    import io
+
+    from rest_framework.parsers import JSONParser
+    from rest_framework.renderers import JSONRenderer
+    from .parsers import CBORParser, MessagePackParser
+    from .renderers import CBORRenderer, MessagePackRenderer
+
+    formats = [('json', JSONRenderer(), JSONParser())]
+    if MessagePackParser.available:
+        formats.append(('msgpack', MessagePackRenderer(), MessagePackParser()))
+    if CBORParser.available:
+        formats.append(('cbor', CBORRenderer(), CBORParser()))
+
+    def leaderboard_entry(i):
+        user = make_user(i)
+        return Leaderboard(
+            _id=ObjectId(), type=leaderboard.USER, name=user.name, email=user.email,
+            team=user.team, points=user.total_points, rank=i + 1, updated_at=user.created_at,
+        )
+
+    results = []
+    for size in sizes:
+        for case, serializer_class, factory in (
+            ('activity', ActivitySerializer, make_activity),
+            ('leaderboard', LeaderboardSerializer, leaderboard_entry),
+        ):
+            data = represent_many(serializer_class, [factory(i) for i in range(size)])
+            json_bytes = json_seconds = None
+            for name, renderer, parser in formats:
+                body = renderer.render(data, renderer.media_type)
+                encode = best_of(lambda: renderer.render(data, renderer.media_type))
+                decode = best_of(lambda: parser.parse(io.BytesIO(body), parser.media_type, {}))
+                if json_bytes is None:
+                    json_bytes, json_seconds = len(body), encode
+                results.append({
+                    'suite': 'formats',
+                    'case': f'{case}_{name}',
+                    'rows': size,
+                    'bytes': len(body),
+                    'encode_seconds': encode,
+                    'decode_seconds': decode,
+                    'size_ratio': len(body) / json_bytes,
+                    'encode_speedup': json_seconds / encode if encode else None,
+                })
+    return results
+
+
+def compare(baseline, current, threshold=0.1):
+    """
+    Match results on (suite, case, rows) and return (key, metric, old, new,
+    regressed) rows for every timing or rate present in both runs.
+
+    A ``*_seconds`` metric regresses when it grows by more than ``threshold``;
+    a ``*_per_second`` metric when it shrinks by more than ``threshold``.
+    """
+    def keyed(results):
+        return {(r['suite'], r['case'], r['rows']): r for r in results}
+
+    old_results = keyed(baseline)
+    rows = []
+    for key, new in keyed(current).items():
+        old = old_results.get(key)
+        if old is None:
+            continue
+        for metric, value in new.items():
+            previous = old.get(metric)
+            if not previous or not isinstance(value, (int, float)):
+                continue
+            if metric.endswith('_per_second'):
+                regressed = value < previous * (1 - threshold)
+            elif metric.endswith('_seconds'):
+                regressed = value > previous * (1 + threshold)
+            else:
+                continue
+            rows.append((key, metric, previous, value, regressed))
+    return rows
@@ -0,0 +1,178 @@
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.apps import apps
+from django.core.cache import caches
+from pymongo import ReturnDocument
+from rest_framework.response import Response
+
+from .mongo import get_db
+from .routing import cache_variant
+
+CACHE_ALIAS = 'api'
+VERSIONS_COLLECTION = 'cache_versions'
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _record(collection, outcome):
+    with _stats_lock:
+        _stats[(collection, outcome)] += 1
+
+
+def _versions(db=None):
+    # The primary unless a caller works on a database of its own (such as
+    # the in-memory benchmarks): a version read from a lagging secondary
+    # could pair new cache keys with old data
+    if db is None:
+        db = get_db()
+    return db[VERSIONS_COLLECTION]
+
+
+def collection_version(collection):
+    """
+    Current version of a collection.
+
+    A version is the time of the last write in nanoseconds. Versions live in
+    MongoDB rather than in the 'api' cache, so a write from any process
+    (another worker, populate_db, a repair command) changes the version every
+    process sees. A collection with no version yet starts from the clock, so
+    it can never collide with one that keys older entries.
+    """
+    document = _versions().find_one({'_id': collection})
+    if document is None:
+        document = _versions().find_one_and_update(
+            {'_id': collection}, {'$setOnInsert': {'version': time.time_ns()}},
+            upsert=True, return_document=ReturnDocument.AFTER,
+        )
+    return document['version']
+
+
+def invalidate(*collections, db=None):
+    """
+    Bump the version of each collection, orphaning every cached response
+    keyed by the previous version. ``db`` is the database the write went
+    to, when it is not the default one.
+    """
+    versions = _versions(db)
+    for collection in collections:
+        now = time.time_ns()
+        document = versions.find_one_and_update(
+            {'_id': collection}, {'$max': {'version': now}},
+            upsert=True, return_document=ReturnDocument.BEFORE,
+        )
+        if document is not None and document['version'] >= now:
+            # Another process's clock ran ahead; step past its version
+            versions.update_one({'_id': collection}, {'$inc': {'version': 1}})
+
+
+def invalidate_all(db=None):
+    invalidate(*(model._meta.db_table for model in apps.get_app_config('fitness').get_models()), db=db)
+
+
+def response_key(collection, request, variant=''):
+    source = f'{request.get_full_path()}:{variant}:{cache_variant(collection)}'
+    path = hashlib.sha1(source.encode('utf-8')).hexdigest()
+    return f'response:{collection}:{collection_version(collection)}:{path}'
+
+
+def cached_data(collection, key, compute):
+    """
+    Return ``compute()``, cached under ``key`` and the collection's current
+    version.
+    """
+    key = f'data:{collection}:{collection_version(collection)}:{cache_variant(collection)}:{key}'
+    data = _cache().get(key)
+    if data is not None:
+        _record(collection, 'hit')
+        return data
+    _record(collection, 'miss')
+    data = compute()
+    _cache().set(key, data)
+    return data
+
+
+def cache_stats():
+    """
+    Hit and miss counters per collection since this process started.
+    """
+    with _stats_lock:
+        counts = dict(_stats)
+    collections = sorted({collection for collection, _ in counts})
+    result = {}
+    for collection in collections:
+        hits = counts.get((collection, 'hit'), 0)
+        misses = counts.get((collection, 'miss'), 0)
+        result[collection] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / (hits + misses) if hits + misses else 0.0,
+        }
+    return result
+
+
+class VersionedWritesMixin:
+    """
+    Bumps the collection version from the perform_create/update/destroy
+    hooks, along with any collections listed in ``invalidates``.
+    """
+    cache_collection = None
+    invalidates = ()
+
+    def get_cache_collection(self):
+        return self.cache_collection or self.queryset.model._meta.db_table
+
+    def get_cache_variant(self, request):
+        """
+        Anything besides the collection version and the URL that changes the
+        response, such as the current time window.
+        """
+        return ''
+
+    def invalidate_cache(self):
+        invalidate(self.get_cache_collection(), *self.invalidates)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        self.invalidate_cache()
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        self.invalidate_cache()
+
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        self.invalidate_cache()
+
+
+class CachedResponseMixin(VersionedWritesMixin):
+    """
+    Caches the data of successful list and retrieve responses under the
+    collection's current version, so writes never leave stale entries behind.
+    """
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        collection = self.get_cache_collection()
+        key = response_key(collection, request, self.get_cache_variant(request))
+        data = _cache().get(key)
+        if data is not None:
+            _record(collection, 'hit')
+            return Response(data)
+        _record(collection, 'miss')
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            _cache().set(key, response.data)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,52 @@
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .cache import VersionedWritesMixin, collection_version
+from .routing import cache_variant
+
+
+def validators(collection, request, variant=''):
+    """
+    Return the strong ETag and Last-Modified timestamp for a GET request.
+
+    Both derive from the collection version alone, so they are known before
+    the view queries or serializes anything. The ETag also covers the full
+    path, the negotiated media type and the database the body is read from,
+    since those change the body.
+    """
+    version = collection_version(collection)
+    media_type = getattr(request, 'accepted_media_type', '')
+    source = f'{collection}:{version}:{request.get_full_path()}:{media_type}:{variant}:{cache_variant(collection)}'
+    etag = quote_etag(hashlib.sha1(source.encode('utf-8')).hexdigest())
+    return etag, version // 1_000_000_000
+
+
+class ConditionalGetMixin(VersionedWritesMixin):
+    """
+    Answers If-None-Match / If-Modified-Since on list and retrieve with 304
+    when the collection has not changed, and tags full responses with ETag
+    and Last-Modified.
+    """
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        etag, last_modified = validators(
+            self.get_cache_collection(), request, self.get_cache_variant(request)
+        )
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        # Let browsers keep the body but revalidate it on every use
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(super().retrieve, request, *args, **kwargs)
@@ -0,0 +1,71 @@
+from collections import Counter
+
+from . import leaderboard, rollups
+from .cache import invalidate
+
+
+def activity_snapshot(activity):
+    """
+    Capture the fields of an Activity that derived data depends on.
+    """
+    return {
+        'user_email': activity.user_email,
+        'duration': activity.duration,
+        'calories': activity.calories,
+        'points': activity.points,
+        'date': activity.date,
+    }
+
+
+def document_snapshot(document):
+    """
+    activity_snapshot for a raw activity document.
+    """
+    return {name: document[name] for name in ('user_email', 'duration', 'calories', 'points', 'date')}
+
+
+def user_snapshot(user):
+    """
+    Capture the fields of a User that team counters and leaderboards depend on.
+    """
+    return {
+        'name': user.name,
+        'email': user.email,
+        'team': user.team,
+        'total_points': user.total_points,
+    }
+
+
+def activities_changed(added=(), removed=(), db=None):
+    """
+    Apply derived updates for activities added to or removed from the
+    activities collection. An edit is the old version removed and the new
+    version added.
+
+    Activities are mappings shaped like activity_snapshot's, e.g. read from
+    Mongo.
+    """
+    deltas = Counter()
+    for activity in added:
+        deltas[activity['user_email']] += activity['points']
+    for activity in removed:
+        deltas[activity['user_email']] -= activity['points']
+    leaderboard.apply_point_deltas(deltas, db)
+    rollups.apply(added, removed, db)
+    invalidate('activities', 'users', 'teams', 'leaderboard', db=db)
+
+
+def users_changed(added=(), removed=(), db=None):
+    """
+    Apply derived updates for users added, edited or removed, shaped like
+    user_snapshot's. An edit is the old version removed and the new version
+    added.
+    """
+    leaderboard.apply_user_changes(added, removed, db)
+    teams = {user['email']: [user['team'], None] for user in removed}
+    for user in added:
+        teams.setdefault(user['email'], [None, None])[1] = user['team']
+    for email, (old_team, new_team) in teams.items():
+        if old_team != new_team:
+            rollups.move_user(email, old_team, new_team, db)
+    invalidate('users', 'teams', 'leaderboard', db=db)
@@ -0,0 +1,29 @@
+from .mongo import get_db
+from .representation import compile_representation
+from .serializers import ActivitySerializer
+
+EXPORT_BATCH_SIZE = 1000
+
+
+def export_fields():
+    """
+    The columns of an activity export, in ActivitySerializer order.
+    """
+    return list(ActivitySerializer.Meta.fields)
+
+
+def activity_rows(match, batch_size=EXPORT_BATCH_SIZE, db=None):
+    """
+    Yield activities matching ``match`` as ActivitySerializer-shaped dicts.
+
+    Documents are read through a server-side cursor that fetches
+    ``batch_size`` documents per round trip, so memory stays constant no
+    matter how many rows are exported.
+    """
+    if db is None:
+        db = get_db()
+    represent = compile_representation(ActivitySerializer, documents=True)
+    projection = {name: 1 for name in export_fields()}
+    with db.activities.find(match, projection, batch_size=batch_size) as cursor:
+        for document in cursor:
+            yield represent(document)
@@ -0,0 +1,59 @@
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+
+
+class SparseFieldsMixin:
+    """
+    Supports ``?fields=a,b`` and ``?exclude=c`` on reads.
+
+    The selected fields trim the serializer output and become an ``.only()``
+    on the queryset, so djongo projects away unrequested columns (such as
+    long text fields) instead of reading them from MongoDB.
+    """
+    fields_query_param = 'fields'
+    exclude_query_param = 'exclude'
+
+    def _field_list(self, param, available):
+        value = self.request.query_params.get(param)
+        if value is None:
+            return None
+        names = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = [name for name in names if name not in available]
+        if unknown:
+            raise ValidationError({param: [f'Unknown field(s): {", ".join(unknown)}.']})
+        return set(names)
+
+    def get_requested_fields(self):
+        """
+        The requested fields as a tuple in serializer order, or None when the
+        request asks for every field.
+        """
+        if not hasattr(self, '_requested_fields'):
+            self._requested_fields = None
+            if self.request is not None and self.request.method in SAFE_METHODS:
+                available = list(self.get_serializer_class().Meta.fields)
+                fields = self._field_list(self.fields_query_param, available)
+                exclude = self._field_list(self.exclude_query_param, available)
+                if fields is not None or exclude is not None:
+                    selected = fields if fields is not None else set(available)
+                    selected -= exclude or set()
+                    self._requested_fields = tuple(name for name in available if name in selected)
+        return self._requested_fields
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fields = self.get_requested_fields()
+        if fields is None:
+            return queryset
+        serializer_fields = self.get_serializer_class()().fields
+        columns = {serializer_fields[name].source for name in fields}
+        columns.add(queryset.model._meta.pk.name)
+        # Keyset pagination reads its sort keys from the last row of a page
+        columns.update(getattr(self.paginator, 'field_names', list)())
+        return queryset.only(*columns)
+
+    def get_serializer(self, *args, **kwargs):
+        fields = self.get_requested_fields()
+        if fields is not None:
+            kwargs.setdefault('fields', fields)
+        return super().get_serializer(*args, **kwargs)
@@ -0,0 +1,65 @@
+from rest_framework.exceptions import ValidationError
+
+from .stats import parse_bound
+
+# Orderings a client may ask for, each with the unique tie-breaker keyset
+# pagination needs. Every one is served by an index on activities.
+ACTIVITY_ORDERINGS = {
+    '-date': ('-date', '-_id'),
+    'date': ('date', '_id'),
+    '-points': ('-points', '-_id'),
+    'points': ('points', '_id'),
+}
+DEFAULT_ACTIVITY_ORDERING = '-date'
+
+
+def activity_filters(params):
+    """
+    The activity list filters in ``params`` as Django lookups.
+
+    ``user_email`` and ``activity_type`` match exactly, ``date__gte`` and
+    ``date__lte`` take a date or datetime (a bare ``date__lte`` date covers
+    that whole day) and ``min_points`` is an inclusive lower bound.
+    """
+    lookups = {}
+    for name in ('user_email', 'activity_type'):
+        value = params.get(name)
+        if value:
+            lookups[name] = value
+    start, _ = parse_bound(params, 'date__gte')
+    if start is not None:
+        lookups['date__gte'] = start
+    end, whole_day = parse_bound(params, 'date__lte', end_of_day=True)
+    if end is not None:
+        lookups['date__lt' if whole_day else 'date__lte'] = end
+    min_points = params.get('min_points')
+    if min_points:
+        try:
+            lookups['points__gte'] = int(min_points)
+        except ValueError:
+            raise ValidationError({'min_points': 'Expected an integer.'})
+    return lookups
+
+
+def activity_ordering(params):
+    """
+    The keyset ordering for the ``ordering`` param.
+    """
+    ordering = params.get('ordering') or DEFAULT_ACTIVITY_ORDERING
+    if ordering not in ACTIVITY_ORDERINGS:
+        raise ValidationError({'ordering': [f'Expected one of: {", ".join(ACTIVITY_ORDERINGS)}.']})
+    return ACTIVITY_ORDERINGS[ordering]
+
+
+def mongo_query(lookups):
+    """
+    Translate Django lookups (exact, gt, gte, lt, lte) into a Mongo filter.
+    """
+    query = {}
+    for lookup, value in lookups.items():
+        field, _, operator = lookup.partition('__')
+        if operator:
+            query.setdefault(field, {})[f'${operator}'] = value
+        else:
+            query[field] = value
+    return query
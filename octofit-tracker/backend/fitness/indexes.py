@@ -0,0 +1,140 @@
+from collections import namedtuple
+from datetime import datetime
+
+from django.apps import apps
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from .mongo import get_db
+
+ServedQuery = namedtuple('ServedQuery', ['description', 'filter', 'sort'])
+ServedQuery.__new__.__defaults__ = (None,)
+
+
+class MongoIndex:
+    """
+    A MongoDB index declared next to a model, together with sample versions
+    of the API queries it is meant to serve.
+
+    Fields are given in order; a leading '-' makes a key descending.
+    """
+
+    def __init__(self, *fields, unique=False, serves=()):
+        self.keys = [
+            (field.lstrip('-'), DESCENDING if field.startswith('-') else ASCENDING)
+            for field in fields
+        ]
+        self.unique = unique
+        self.serves = list(serves)
+
+    @property
+    def name(self):
+        # pymongo's default naming, e.g. user_email_1_date_-1
+        return '_'.join(f'{field}_{direction}' for field, direction in self.keys)
+
+    def model(self):
+        return IndexModel(self.keys, name=self.name, unique=self.unique, background=True)
+
+
+# Indexes for collections that have no Django model
+COLLECTION_INDEXES = {
+    'activity_rollups': [
+        MongoIndex('scope', 'key', 'period', 'start', unique=True, serves=[
+            ServedQuery('rollup bucket upsert', {
+                'scope': 'user', 'key': 'sample@octofit.app', 'period': 'day', 'start': datetime(2024, 1, 1),
+            }),
+            ServedQuery('totals of a user over a window', {
+                'scope': 'user', 'key': 'sample@octofit.app', 'period': 'day',
+                'start': {'$gte': datetime(2024, 1, 1)},
+            }),
+        ]),
+        MongoIndex('scope', 'period', 'start', '-points', '_id', serves=[
+            ServedQuery('windowed leaderboard page', {
+                'scope': 'team', 'period': 'week', 'start': datetime(2024, 1, 1),
+            }, [('points', -1), ('_id', 1)]),
+            ServedQuery('entries ranked above a windowed entry', {
+                'scope': 'team', 'period': 'week', 'start': datetime(2024, 1, 1), 'points': {'$gt': 10},
+            }),
+        ]),
+    ],
+}
+
+
+def declared_indexes():
+    """
+    Map each collection name to its declared MongoIndex list.
+    """
+    declared = {}
+    for model in apps.get_app_config('fitness').get_models():
+        indexes = getattr(model, 'mongo_indexes', None)
+        if indexes:
+            declared[model._meta.db_table] = list(indexes)
+    for collection, indexes in COLLECTION_INDEXES.items():
+        declared.setdefault(collection, []).extend(indexes)
+    return declared
+
+
+def _key_spec(keys):
+    return tuple(
+        (field, direction if isinstance(direction, str) else int(direction))
+        for field, direction in keys
+    )
+
+
+def sync(db=None, drop=True, dry_run=False):
+    """
+    Create missing declared indexes and drop stale ones.
+
+    Existing indexes are matched on their key specification, not their name,
+    so equivalent indexes created elsewhere (for example by djongo for unique
+    fields) are kept. The _id index is never dropped. Returns a list of
+    (collection, action, index name) tuples.
+    """
+    if db is None:
+        db = get_db()
+    actions = []
+    for collection, indexes in declared_indexes().items():
+        existing = {
+            _key_spec(info['key']): name
+            for name, info in db[collection].index_information().items()
+        }
+        wanted = {_key_spec(index.keys): index for index in indexes}
+
+        missing = [index for key, index in wanted.items() if key not in existing]
+        if missing:
+            actions.extend((collection, 'create', index.name) for index in missing)
+            if not dry_run:
+                db[collection].create_indexes([index.model() for index in missing])
+
+        if drop:
+            for key, name in existing.items():
+                if key in wanted or key == (('_id', 1),):
+                    continue
+                actions.append((collection, 'drop', name))
+                if not dry_run:
+                    db[collection].drop_index(name)
+    return actions
+
+
+def plan_stages(plan):
+    """
+    Yield every (stage, index name) pair in an explain() plan tree.
+    """
+    yield plan.get('stage'), plan.get('indexName')
+    for child in ('inputStage', 'outerStage', 'innerStage'):
+        if child in plan:
+            yield from plan_stages(plan[child])
+    for stage in plan.get('inputStages', ()):
+        yield from plan_stages(stage)
+
+
+def winning_plan(collection, query):
+    """
+    Explain a ServedQuery and return its winning plan's (stage, index) pairs.
+    """
+    cursor = collection.find(query.filter)
+    if query.sort:
+        cursor = cursor.sort(query.sort)
+    explain = cursor.explain()
+    plan = explain.get('queryPlanner', explain)['winningPlan']
+    # MongoDB 7+ nests the classic plan tree under queryPlan
+    return list(plan_stages(plan.get('queryPlan', plan)))
@@ -0,0 +1,106 @@
+from itertools import islice
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+from .effects import activities_changed, document_snapshot
+from .mongo import get_db
+from .serializers import ActivitySerializer
+
+BULK_CHUNK_SIZE = 500
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    offset = 0
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield offset, chunk
+        offset += len(chunk)
+
+
+def _validate(chunk, offset, errors):
+    """
+    Validate a chunk with ActivitySerializer(many=True).
+
+    Returns (row index, validated data) pairs for the valid rows and appends
+    an error entry for every invalid one.
+    """
+    serializer = ActivitySerializer(data=chunk, many=True)
+    if serializer.is_valid():
+        return list(enumerate(serializer.validated_data, start=offset))
+
+    positions = []
+    for position, row_errors in enumerate(serializer.errors):
+        if row_errors:
+            errors.append({'index': offset + position, 'errors': row_errors})
+        else:
+            positions.append(position)
+    if not positions:
+        return []
+    # A ListSerializer only exposes validated data when every row is valid
+    serializer = ActivitySerializer(data=[chunk[p] for p in positions], many=True)
+    serializer.is_valid(raise_exception=True)
+    return [(offset + p, data) for p, data in zip(positions, serializer.validated_data)]
+
+
+def insert_documents(documents, db):
+    """
+    Insert activity documents with one unordered insert_many.
+
+    Returns the snapshots of the inserted documents, for activities_changed,
+    and a {position: error message} dict for the ones that failed.
+    """
+    failed = {}
+    try:
+        db.activities.insert_many(documents, ordered=False)
+    except BulkWriteError as exc:
+        for write_error in exc.details['writeErrors']:
+            failed[write_error['index']] = write_error['errmsg']
+    inserted = [
+        document_snapshot(document)
+        for position, document in enumerate(documents)
+        if position not in failed
+    ]
+    return inserted, failed
+
+
+def ingest_activities(rows, chunk_size=BULK_CHUNK_SIZE, db=None):
+    """
+    Validate and insert an iterable of activity rows in chunks.
+
+    Each chunk is written with one unordered insert_many. Point and leaderboard
+    updates for everything inserted are applied once, after the last chunk,
+    or when the input fails part way through (a stream that cannot be
+    decoded, say), so the chunks already written are never left out.
+    Returns the number of inserted rows and a list of per-row errors, each
+    carrying the row's position in the input.
+    """
+    if db is None:
+        db = get_db()
+    inserted = []
+    errors = []
+    try:
+        for offset, chunk in _chunks(rows, chunk_size):
+            valid = _validate(chunk, offset, errors)
+            if not valid:
+                continue
+            documents = []
+            for _, data in valid:
+                document = dict(data, _id=ObjectId())
+                document.setdefault('notes', '')
+                documents.append(document)
+
+            added, failed = insert_documents(documents, db)
+            inserted.extend(added)
+            for position, message in failed.items():
+                errors.append({
+                    'index': valid[position][0],
+                    'errors': {'non_field_errors': [message]},
+                })
+    finally:
+        activities_changed(added=inserted, db=db)
+    errors.sort(key=lambda error: error['index'])
+    return len(inserted), errors
@@ -0,0 +1,436 @@
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+
+from bson import ObjectId
+from django.utils import timezone
+from pymongo import DESCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from . import rollups
+from .mongo import get_db
+
+USER = 'user'
+TEAM = 'team'
+WINDOWS = {
+    'day': rollups.DAY,
+    'week': rollups.WEEK,
+    'month': rollups.MONTH,
+}
+ALL_TIME = 'all'
+LOCKS_COLLECTION = 'leaderboard_locks'
+# A lock whose holder died is taken over after this long
+LOCK_TIMEOUT = timedelta(seconds=30)
+
+_local_locks = {USER: threading.Lock(), TEAM: threading.Lock()}
+
+
+@contextmanager
+def board_lock(db, entry_type):
+    """
+    Hold the rank lock of one board, across threads and processes.
+
+    Moving an entry is several writes (its points, the shifted neighbours,
+    its own rank derived from a neighbour), so two moves on the same board
+    must not interleave or one reads the other's half-applied shift. The
+    lock is a document in LOCKS_COLLECTION taken with an atomic upsert;
+    threads of one process queue on a local lock first rather than spin.
+    """
+    token = ObjectId()
+    with _local_locks[entry_type]:
+        while True:
+            now = timezone.now()
+            try:
+                db[LOCKS_COLLECTION].find_one_and_update(
+                    {'_id': entry_type, '$or': [{'holder': None}, {'expires': {'$lt': now}}]},
+                    {'$set': {'holder': token, 'expires': now + LOCK_TIMEOUT}},
+                    upsert=True,
+                )
+                break
+            except DuplicateKeyError:
+                # Held by another process
+                time.sleep(0.005)
+        try:
+            yield
+        finally:
+            db[LOCKS_COLLECTION].update_one({'_id': entry_type, 'holder': token}, {'$set': {'holder': None}})
+
+
+def apply_point_deltas(deltas, db=None):
+    """
+    Add per-user point deltas to users, their teams and both leaderboards.
+
+    ``deltas`` maps a user email to a change in points. Deltas are merged per
+    team first, so each team document and team entry is written once.
+    """
+    if db is None:
+        db = get_db()
+    team_deltas = defaultdict(int)
+    for email, delta in deltas.items():
+        if not delta:
+            continue
+        user = db.users.find_one_and_update(
+            {'email': email},
+            {'$inc': {'total_points': delta}},
+            projection={'name': 1, 'team': 1, 'total_points': 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if user is None:
+            # Activities are not tied to users by a foreign key
+            continue
+        _move_entry(db, USER, {'email': email}, user['total_points'], {
+            'name': user['name'],
+            'email': email,
+            'team': user['team'],
+        })
+        team_deltas[user['team']] += delta
+
+    for name, delta in team_deltas.items():
+        if not delta:
+            continue
+        team = db.teams.find_one_and_update(
+            {'name': name},
+            {'$inc': {'total_points': delta}},
+            projection={'total_points': 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if team is None:
+            continue
+        _move_entry(db, TEAM, {'name': name}, team['total_points'], {
+            'name': name,
+            'team': name,
+        })
+
+
+def apply_user_changes(added=(), removed=(), db=None):
+    """
+    Apply users created, edited or deleted to their teams' member_count and
+    total_points and to both leaderboards.
+
+    Users are mappings with ``name``, ``email``, ``team`` and
+    ``total_points``; an edit is the old version removed and the new version
+    added. Each team's counters change with one atomic $inc, so concurrent
+    writes to the same team never lose an update.
+    """
+    if db is None:
+        db = get_db()
+    team_deltas = defaultdict(lambda: {'member_count': 0, 'total_points': 0})
+    for sign, users in ((1, added), (-1, removed)):
+        for user in users:
+            team_deltas[user['team']]['member_count'] += sign
+            team_deltas[user['team']]['total_points'] += sign * user['total_points']
+
+    previous = {user['email']: user for user in removed}
+    for user in added:
+        if previous.pop(user['email'], None) == user:
+            continue
+        key = {'email': user['email']}
+        db.leaderboard.update_one(
+            dict(key, type=USER),
+            {'$set': {'name': user['name'], 'team': user['team']}},
+        )
+        _move_entry(db, USER, key, user['total_points'], {
+            'name': user['name'],
+            'email': user['email'],
+            'team': user['team'],
+        })
+    for email in previous:
+        _remove_entry(db, USER, {'email': email})
+
+    for name, delta in team_deltas.items():
+        delta = {field: value for field, value in delta.items() if value}
+        if not delta:
+            continue
+        team = db.teams.find_one_and_update(
+            {'name': name},
+            {'$inc': delta},
+            projection={'total_points': 1},
+            return_document=ReturnDocument.AFTER,
+        )
+        if team is None or 'total_points' not in delta:
+            continue
+        _move_entry(db, TEAM, {'name': name}, team['total_points'], {
+            'name': name,
+            'team': name,
+        })
+
+
+def _move_entry(db, entry_type, key, points, defaults):
+    """
+    Set a leaderboard entry's points and shift only the ranks that change.
+
+    Ranks are competition ranks (1 + number of entries with more points), so
+    moving an entry from ``old`` to ``new`` points only changes the rank of
+    entries whose points lie between the two values. Moves on one board are
+    serialized by board_lock.
+    """
+    with board_lock(db, entry_type):
+        _move_locked(db, entry_type, key, points, defaults)
+
+
+def _move_locked(db, entry_type, key, points, defaults):
+    now = timezone.now()
+    entry = db.leaderboard.find_one_and_update(
+        dict(key, type=entry_type),
+        {'$set': {'points': points, 'updated_at': now}},
+        projection={'points': 1},
+        return_document=ReturnDocument.BEFORE,
+    )
+    if entry is None:
+        entry_id = db.leaderboard.insert_one(
+            dict(defaults, type=entry_type, points=points, rank=0, updated_at=now)
+        ).inserted_id
+        shifted, step = {'$lt': points}, 1
+    else:
+        entry_id, old = entry['_id'], entry['points']
+        if old == points:
+            return
+        if points > old:
+            shifted, step = {'$gte': old, '$lt': points}, 1
+        else:
+            shifted, step = {'$gte': points, '$lt': old}, -1
+
+    db.leaderboard.update_many(
+        {'type': entry_type, 'points': shifted, '_id': {'$ne': entry_id}},
+        {'$inc': {'rank': step}, '$set': {'updated_at': now}},
+    )
+    db.leaderboard.update_one(
+        {'_id': entry_id},
+        {'$set': {'rank': _rank_of(db, entry_type, points, entry_id)}},
+    )
+
+
+def _remove_entry(db, entry_type, key):
+    """
+    Delete a leaderboard entry and move up the entries ranked below it.
+    """
+    with board_lock(db, entry_type):
+        entry = db.leaderboard.find_one_and_delete(dict(key, type=entry_type), projection={'points': 1})
+        if entry is not None:
+            db.leaderboard.update_many(
+                {'type': entry_type, 'points': {'$lt': entry['points']}},
+                {'$inc': {'rank': -1}, '$set': {'updated_at': timezone.now()}},
+            )
+
+
+def _rank_of(db, entry_type, points, entry_id):
+    """
+    Derive an entry's rank from its neighbours on the (type, points) index.
+    """
+    others = {'type': entry_type, '_id': {'$ne': entry_id}}
+    tie = db.leaderboard.find_one(dict(others, points=points), {'rank': 1})
+    if tie is not None:
+        return tie['rank']
+    below = db.leaderboard.find_one(
+        dict(others, points={'$lt': points}),
+        {'rank': 1},
+        sort=[('points', DESCENDING)],
+    )
+    if below is not None:
+        return below['rank'] - 1
+    # Last place: every other entry has more points
+    return db.leaderboard.count_documents({'type': entry_type})
+
+
+def rebuild(db=None):
+    """
+    Recompute both leaderboards from scratch from user and team totals.
+
+    This is the full recompute used by populate_db and to repair drift; normal
+    writes go through apply_point_deltas.
+    """
+    if db is None:
+        db = get_db()
+    # Totals are read under the locks too, so no move lands in between
+    with board_lock(db, USER), board_lock(db, TEAM):
+        return _rebuild_locked(db)
+
+
+def _rebuild_locked(db):
+    now = timezone.now()
+    entries = []
+    users = db.users.find({}, {'name': 1, 'email': 1, 'team': 1, 'total_points': 1})
+    for user, rank in _ranked(users.sort('total_points', DESCENDING)):
+        entries.append({
+            'type': USER,
+            'name': user['name'],
+            'email': user['email'],
+            'team': user['team'],
+            'points': user['total_points'],
+            'rank': rank,
+            'updated_at': now,
+        })
+    teams = db.teams.find({}, {'name': 1, 'total_points': 1})
+    for team, rank in _ranked(teams.sort('total_points', DESCENDING)):
+        entries.append({
+            'type': TEAM,
+            'name': team['name'],
+            'email': None,
+            'team': team['name'],
+            'points': team['total_points'],
+            'rank': rank,
+            'updated_at': now,
+        })
+
+    db.leaderboard.delete_many({})
+    if entries:
+        db.leaderboard.insert_many(entries)
+    return len(entries)
+
+
+def rank_drift(db=None):
+    """
+    Yield (type, name, stored, expected) for every leaderboard entry whose
+    points or rank disagree with the user and team totals, including
+    entries that are missing (stored None) or have no user or team left
+    (expected None). Points and ranks are compared as (points, rank) pairs.
+    """
+    if db is None:
+        db = get_db()
+    sources = (
+        (USER, 'email', db.users.find({}, {'email': 1, 'total_points': 1})),
+        (TEAM, 'name', db.teams.find({}, {'name': 1, 'total_points': 1})),
+    )
+    for entry_type, field, documents in sources:
+        expected = {
+            document[field]: (document['total_points'], rank)
+            for document, rank in _ranked(documents.sort('total_points', DESCENDING))
+        }
+        stored = {
+            entry[field]: (entry['points'], entry['rank'])
+            for entry in db.leaderboard.find({'type': entry_type}, {field: 1, 'points': 1, 'rank': 1})
+        }
+        for name in sorted(expected.keys() | stored.keys()):
+            if stored.get(name) != expected.get(name):
+                yield entry_type, name, stored.get(name), expected.get(name)
+
+
+def team_drift(db=None):
+    """
+    Yield (name, stored, actual) for each team whose member_count or
+    total_points disagrees with its members.
+
+    One $group over users computes every team's true counters, so the check
+    reads each user once however many teams there are.
+    """
+    if db is None:
+        db = get_db()
+    actual = {
+        row['_id']: {'member_count': row['member_count'], 'total_points': row['total_points']}
+        for row in db.users.aggregate([
+            {'$group': {
+                '_id': '$team',
+                'member_count': {'$sum': 1},
+                'total_points': {'$sum': '$total_points'},
+            }},
+        ])
+    }
+    empty = {'member_count': 0, 'total_points': 0}
+    for team in db.teams.find({}, {'name': 1, 'member_count': 1, 'total_points': 1}):
+        expected = actual.get(team['name'], empty)
+        stored = {field: team.get(field, 0) for field in expected}
+        if stored != expected:
+            yield team['name'], stored, expected
+
+
+def repair_teams(drift, db=None):
+    """
+    Overwrite the counters of drifted teams, as found by team_drift, and move
+    their leaderboard entries. Run it while user writes are quiet: a write
+    between the check and the repair is overwritten.
+    """
+    if db is None:
+        db = get_db()
+    repaired = 0
+    for name, stored, expected in drift:
+        db.teams.update_one({'name': name}, {'$set': expected})
+        _move_entry(db, TEAM, {'name': name}, expected['total_points'], {
+            'name': name,
+            'team': name,
+        })
+        repaired += 1
+    return repaired
+
+
+def _ranked(documents):
+    """
+    Yield (document, rank) pairs from documents sorted by total_points desc.
+    """
+    rank = previous = None
+    for position, document in enumerate(documents, start=1):
+        if document['total_points'] != previous:
+            rank, previous = position, document['total_points']
+        yield document, rank
+
+
+def window_start(window, now=None):
+    """
+    The start of the current day, week or month window.
+
+    Windows follow the clock: a new period starts a new set of rollup
+    buckets, so boards roll over without any rebuild.
+    """
+    return rollups.period_start(now or timezone.now(), WINDOWS[window])
+
+
+def window_query(window, entry_type, now=None):
+    """
+    The activity_rollups filter for one type's entries in the current window.
+    """
+    return {
+        'scope': entry_type,
+        'period': WINDOWS[window],
+        'start': window_start(window, now),
+    }
+
+
+def window_entries(documents, query, first_page, db=None):
+    """
+    Turn a page of rollup buckets, sorted by points desc and _id, into
+    leaderboard entries with competition ranks.
+
+    Ranks within the page follow from the rows above it, so a page costs at
+    most two counts on the (scope, period, start, points) index; the first
+    page costs none.
+    """
+    if db is None:
+        db = get_db()
+    if not documents:
+        return []
+    collection = db[rollups.COLLECTION]
+    first = documents[0]
+    if first_page:
+        before = above = 0
+    else:
+        before = collection.count_documents(dict(query, **{'$or': [
+            {'points': {'$gt': first['points']}},
+            {'points': first['points'], '_id': {'$lt': first['_id']}},
+        ]}))
+        above = collection.count_documents(dict(query, points={'$gt': first['points']}))
+
+    users = {}
+    if query['scope'] == USER:
+        emails = [document['key'] for document in documents]
+        for user in db.users.find({'email': {'$in': emails}}, {'email': 1, 'name': 1, 'team': 1}):
+            users[user['email']] = user
+
+    entries = []
+    rank = above + 1
+    for position, document in enumerate(documents):
+        if position and document['points'] != documents[position - 1]['points']:
+            rank = before + position + 1
+        key = document['key']
+        user = users.get(key, {})
+        entries.append({
+            '_id': document['_id'],
+            'type': query['scope'],
+            'name': user.get('name', key) if query['scope'] == USER else key,
+            'email': key if query['scope'] == USER else None,
+            'team': user.get('team', '') if query['scope'] == USER else key,
+            'points': document['points'],
+            'rank': rank,
+            'updated_at': document.get('updated_at'),
+        })
+    return entries
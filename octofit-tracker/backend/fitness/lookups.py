@@ -0,0 +1,21 @@
+from bson import ObjectId
+from bson.errors import InvalidId
+from rest_framework.exceptions import NotFound
+
+
+class ObjectIdLookupMixin:
+    """
+    Converts the detail route's id to an ObjectId before the lookup.
+
+    djongo passes an ObjectIdField lookup value through unchanged, so a hex
+    string from the URL would match no document. An id that is not a valid
+    ObjectId is a 404.
+    """
+
+    def get_object(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            self.kwargs[lookup_url_kwarg] = ObjectId(self.kwargs[lookup_url_kwarg])
+        except (InvalidId, TypeError):
+            raise NotFound()
+        return super().get_object()
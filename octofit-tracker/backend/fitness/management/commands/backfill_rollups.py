@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from fitness import rollups
+from fitness.cache import invalidate_all
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-user and per-team day, week and month activity rollups from the activities collection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=rollups.BACKFILL_CHUNK_SIZE,
+                            help='Activities read per round trip')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        started = time.perf_counter()
+
+        def progress(count):
+            elapsed = time.perf_counter() - started
+            self.stdout.write(f'  {count} activities ({count / elapsed:,.0f}/s)')
+
+        self.stdout.write('Backfilling activity rollups...')
+        count = rollups.backfill(options['chunk_size'], progress=progress)
+        invalidate_all()
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {count} activities'))
@@ -0,0 +1,118 @@
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import setup_test_environment, teardown_test_environment
+from fitness.benchmarks import DEFAULT_SIZES, SUITES, compare
+from fitness.mongo import get_db
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Run performance benchmarks against a scratch database and print the timings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('suites', nargs='*', help=f'Suites to run (default: all of {", ".join(SUITES)})')
+        parser.add_argument('--sizes', nargs='+', type=int, default=list(DEFAULT_SIZES),
+                            help='Dataset sizes to run each suite at')
+        parser.add_argument('--in-memory', action='store_true',
+                            help='Use mongomock instead of a scratch database on the local mongod '
+                                 '(suites that go through the ORM are skipped)')
+        parser.add_argument('--output', help='Write the results to this JSON file')
+        parser.add_argument('--compare', metavar='BASELINE',
+                            help='Compare the results with a JSON file written by --output')
+        parser.add_argument('--threshold', type=float, default=0.1,
+                            help='Relative change reported as a regression (default: 0.1)')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='Exit with an error when --compare finds a regression')
+
+    def handle(self, *args, **options):
+        names = options['suites'] or list(SUITES)
+        unknown = [name for name in names if name not in SUITES]
+        if unknown:
+            raise CommandError(f'Unknown suite(s): {", ".join(unknown)}')
+
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as f:
+                baseline = json.load(f)['results']
+
+        if options['in_memory']:
+            try:
+                import mongomock
+            except ImportError:
+                raise CommandError('--in-memory needs the mongomock package')
+            skipped = [name for name in names if SUITES[name].orm]
+            if skipped:
+                self.stdout.write(self.style.WARNING(
+                    f'Skipping {", ".join(skipped)}: needs a running mongod'
+                ))
+            names = [name for name in names if not SUITES[name].orm]
+            results = self.run_suites(names, options['sizes'], mongomock.MongoClient().benchmark)
+        else:
+            results = self.run_on_scratch_database(names, options['sizes'])
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump({
+                    'commit': git_commit(),
+                    'python': platform.python_version(),
+                    'created_at': datetime.now(dt_timezone.utc).isoformat(),
+                    'database': 'mongomock' if options['in_memory'] else 'mongod',
+                    'sizes': options['sizes'],
+                    'results': results,
+                }, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(f'Wrote {len(results)} results to {options["output"]}'))
+
+        if baseline is not None:
+            regressions = self.report_comparison(baseline, results, options['threshold'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'{regressions} metric(s) regressed')
+
+    def run_on_scratch_database(self, names, sizes):
+        # Benchmarks clear collections, so they get their own test database
+        connection = connections['default']
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            return self.run_suites(names, sizes, get_db())
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def run_suites(self, names, sizes, db):
+        results = []
+        for name in names:
+            self.stdout.write(self.style.SUCCESS(f'Running {name} benchmarks...'))
+            for result in SUITES[name](sizes, db):
+                details = ', '.join(
+                    f'{key}={value:.4f}' if isinstance(value, float) else f'{key}={value}'
+                    for key, value in result.items() if key != 'suite'
+                )
+                self.stdout.write(f'  {details}')
+                results.append(result)
+        return results
+
+    def report_comparison(self, baseline, results, threshold):
+        regressions = 0
+        self.stdout.write('Compared with baseline:')
+        for (suite, case, rows), metric, old, new, regressed in compare(baseline, results, threshold):
+            line = f'  {suite}/{case}/{rows} {metric}: {old:.4f} -> {new:.4f} ({new / old:.2f}x)'
+            if regressed:
+                regressions += 1
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
+        return regressions
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from fitness import leaderboard
+from fitness.cache import invalidate
+
+
+class Command(BaseCommand):
+    help = 'Check every leaderboard entry against the user and team totals, optionally rebuilding both boards'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true',
+                            help='Rebuild both leaderboards from the user and team totals')
+
+    def handle(self, *args, **options):
+        drift = list(leaderboard.rank_drift())
+        for entry_type, name, stored, expected in drift:
+            self.stdout.write(f'  {entry_type} {name}: (points, rank) {stored} -> {expected}')
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('All leaderboard entries match the totals'))
+            return
+        if not options['repair']:
+            raise CommandError(f'{len(drift)} leaderboard entry(ies) out of sync; run with --repair to rebuild')
+        entries = leaderboard.rebuild()
+        invalidate('leaderboard')
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {entries} leaderboard entries'))
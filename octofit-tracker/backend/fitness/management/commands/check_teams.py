@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from fitness import leaderboard
+from fitness.cache import invalidate
+
+
+class Command(BaseCommand):
+    help = "Check every team's member_count and total_points against its members, optionally repairing them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true',
+                            help='Overwrite drifted counters and move their team leaderboard entries')
+
+    def handle(self, *args, **options):
+        drift = list(leaderboard.team_drift())
+        for name, stored, actual in drift:
+            self.stdout.write(
+                f'  {name}: member_count {stored["member_count"]} -> {actual["member_count"]}, '
+                f'total_points {stored["total_points"]} -> {actual["total_points"]}'
+            )
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('All team counters match their members'))
+            return
+        if not options['repair']:
+            raise CommandError(f'{len(drift)} team(s) out of sync; run with --repair to fix them')
+        repaired = leaderboard.repair_teams(drift)
+        invalidate('teams', 'leaderboard')
+        self.stdout.write(self.style.SUCCESS(f'Repaired {repaired} team(s)'))
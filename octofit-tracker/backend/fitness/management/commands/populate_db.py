@@ -1,14 +1,42 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from fitness import indexes, leaderboard, rollups, synthetic
+from fitness.cache import invalidate_all
 from fitness.models import User, Team, Activity, Leaderboard, Workout
-from datetime import datetime, timedelta
+from datetime import timedelta
 import random
+import time
 
 
 class Command(BaseCommand):
     help = 'Populate the octofit_db database with test data'
 
-    def handle(self, *args, **kwargs):
-        self.stdout.write(self.style.SUCCESS('Starting database population...'))
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int,
+                            help='Generate this many synthetic users instead of the 12 heroes')
+        parser.add_argument('--teams', type=int, default=10,
+                            help='Number of synthetic teams (with --users)')
+        parser.add_argument('--activities-per-user', type=int, default=20,
+                            help='Activities per synthetic user (with --users)')
+        parser.add_argument('--days', type=int, default=30,
+                            help='Spread activity dates over this many days')
+        parser.add_argument('--seed', type=int,
+                            help='Random seed; the same seed always produces the same data')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processes to generate synthetic users with')
+        parser.add_argument('--chunk-size', type=int, default=synthetic.INSERT_CHUNK_SIZE,
+                            help='Documents per insert_many call')
+
+    def handle(self, *args, **options):
+        for name in ('teams', 'activities_per_user', 'days', 'workers', 'chunk_size'):
+            if options[name] < 1:
+                raise CommandError(f'--{name.replace("_", "-")} must be at least 1')
+        if options['users'] is not None and options['users'] < 1:
+            raise CommandError('--users must be at least 1')
+        seed = options['seed']
+        if seed is None:
+            seed = random.randrange(2 ** 32)
+
+        self.stdout.write(self.style.SUCCESS(f'Starting database population (seed {seed})...'))
 
         # Clear existing data
         self.stdout.write('Clearing existing data...')
@@ -18,62 +46,12 @@ class Command(BaseCommand):
         Leaderboard.objects.all().delete()
         Workout.objects.all().delete()
 
-        # Create Teams
-        self.stdout.write('Creating teams...')
-        team_marvel = Team.objects.create(
-            name='Team Marvel',
-            description='Earth\'s Mightiest Heroes unite for fitness!',
-            total_points=0,
-            member_count=0
-        )
-        
-        team_dc = Team.objects.create(
-            name='Team DC',
-            description='Justice League members training for peak performance!',
-            total_points=0,
-            member_count=0
-        )
-
-        # Create Users (Superheroes)
-        self.stdout.write('Creating users...')
-        marvel_heroes = [
-            {'name': 'Iron Man', 'email': 'tony.stark@avengers.com', 'team': 'Team Marvel'},
-            {'name': 'Captain America', 'email': 'steve.rogers@avengers.com', 'team': 'Team Marvel'},
-            {'name': 'Thor', 'email': 'thor.odinson@asgard.com', 'team': 'Team Marvel'},
-            {'name': 'Black Widow', 'email': 'natasha.romanoff@shield.com', 'team': 'Team Marvel'},
-            {'name': 'Hulk', 'email': 'bruce.banner@avengers.com', 'team': 'Team Marvel'},
-            {'name': 'Spider-Man', 'email': 'peter.parker@marvel.com', 'team': 'Team Marvel'},
-        ]
-
-        dc_heroes = [
-            {'name': 'Superman', 'email': 'clark.kent@dailyplanet.com', 'team': 'Team DC'},
-            {'name': 'Batman', 'email': 'bruce.wayne@wayneenterprises.com', 'team': 'Team DC'},
-            {'name': 'Wonder Woman', 'email': 'diana.prince@themyscira.com', 'team': 'Team DC'},
-            {'name': 'Flash', 'email': 'barry.allen@starlabs.com', 'team': 'Team DC'},
-            {'name': 'Aquaman', 'email': 'arthur.curry@atlantis.com', 'team': 'Team DC'},
-            {'name': 'Green Lantern', 'email': 'hal.jordan@oa.com', 'team': 'Team DC'},
-        ]
-
-        all_heroes = marvel_heroes + dc_heroes
-        users = []
-        
-        for hero in all_heroes:
-            user = User.objects.create(
-                name=hero['name'],
-                email=hero['email'],
-                team=hero['team'],
-                total_points=random.randint(500, 2000)
-            )
-            users.append(user)
-
-        # Update team member counts and points
-        team_marvel.member_count = len(marvel_heroes)
-        team_marvel.total_points = sum(u.total_points for u in users if u.team == 'Team Marvel')
-        team_marvel.save()
-
-        team_dc.member_count = len(dc_heroes)
-        team_dc.total_points = sum(u.total_points for u in users if u.team == 'Team DC')
-        team_dc.save()
+        if options['users'] is None:
+            rng = random.Random(seed)
+            self.create_heroes(rng)
+        else:
+            rng = None
+            self.create_synthetic(seed, options)
 
         # Create Workouts
         self.stdout.write('Creating workouts...')
@@ -157,22 +135,112 @@ class Command(BaseCommand):
             workout = Workout.objects.create(**workout_data)
             workouts.append(workout)
 
+        if rng is not None:
+            self.create_hero_activities(rng, options['days'])
+
+        # Create Leaderboard entries
+        self.stdout.write('Creating leaderboard...')
+        leaderboard.rebuild()
+
+        self.stdout.write('Building activity rollups...')
+        rollups.backfill(options['chunk_size'])
+
+        # Create the indexes declared on the models
+        self.stdout.write('Syncing indexes...')
+        try:
+            created = [name for _, action, name in indexes.sync() if action == 'create']
+            self.stdout.write(self.style.SUCCESS(f'Created {len(created)} indexes'))
+        except Exception as e:
+            self.stdout.write(self.style.WARNING(f'Could not create indexes: {e}'))
+
+        invalidate_all()
+
+        self.stdout.write(self.style.SUCCESS('Successfully populated database!'))
+        self.stdout.write(self.style.SUCCESS(f'  - Created {Team.objects.count()} teams'))
+        self.stdout.write(self.style.SUCCESS(f'  - Created {User.objects.count()} users'))
+        self.stdout.write(self.style.SUCCESS(f'  - Created {len(workouts)} workouts'))
+        self.stdout.write(self.style.SUCCESS(f'  - Created {Activity.objects.count()} activities'))
+        self.stdout.write(self.style.SUCCESS(f'  - Created {Leaderboard.objects.count()} leaderboard entries'))
+
+    def create_heroes(self, rng):
+        # Create Teams
+        self.stdout.write('Creating teams...')
+        team_marvel = Team.objects.create(
+            name='Team Marvel',
+            description='Earth\'s Mightiest Heroes unite for fitness!',
+            total_points=0,
+            member_count=0
+        )
+        
+        team_dc = Team.objects.create(
+            name='Team DC',
+            description='Justice League members training for peak performance!',
+            total_points=0,
+            member_count=0
+        )
+
+        # Create Users (Superheroes)
+        self.stdout.write('Creating users...')
+        marvel_heroes = [
+            {'name': 'Iron Man', 'email': 'tony.stark@avengers.com', 'team': 'Team Marvel'},
+            {'name': 'Captain America', 'email': 'steve.rogers@avengers.com', 'team': 'Team Marvel'},
+            {'name': 'Thor', 'email': 'thor.odinson@asgard.com', 'team': 'Team Marvel'},
+            {'name': 'Black Widow', 'email': 'natasha.romanoff@shield.com', 'team': 'Team Marvel'},
+            {'name': 'Hulk', 'email': 'bruce.banner@avengers.com', 'team': 'Team Marvel'},
+            {'name': 'Spider-Man', 'email': 'peter.parker@marvel.com', 'team': 'Team Marvel'},
+        ]
+
+        dc_heroes = [
+            {'name': 'Superman', 'email': 'clark.kent@dailyplanet.com', 'team': 'Team DC'},
+            {'name': 'Batman', 'email': 'bruce.wayne@wayneenterprises.com', 'team': 'Team DC'},
+            {'name': 'Wonder Woman', 'email': 'diana.prince@themyscira.com', 'team': 'Team DC'},
+            {'name': 'Flash', 'email': 'barry.allen@starlabs.com', 'team': 'Team DC'},
+            {'name': 'Aquaman', 'email': 'arthur.curry@atlantis.com', 'team': 'Team DC'},
+            {'name': 'Green Lantern', 'email': 'hal.jordan@oa.com', 'team': 'Team DC'},
+        ]
+
+        all_heroes = marvel_heroes + dc_heroes
+        users = []
+        
+        for hero in all_heroes:
+            user = User.objects.create(
+                name=hero['name'],
+                email=hero['email'],
+                team=hero['team'],
+                total_points=rng.randint(500, 2000)
+            )
+            users.append(user)
+
+        # Update team member counts and points
+        team_marvel.member_count = len(marvel_heroes)
+        team_marvel.total_points = sum(u.total_points for u in users if u.team == 'Team Marvel')
+        team_marvel.save()
+
+        team_dc.member_count = len(dc_heroes)
+        team_dc.total_points = sum(u.total_points for u in users if u.team == 'Team DC')
+        team_dc.save()
+
+    def create_hero_activities(self, rng, days):
         # Create Activities
         self.stdout.write('Creating activities...')
         activity_types = ['Running', 'Swimming', 'Cycling', 'Weight Training', 'Yoga', 'Boxing', 'HIIT']
         
+        # Dates end at the same midnight as the synthetic path's, so a seed
+        # gives the same activities all day
+        end = synthetic.end_of_window()
+        users = User.objects.all()
         for user in users:
             # Create 5-10 activities per user
-            num_activities = random.randint(5, 10)
+            num_activities = rng.randint(5, 10)
             for i in range(num_activities):
-                activity_date = datetime.now() - timedelta(days=random.randint(0, 30))
-                duration = random.randint(20, 90)
-                calories = duration * random.randint(8, 15)
+                activity_date = end - timedelta(seconds=rng.randrange(days * 86400))
+                duration = rng.randint(20, 90)
+                calories = duration * rng.randint(8, 15)
                 points = calories // 10
                 
                 Activity.objects.create(
                     user_email=user.email,
-                    activity_type=random.choice(activity_types),
+                    activity_type=rng.choice(activity_types),
                     duration=duration,
                     calories=calories,
                     points=points,
@@ -180,47 +248,27 @@ class Command(BaseCommand):
                     notes=f'Training session for {user.name}'
                 )
 
-        # Create Leaderboard entries
-        self.stdout.write('Creating leaderboard...')
-        
-        # User leaderboard
-        sorted_users = sorted(users, key=lambda x: x.total_points, reverse=True)
-        for rank, user in enumerate(sorted_users, start=1):
-            Leaderboard.objects.create(
-                type='user',
-                name=user.name,
-                email=user.email,
-                team=user.team,
-                points=user.total_points,
-                rank=rank
-            )
-
-        # Team leaderboard
-        teams = [team_marvel, team_dc]
-        sorted_teams = sorted(teams, key=lambda x: x.total_points, reverse=True)
-        for rank, team in enumerate(sorted_teams, start=1):
-            Leaderboard.objects.create(
-                type='team',
-                name=team.name,
-                team=team.name,
-                points=team.total_points,
-                rank=rank
+    def create_synthetic(self, seed, options):
+        users = options['users']
+        total = users * options['activities_per_user']
+        self.stdout.write(
+            f'Generating {users} users and {total} activities '
+            f'with {options["workers"]} worker(s)...'
+        )
+        started = time.perf_counter()
+        progress = synthetic.populate(
+            users,
+            options['teams'],
+            options['activities_per_user'],
+            options['days'],
+            seed,
+            workers=options['workers'],
+            chunk_size=options['chunk_size'],
+        )
+        for users_done, activities_done in progress:
+            elapsed = time.perf_counter() - started
+            rate = activities_done / elapsed if elapsed else 0
+            self.stdout.write(
+                f'  {users_done}/{users} users, {activities_done}/{total} activities '
+                f'({rate:,.0f} activities/s)'
             )
-
-        # Create unique index on email field
-        self.stdout.write('Creating unique index on user email...')
-        try:
-            from pymongo import MongoClient
-            client = MongoClient('localhost', 27017)
-            db = client.octofit_db
-            db.users.create_index('email', unique=True)
-            self.stdout.write(self.style.SUCCESS('Unique index created on email field'))
-        except Exception as e:
-            self.stdout.write(self.style.WARNING(f'Could not create index: {e}'))
-
-        self.stdout.write(self.style.SUCCESS(f'Successfully populated database!'))
-        self.stdout.write(self.style.SUCCESS(f'  - Created {len(teams)} teams'))
-        self.stdout.write(self.style.SUCCESS(f'  - Created {len(users)} users'))
-        self.stdout.write(self.style.SUCCESS(f'  - Created {len(workouts)} workouts'))
-        self.stdout.write(self.style.SUCCESS(f'  - Created {Activity.objects.count()} activities'))
-        self.stdout.write(self.style.SUCCESS(f'  - Created {Leaderboard.objects.count()} leaderboard entries'))
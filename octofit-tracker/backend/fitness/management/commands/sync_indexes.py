@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from fitness import indexes
+from fitness.mongo import get_db
+
+
+class Command(BaseCommand):
+    help = 'Create the MongoDB indexes declared on the models and report which queries they serve'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-drop', action='store_true',
+                            help='Keep indexes that are no longer declared')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Print the changes without applying them')
+        parser.add_argument('--no-explain', action='store_true',
+                            help='Skip explaining the queries each index serves')
+
+    def handle(self, *args, **options):
+        db = get_db()
+        actions = indexes.sync(db, drop=not options['no_drop'], dry_run=options['dry_run'])
+        prefix = 'Would ' if options['dry_run'] else ''
+        for collection, action, name in actions:
+            style = self.style.WARNING if action == 'drop' else self.style.SUCCESS
+            self.stdout.write(style(f'{prefix}{action} {collection}.{name}'))
+        if not actions:
+            self.stdout.write(self.style.SUCCESS('Indexes are up to date'))
+
+        if options['no_explain'] or options['dry_run']:
+            return
+
+        self.stdout.write('Query coverage:')
+        uncovered = 0
+        for collection, declared in indexes.declared_indexes().items():
+            for index in declared:
+                for query in index.serves:
+                    stages = indexes.winning_plan(db[collection], query)
+                    used = sorted({name for _, name in stages if name})
+                    if any(stage == 'COLLSCAN' for stage, _ in stages) or not used:
+                        uncovered += 1
+                        self.stdout.write(self.style.ERROR(
+                            f'  {collection}: {query.description} -> COLLSCAN (expected {index.name})'
+                        ))
+                    else:
+                        self.stdout.write(f'  {collection}: {query.description} -> {", ".join(used)}')
+        if uncovered:
+            self.stdout.write(self.style.WARNING(f'{uncovered} queries are not served by an index'))
@@ -0,0 +1,312 @@
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from pymongo import monitoring
+
+from .cache import cache_stats
+
+SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+BATCH_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 5000)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+_current = ContextVar('request_timing', default=None)
+
+
+class RequestTiming:
+    """
+    Where the time of one request went.
+
+    ``db_seconds`` is time on the wire and in MongoDB, as reported by pymongo.
+    ``orm_seconds`` is time in djongo's cursor.execute() that was not spent
+    in MongoDB, i.e. SQL parsing and translation.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_operations = 0
+        self.db_seconds = 0.0
+        self.queries = 0
+        self.orm_seconds = 0.0
+        self.view_started = None
+        self.view_seconds = 0.0
+        self.render_started = None
+        self.render_seconds = 0.0
+
+    @property
+    def serialize_seconds(self):
+        # View time not spent reaching the database: serializers, pagination
+        # and the rest of DRF's request handling
+        return max(self.view_seconds - self.db_seconds - self.orm_seconds, 0.0)
+
+    def total_seconds(self):
+        return time.perf_counter() - self.started
+
+
+def start_request():
+    timing = RequestTiming()
+    return timing, _current.set(timing)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+class CommandTimer(monitoring.CommandListener):
+    """
+    Adds every MongoDB command's duration to the current request's timing.
+
+    pymongo publishes events on the thread that issued the command, so the
+    context variable set by the middleware is visible here.
+    """
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        self._record(event)
+
+    def _record(self, event):
+        timing = _current.get()
+        if timing is not None:
+            timing.db_operations += 1
+            timing.db_seconds += event.duration_micros / 1e6
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """
+    Tracks connection pool checkout waits, connections in use and open
+    connections per server.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.in_use = Counter()
+        self.open = Counter()
+        self.failures = Counter()
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        self._waited(event)
+        with self._lock:
+            self.in_use[_address(event)] += 1
+
+    def connection_check_out_failed(self, event):
+        self._waited(event)
+        with self._lock:
+            self.failures[(_address(event), event.reason)] += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.in_use[_address(event)] -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open[_address(event)] += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open[_address(event)] -= 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def _waited(self, event):
+        started = getattr(self._local, 'started', None)
+        if started is not None:
+            POOL_CHECKOUT_SECONDS.observe((_address(event),), time.perf_counter() - started)
+            self._local.started = None
+
+    def exposition(self):
+        with self._lock:
+            in_use, open_, failures = dict(self.in_use), dict(self.open), dict(self.failures)
+        lines = [
+            '# HELP octofit_mongo_pool_in_use Connections checked out of the pool.',
+            '# TYPE octofit_mongo_pool_in_use gauge',
+        ]
+        lines.extend(f'octofit_mongo_pool_in_use{{address="{a}"}} {n}' for a, n in sorted(in_use.items()))
+        lines.append('# HELP octofit_mongo_pool_open Open pool connections.')
+        lines.append('# TYPE octofit_mongo_pool_open gauge')
+        lines.extend(f'octofit_mongo_pool_open{{address="{a}"}} {n}' for a, n in sorted(open_.items()))
+        lines.append('# HELP octofit_mongo_pool_checkout_failures_total Failed pool checkouts by reason.')
+        lines.append('# TYPE octofit_mongo_pool_checkout_failures_total counter')
+        lines.extend(
+            f'octofit_mongo_pool_checkout_failures_total{{address="{a}",reason="{_escape(r)}"}} {n}'
+            for (a, r), n in sorted(failures.items())
+        )
+        return lines
+
+
+def _address(event):
+    host, port = event.address
+    return f'{host}:{port}'
+
+
+POOL = PoolMonitor()
+
+
+def install():
+    """
+    Register the command and pool listeners for MongoClients created from
+    now on.
+    """
+    monitoring.register(CommandTimer())
+    monitoring.register(POOL)
+
+
+def timed_execute(execute, sql, params, many, context):
+    """
+    A connection.execute_wrapper that counts djongo queries and the time
+    spent translating them.
+    """
+    timing = _current.get()
+    if timing is None:
+        return execute(sql, params, many, context)
+    db_before = timing.db_seconds
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - start
+        timing.queries += 1
+        timing.orm_seconds += max(elapsed - (timing.db_seconds - db_before), 0.0)
+
+
+class Histogram:
+    """
+    A Prometheus histogram with one set of buckets per label set.
+    """
+
+    def __init__(self, name, help, buckets, labels=('method', 'view')):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values, value):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [[0] * len(self.buckets), 0, 0.0]
+            counts = series[0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            series[1] += 1
+            series[2] += value
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def exposition(self):
+        with self._lock:
+            series = {labels: ([*counts], count, total) for labels, (counts, count, total) in self._series.items()}
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        for label_values, (counts, count, total) in sorted(series.items()):
+            labels = ','.join(f'{key}="{_escape(value)}"' for key, value in zip(self.labels, label_values))
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {bucket_count}')
+            lines.append(f'{self.name}_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f'{self.name}_sum{{{labels}}} {total}')
+            lines.append(f'{self.name}_count{{{labels}}} {count}')
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REQUEST_SECONDS = Histogram('octofit_request_seconds', 'Total time to handle an API request.', SECONDS_BUCKETS)
+DB_SECONDS = Histogram('octofit_db_seconds', 'Time spent in MongoDB commands per request.', SECONDS_BUCKETS)
+DB_OPERATIONS = Histogram('octofit_db_operations', 'MongoDB commands issued per request.', COUNT_BUCKETS)
+ORM_SECONDS = Histogram('octofit_orm_seconds', 'Time spent in djongo query translation per request.', SECONDS_BUCKETS)
+SERIALIZE_SECONDS = Histogram('octofit_serialize_seconds', 'View time outside the database per request.', SECONDS_BUCKETS)
+RENDER_SECONDS = Histogram('octofit_render_seconds', 'Time spent rendering the response body.', SECONDS_BUCKETS)
+RESPONSE_BYTES = Histogram('octofit_response_bytes', 'Size of the response body.', BYTES_BUCKETS)
+POOL_CHECKOUT_SECONDS = Histogram(
+    'octofit_mongo_pool_checkout_seconds',
+    'Time spent waiting to check a connection out of the pool.',
+    SECONDS_BUCKETS,
+    labels=('address',),
+)
+WRITE_QUEUE_FLUSH_SECONDS = Histogram(
+    'octofit_write_queue_flush_seconds',
+    'Time to write one batch from a write queue, by outcome.',
+    SECONDS_BUCKETS,
+    labels=('queue', 'outcome'),
+)
+WRITE_QUEUE_BATCH_SIZE = Histogram(
+    'octofit_write_queue_batch_size',
+    'Items per write queue batch.',
+    BATCH_BUCKETS,
+    labels=('queue',),
+)
+
+HISTOGRAMS = [
+    REQUEST_SECONDS,
+    DB_SECONDS,
+    DB_OPERATIONS,
+    ORM_SECONDS,
+    SERIALIZE_SECONDS,
+    RENDER_SECONDS,
+    RESPONSE_BYTES,
+    POOL_CHECKOUT_SECONDS,
+    WRITE_QUEUE_FLUSH_SECONDS,
+    WRITE_QUEUE_BATCH_SIZE,
+]
+
+# Write queues add their depth and item counters to the exposition
+QUEUES = []
+
+
+def observe(method, view, timing, total_seconds, size=None):
+    labels = (method, view)
+    REQUEST_SECONDS.observe(labels, total_seconds)
+    DB_SECONDS.observe(labels, timing.db_seconds)
+    DB_OPERATIONS.observe(labels, timing.db_operations)
+    ORM_SECONDS.observe(labels, timing.orm_seconds)
+    SERIALIZE_SECONDS.observe(labels, timing.serialize_seconds)
+    RENDER_SECONDS.observe(labels, timing.render_seconds)
+    if size is not None:
+        RESPONSE_BYTES.observe(labels, size)
+
+
+def exposition():
+    """
+    Every metric in the Prometheus text format.
+    """
+    lines = []
+    for histogram in HISTOGRAMS:
+        lines.extend(histogram.exposition())
+    lines.extend(POOL.exposition())
+    for queue in QUEUES:
+        lines.extend(queue.exposition())
+    lines.append('# HELP octofit_response_cache_total Response cache lookups by outcome.')
+    lines.append('# TYPE octofit_response_cache_total counter')
+    for collection, counts in cache_stats().items():
+        for outcome, key in (('hit', 'hits'), ('miss', 'misses')):
+            lines.append(
+                f'octofit_response_cache_total{{collection="{collection}",outcome="{outcome}"}} '
+                f'{counts[key]}'
+            )
+    return '\n'.join(lines) + '\n'
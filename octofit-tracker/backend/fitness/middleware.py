@@ -0,0 +1,167 @@
+import asyncio
+import time
+
+from django.db import connections
+
+from . import metrics, routing
+
+# fitness.urls is mounted at both /api/ and the site root, so API requests
+# are everything outside the admin and static files
+NON_API_PREFIXES = ('/admin/', '/static/')
+
+
+def is_api_request(request):
+    return not request.path.startswith(NON_API_PREFIXES)
+
+
+class ServerTimingMiddleware:
+    """
+    Times every API request and reports the breakdown in a Server-Timing
+    header and in the histograms served at /api/_metrics.
+
+    Rendering happens after process_template_response, so its start is noted
+    there and a post-render callback records how long it took. Under ASGI the
+    middleware runs natively async, so async views are not pushed onto a
+    thread.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            # Tells Django's handler that this middleware is a coroutine
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        if not is_api_request(request):
+            return self.get_response(request)
+
+        timing, token = metrics.start_request()
+        request._server_timing = timing
+        try:
+            with connections['default'].execute_wrapper(metrics.timed_execute):
+                response = self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self.finish(request, response, timing)
+
+    async def __acall__(self, request):
+        if not is_api_request(request):
+            return await self.get_response(request)
+
+        timing, token = metrics.start_request()
+        request._server_timing = timing
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.end_request(token)
+        return self.finish(request, response, timing)
+
+    def finish(self, request, response, timing):
+        if not timing.view_seconds:
+            timing.view_seconds = timing.total_seconds()
+
+        total = timing.total_seconds()
+        size = None if response.streaming else len(response.content)
+        match = request.resolver_match
+        view = match.view_name if match is not None else 'unmatched'
+        metrics.observe(request.method, view, timing, total, size)
+        response['Server-Timing'] = self.header(timing, total, size)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        timing = getattr(request, '_server_timing', None)
+        if timing is not None:
+            timing.view_started = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        timing = getattr(request, '_server_timing', None)
+        if timing is None:
+            return response
+        now = time.perf_counter()
+        timing.view_seconds = now - (timing.view_started or timing.started)
+        timing.render_started = now
+
+        def rendered(response):
+            timing.render_seconds = time.perf_counter() - timing.render_started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    @staticmethod
+    def header(timing, total, size):
+        entries = [
+            f'db;dur={timing.db_seconds * 1000:.2f};desc="{timing.db_operations} ops"',
+            f'orm;dur={timing.orm_seconds * 1000:.2f};desc="{timing.queries} queries"',
+            f'serialize;dur={timing.serialize_seconds * 1000:.2f}',
+            f'render;dur={timing.render_seconds * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ]
+        if size is not None:
+            entries.append(f'size;desc="{size} bytes"')
+        return ', '.join(entries)
+
+
+class ReadRoutingMiddleware:
+    """
+    Lets safe API requests read activities, the leaderboard and workouts from
+    the secondaryPreferred replica alias (see fitness.routing).
+
+    Every unsafe API request pins the client's reads to the primary for
+    READ_YOUR_WRITES_SECONDS, so a GET right after a POST sees the write. The
+    pin is a short-lived cookie and, for cross-origin clients that do not
+    send cookies, a Read-Your-Writes-Until header to echo back.
+    """
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            if token is not None:
+                routing.reset_replica_reads(token)
+        return self.finish(request, response)
+
+    async def __acall__(self, request):
+        token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            if token is not None:
+                routing.reset_replica_reads(token)
+        return self.finish(request, response)
+
+    def start(self, request):
+        if (
+            is_api_request(request)
+            and request.method in self.safe_methods
+            and routing.replica_configured()
+            and not routing.pinned(request)
+        ):
+            return routing.allow_replica_reads()
+        return None
+
+    def finish(self, request, response):
+        if (
+            is_api_request(request)
+            and request.method not in self.safe_methods
+            and routing.replica_configured()
+        ):
+            response[routing.PIN_HEADER] = str(routing.pin_until())
+            response.set_cookie(
+                routing.PIN_COOKIE, '1', max_age=routing.pin_seconds(), httponly=True, samesite='Lax',
+            )
+        return response
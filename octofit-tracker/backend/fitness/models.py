@@ -1,5 +1,13 @@
+from datetime import datetime
+
 from djongo import models
 
+from .indexes import MongoIndex, ServedQuery
+
+# Sample values used when explaining the queries an index serves
+SAMPLE_EMAIL = 'sample@octofit.app'
+SAMPLE_DATE = datetime(2024, 1, 1)
+
 
 class User(models.Model):
     _id = models.ObjectIdField(primary_key=True)
@@ -9,6 +17,19 @@ class User(models.Model):
     total_points = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    mongo_indexes = [
+        MongoIndex('email', unique=True, serves=[
+            ServedQuery('user lookup by email', {'email': SAMPLE_EMAIL}),
+            ServedQuery('stats join from activities', {'email': {'$in': [SAMPLE_EMAIL]}}),
+        ]),
+        MongoIndex('team', '-total_points', serves=[
+            ServedQuery('team members by points', {'team': 'Team Marvel'}, [('total_points', -1)]),
+        ]),
+        MongoIndex('-total_points', '_id', serves=[
+            ServedQuery('users list page', {}, [('total_points', -1), ('_id', 1)]),
+        ]),
+    ]
+
     class Meta:
         db_table = 'users'
 
@@ -24,6 +45,12 @@ class Team(models.Model):
     member_count = models.IntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    mongo_indexes = [
+        MongoIndex('name', unique=True, serves=[
+            ServedQuery('team lookup by name', {'name': 'Team Marvel'}),
+        ]),
+    ]
+
     class Meta:
         db_table = 'teams'
 
@@ -41,6 +68,27 @@ class Activity(models.Model):
     date = models.DateTimeField()
     notes = models.TextField(blank=True)
 
+    mongo_indexes = [
+        MongoIndex('user_email', '-date', '-_id', serves=[
+            ServedQuery('activities of a user, newest first', {'user_email': SAMPLE_EMAIL}, [('date', -1), ('_id', -1)]),
+            ServedQuery('stats group by user', {'user_email': SAMPLE_EMAIL, 'date': {'$gte': SAMPLE_DATE}}),
+            ServedQuery('activities of a user, oldest first',
+                        {'user_email': SAMPLE_EMAIL, 'points': {'$gte': 10}}, [('date', 1), ('_id', 1)]),
+        ]),
+        MongoIndex('activity_type', '-date', '-_id', serves=[
+            ServedQuery('activities of a type, newest first', {'activity_type': 'Running'}, [('date', -1), ('_id', -1)]),
+            ServedQuery('activities of a type in a date range',
+                        {'activity_type': 'Running', 'date': {'$gte': SAMPLE_DATE}}, [('date', -1), ('_id', -1)]),
+        ]),
+        MongoIndex('-date', '-_id', serves=[
+            ServedQuery('activities feed page', {}, [('date', -1), ('_id', -1)]),
+            ServedQuery('export and stats date range', {'date': {'$gte': SAMPLE_DATE}}),
+        ]),
+        MongoIndex('-points', '-_id', serves=[
+            ServedQuery('activities by points', {'points': {'$gte': 10}}, [('points', -1), ('_id', -1)]),
+        ]),
+    ]
+
     class Meta:
         db_table = 'activities'
 
@@ -58,6 +106,26 @@ class Leaderboard(models.Model):
     rank = models.IntegerField()
     updated_at = models.DateTimeField(auto_now=True)
 
+    mongo_indexes = [
+        MongoIndex('type', 'rank', '_id', serves=[
+            ServedQuery('leaderboard page of one type', {'type': 'user'}, [('rank', 1), ('_id', 1)]),
+            ServedQuery('entries ranked above one entry', {'type': 'user', 'rank': {'$lte': 10}}, [('rank', -1), ('_id', -1)]),
+        ]),
+        MongoIndex('type', '-points', serves=[
+            ServedQuery('incremental rank shift', {'type': 'user', 'points': {'$gte': 10, '$lt': 20}}),
+            ServedQuery('rank from nearest lower entry', {'type': 'user', 'points': {'$lt': 10}}, [('points', -1)]),
+        ]),
+        MongoIndex('type', 'email', serves=[
+            ServedQuery('user entry lookup', {'type': 'user', 'email': SAMPLE_EMAIL}),
+        ]),
+        MongoIndex('type', 'name', serves=[
+            ServedQuery('team entry lookup', {'type': 'team', 'name': 'Team Marvel'}),
+        ]),
+        MongoIndex('rank', '_id', serves=[
+            ServedQuery('leaderboard list page', {}, [('rank', 1), ('_id', 1)]),
+        ]),
+    ]
+
     class Meta:
         db_table = 'leaderboard'
 
@@ -0,0 +1,65 @@
+import os
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from pymongo import MongoClient
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def client_options(alias='default'):
+    """
+    The MongoClient options of a database alias, from its CLIENT setting.
+    """
+    options = dict(settings.DATABASES[alias].get('CLIENT', {}))
+    # djongo's SQL translation relies on ordered documents
+    options.setdefault('document_class', OrderedDict)
+    return options
+
+
+def get_client(alias='default'):
+    """
+    Return the process-wide MongoClient for a database alias.
+
+    Every djongo connection (one per thread) and all direct pymongo code
+    share this client and so its connection pool. A forked child builds its
+    own client, because a pool's sockets cannot be shared across processes.
+    Aliases missing from DATABASES, such as the '__no_db__' connection Django
+    opens to create the test database, share the default alias's client.
+    """
+    if alias not in settings.DATABASES:
+        alias = DEFAULT_DB_ALIAS
+    pid = os.getpid()
+    entry = _clients.get(alias)
+    if entry is None or entry[0] != pid:
+        with _clients_lock:
+            entry = _clients.get(alias)
+            if entry is None or entry[0] != pid:
+                entry = _clients[alias] = (pid, MongoClient(connect=False, **client_options(alias)))
+    return entry[1]
+
+
+def close_clients():
+    """
+    Close every client created by this process.
+    """
+    with _clients_lock:
+        for alias, (pid, client) in list(_clients.items()):
+            if pid == os.getpid():
+                client.close()
+            del _clients[alias]
+
+
+def get_db(alias='default'):
+    """
+    Return the pymongo Database behind a djongo connection.
+
+    Going through djongo's connection keeps direct pymongo code on the same
+    database as the ORM (including the test database during tests).
+    """
+    connection = connections[alias]
+    connection.ensure_connection()
+    return connection.connection
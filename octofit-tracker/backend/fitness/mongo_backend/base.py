@@ -0,0 +1,25 @@
+from djongo.base import DatabaseWrapper as DjongoDatabaseWrapper, DjongoClient
+
+from fitness.mongo import get_client
+
+
+class DatabaseWrapper(DjongoDatabaseWrapper):
+    """
+    djongo on the shared client from fitness.mongo.
+
+    Stock djongo closes its MongoClient whenever Django closes a connection,
+    which with the default CONN_MAX_AGE is after every request, so each
+    request starts with an empty pool. Here connections borrow the shared
+    client and closing one leaves the pool alone.
+    """
+
+    def get_new_connection(self, connection_params):
+        self.client_connection = get_client(self.alias)
+        # djongo falls back to a placeholder name when NAME is None, as on
+        # the connection Django opens before the test database exists
+        database = self.client_connection[connection_params['name']]
+        self.djongo_connection = DjongoClient(database, connection_params['enforce_schema'])
+        return database
+
+    def _close(self):
+        pass
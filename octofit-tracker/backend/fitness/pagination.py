@@ -0,0 +1,208 @@
+import base64
+import json
+from collections import OrderedDict
+from datetime import datetime, timezone as dt_timezone
+
+from django.db.models import Q
+from pymongo import ASCENDING, DESCENDING
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(values):
+    """
+    Encode the sort-key values of a row as an opaque cursor string.
+    """
+    payload = json.dumps(list(values), default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor produced by encode_cursor back into a list of raw values.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (TypeError, ValueError, UnicodeEncodeError):
+        raise NotFound(KeysetPagination.invalid_cursor_message)
+    if not isinstance(values, list):
+        raise NotFound(KeysetPagination.invalid_cursor_message)
+    return values
+
+
+def mongo_sort(ordering):
+    """
+    Translate a Django-style ordering tuple into a pymongo sort list.
+    """
+    return [
+        (field.lstrip('-'), DESCENDING if field.startswith('-') else ASCENDING)
+        for field in ordering
+    ]
+
+
+def mongo_after(ordering, position):
+    """
+    The Mongo filter equivalent of KeysetPagination.after.
+    """
+    branches = []
+    equal = {}
+    for field, value in zip(ordering, position):
+        name = field.lstrip('-')
+        branches.append(dict(equal, **{name: {'$lt' if field.startswith('-') else '$gt': value}}))
+        equal[name] = value
+    return {'$or': branches}
+
+
+def _document_value(document, name):
+    value = document.get(name)
+    if isinstance(value, datetime) and value.tzinfo is None:
+        # pymongo returns naive UTC; match the aware values the ORM returns
+        value = value.replace(tzinfo=dt_timezone.utc)
+    return value
+
+
+class KeysetPagination(BasePagination):
+    """
+    Forward-only keyset (cursor) pagination.
+
+    A page is the rows that sort strictly after the last row of the previous
+    page, so the database seeks on the sort index instead of skipping rows and
+    deep pages cost the same as the first one. The last field in ``ordering``
+    must be unique.
+    """
+    ordering = ('_id',)
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        queryset = queryset.order_by(*self.ordering)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            position = self.to_position(queryset.model, decode_cursor(cursor))
+            queryset = queryset.filter(self.after(position))
+
+        rows = list(queryset[:self.page_size + 1])
+        return self._page(rows, getattr)
+
+    def paginate_documents(self, fetch, request, model):
+        """
+        Paginate raw Mongo documents with the same cursors as
+        paginate_queryset.
+
+        ``fetch(position, limit)`` returns up to ``limit`` documents sorted by
+        ``ordering`` that come after ``position`` (None for the first page).
+        """
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        position = None
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            position = self.to_position(model, decode_cursor(cursor))
+        documents = list(fetch(position, self.page_size + 1))
+        return self._page(documents, _document_value)
+
+    def _page(self, rows, get):
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_cursor = None
+        if self.has_next:
+            last = rows[-1]
+            self.next_cursor = encode_cursor(get(last, name) for name in self.field_names())
+        return rows
+
+    def field_names(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def to_position(self, model, values):
+        """
+        Convert raw cursor values back into typed model field values.
+        """
+        names = self.field_names()
+        if len(values) != len(names):
+            raise NotFound(self.invalid_cursor_message)
+        try:
+            return [
+                model._meta.get_field(name).to_python(value)
+                for name, value in zip(names, values)
+            ]
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+    def after(self, position):
+        """
+        Build the filter for rows that sort after ``position``: for each key,
+        every earlier key is equal and this one is past the cursor value.
+        """
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = f'{name}__lt' if field.startswith('-') else f'{name}__gt'
+            condition |= equal & Q(**{lookup: value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                page_size = int(request.query_params[self.page_size_query_param])
+            except (KeyError, ValueError):
+                pass
+            else:
+                if page_size > 0:
+                    return min(page_size, self.max_page_size)
+        return self.page_size
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'results': schema,
+            },
+        }
+
+
+class ActivityPagination(KeysetPagination):
+    ordering = ('-date', '-_id')
+
+
+class UserPagination(KeysetPagination):
+    ordering = ('-total_points', '_id')
+
+
+class LeaderboardPagination(KeysetPagination):
+    ordering = ('rank', '_id')
+
+
+class WindowLeaderboardPagination(KeysetPagination):
+    ordering = ('-points', '_id')
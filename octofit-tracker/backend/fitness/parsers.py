@@ -0,0 +1,82 @@
+import json
+
+from bson import ObjectId
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from .renderers import OBJECT_ID_TYPE, cbor2, msgpack
+
+
+class NDJSONParser(BaseParser):
+    """
+    Parses newline-delimited JSON into a lazy iterator of rows.
+
+    Lines are decoded as the request body is read, so a large upload is never
+    held in memory as a whole. A line that is not valid JSON is passed through
+    as a string, for the caller to report as an invalid row.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        return self.rows(stream, encoding)
+
+    def rows(self, stream, encoding):
+        for line in stream:
+            line = line.decode(encoding).strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield line
+
+
+def _msgpack_ext(code, data):
+    if code == OBJECT_ID_TYPE:
+        return ObjectId(data)
+    return msgpack.ExtType(code, data)
+
+
+def _cbor_tag(*args):
+    # cbor2 5 calls tag_hook(decoder, tag); cbor2 6 calls tag_hook(tag, immutable)
+    tag = next(arg for arg in args if isinstance(arg, cbor2.CBORTag))
+    if tag.tag == OBJECT_ID_TYPE:
+        return ObjectId(tag.value)
+    return tag
+
+
+class MessagePackParser(BaseParser):
+    """
+    Parses MessagePack, decoding timestamps to aware datetimes and the
+    ObjectId extension to ObjectIds.
+    """
+    media_type = 'application/msgpack'
+    available = msgpack is not None
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), timestamp=3, ext_hook=_msgpack_ext)
+        except (ValueError, msgpack.UnpackException) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
+
+
+class CBORParser(BaseParser):
+    """
+    Parses CBOR, decoding timestamps to datetimes and tagged ObjectIds.
+    """
+    media_type = 'application/cbor'
+    available = cbor2 is not None
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return cbor2.loads(stream.read(), tag_hook=_cbor_tag)
+        except (ValueError, cbor2.CBORDecodeError) as exc:
+            raise ParseError(f'CBOR parse error - {exc}')
+
+
+# Binary parsers whose packages are installed, for views that list their
+# parsers explicitly
+BINARY_PARSERS = [parser for parser in (MessagePackParser, CBORParser) if parser.available]
@@ -0,0 +1,129 @@
+import csv
+import json
+from datetime import datetime, timezone as dt_timezone
+
+from bson import ObjectId
+from rest_framework.renderers import BaseRenderer
+
+# MessagePack and CBOR are optional: their renderers are only offered when
+# the msgpack / cbor2 packages are installed (see REST_FRAMEWORK in settings)
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+try:
+    import cbor2
+except ImportError:
+    cbor2 = None
+
+# ObjectIds travel as their 12 raw bytes under the BSON type number, as a
+# MessagePack extension type and as a CBOR tag
+OBJECT_ID_TYPE = 7
+
+
+class _Echo:
+    """
+    File-like object whose write() returns the value, for csv.writer.
+    """
+
+    def write(self, value):
+        return value
+
+
+def _as_rows(data):
+    if data is None:
+        return []
+    if isinstance(data, dict):
+        return [data]
+    return data
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Renders a row or a list of rows as CSV, and streams rows for exports.
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        rows = _as_rows(data)
+        fieldnames = list(rows[0]) if rows else []
+        return ''.join(self.stream(fieldnames, rows)).encode(self.charset)
+
+    def stream(self, fieldnames, rows):
+        writer = csv.writer(_Echo())
+        yield writer.writerow(fieldnames)
+        for row in rows:
+            yield writer.writerow([row.get(name) for name in fieldnames])
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Renders a row or a list of rows as newline-delimited JSON, and streams
+    rows for exports.
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return ''.join(self.stream(None, _as_rows(data))).encode(self.charset)
+
+    def stream(self, fieldnames, rows):
+        for row in rows:
+            yield json.dumps(row, separators=(',', ':')) + '\n'
+
+
+def _aware(value):
+    # Timestamps need a timezone; naive datetimes from pymongo are UTC
+    return value.replace(tzinfo=dt_timezone.utc) if value.tzinfo is None else value
+
+
+def _msgpack_default(value):
+    if isinstance(value, ObjectId):
+        return msgpack.ExtType(OBJECT_ID_TYPE, value.binary)
+    if isinstance(value, datetime):
+        return _aware(value)
+    return str(value)
+
+
+def _cbor_default(encoder, value):
+    if isinstance(value, ObjectId):
+        encoder.encode(cbor2.CBORTag(OBJECT_ID_TYPE, value.binary))
+    else:
+        encoder.encode(str(value))
+
+
+class MessagePackRenderer(BaseRenderer):
+    """
+    Renders MessagePack. Datetimes become timestamp extensions and ObjectIds
+    a 12-byte extension; any other unknown value is rendered as a string.
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, datetime=True, default=_msgpack_default)
+
+
+class CBORRenderer(BaseRenderer):
+    """
+    Renders CBOR (RFC 8949). Datetimes become epoch timestamps (tag 1) and
+    ObjectIds tagged byte strings.
+    """
+    media_type = 'application/cbor'
+    format = 'cbor'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return cbor2.dumps(
+            data, datetime_as_timestamp=True, timezone=dt_timezone.utc, default=_cbor_default,
+        )
@@ -0,0 +1,203 @@
+from pymongo import ASCENDING
+from rest_framework.exceptions import ValidationError
+
+from . import leaderboard, rollups
+from .mongo import get_db
+from .pagination import WindowLeaderboardPagination, mongo_after, mongo_sort
+from .representation import compile_representation
+from .routing import read_db
+from .serializers import ActivitySerializer, LeaderboardSerializer, UserSerializer
+
+# Hot reads go straight to pymongo: no ORM query building, no SQL and no
+# djongo translation, and rows are mapped by the compiled representation.
+
+
+def projection(serializer_class, fields=None, extra=()):
+    """
+    The Mongo projection for a serializer's fields, or None for every field.
+    """
+    if fields is None:
+        return None
+    serializer_fields = serializer_class().fields
+    projected = {serializer_fields[name].source: 1 for name in fields}
+    projected.update((name, 1) for name in extra)
+    return projected
+
+
+def find_sorted(collection, query, ordering, limit, position=None, fields_projection=None):
+    """
+    Documents matching ``query`` in ``ordering`` (Django-style), starting
+    after the keyset ``position`` when one is given.
+    """
+    if position is not None:
+        after = mongo_after(ordering, position)
+        query = {'$and': [query, after]} if query else after
+    cursor = collection.find(query, fields_projection, sort=mongo_sort(ordering), limit=limit)
+    return list(cursor)
+
+
+def activities(user_email=None, match=None, limit=50, position=None, fields=None, db=None):
+    """
+    Activities newest first, optionally for one user and a date range match
+    (see stats.date_range_match), as ActivitySerializer data.
+    """
+    if db is None:
+        db = read_db('activities')
+    query = dict(match or {})
+    if user_email is not None:
+        query['user_email'] = user_email
+    ordering = ('-date', '-_id')
+    documents = find_sorted(
+        db.activities, query, ordering, limit, position,
+        projection(ActivitySerializer, fields, extra=('date',)),
+    )
+    represent = compile_representation(ActivitySerializer, fields, documents=True)
+    return [represent(document) for document in documents]
+
+
+def leaderboard_top(entry_type=None, limit=10, fields=None, db=None):
+    """
+    The ``limit`` best leaderboard entries, of one type or of both, as
+    LeaderboardSerializer data.
+    """
+    if db is None:
+        db = read_db('leaderboard')
+    query = {} if entry_type is None else {'type': entry_type}
+    documents = db.leaderboard.find(
+        query,
+        projection(LeaderboardSerializer, fields),
+        sort=[('rank', ASCENDING), ('_id', ASCENDING)],
+        limit=limit,
+    )
+    represent = compile_representation(LeaderboardSerializer, fields, documents=True)
+    return [represent(document) for document in documents]
+
+
+def leaderboard_around(entry_type, key, size=5, fields=None, db=None):
+    """
+    The leaderboard entry matching ``key`` (an email or a team name) with up
+    to ``size`` entries above and below it, in board order, as
+    LeaderboardSerializer data; None when there is no such entry.
+
+    Tied entries are ordered by _id, as in list pages, so every caller sees
+    the same neighbours. Each side is one range read on the (type, rank, _id)
+    index.
+    """
+    if db is None:
+        db = read_db('leaderboard')
+    fields_projection = projection(LeaderboardSerializer, fields, extra=('rank',))
+    entry = db.leaderboard.find_one(dict(key, type=entry_type), fields_projection)
+    if entry is None:
+        return None
+    above = below = []
+    if size:
+        query = {'type': entry_type}
+        position = (entry['rank'], entry['_id'])
+        above = find_sorted(db.leaderboard, query, ('-rank', '-_id'), size, position, fields_projection)
+        below = find_sorted(db.leaderboard, query, ('rank', '_id'), size, position, fields_projection)
+    represent = compile_representation(LeaderboardSerializer, fields, documents=True)
+    return [represent(document) for document in [*reversed(above), entry, *below]]
+
+
+def user_by_email(email, fields=None, db=None):
+    """
+    One user as UserSerializer data, or None.
+    """
+    if db is None:
+        db = get_db()
+    document = db.users.find_one({'email': email}, projection(UserSerializer, fields))
+    if document is None:
+        return None
+    return compile_representation(UserSerializer, fields, documents=True)(document)
+
+
+class NativeListMixin:
+    """
+    Serves keyset-paginated list responses with pymongo instead of the ORM.
+
+    Pages use the same ordering and cursors as the ORM path, so the two are
+    interchangeable. Set ``native_list = False`` on a viewset to opt out.
+    """
+    native_list = True
+
+    def get_native_query(self):
+        return {}
+
+    def list(self, request, *args, **kwargs):
+        paginator = self.paginator
+        if not self.native_list or not hasattr(paginator, 'paginate_documents'):
+            return super().list(request, *args, **kwargs)
+
+        serializer_class = self.get_serializer_class()
+        model = serializer_class.Meta.model
+        fields = self.get_requested_fields()
+        collection = read_db(model._meta.db_table)[model._meta.db_table]
+        fields_projection = projection(serializer_class, fields, extra=paginator.field_names())
+
+        def fetch(position, limit):
+            return find_sorted(
+                collection, self.get_native_query(), paginator.ordering,
+                limit, position, fields_projection,
+            )
+
+        documents = paginator.paginate_documents(fetch, request, model)
+        if documents is None:
+            return super().list(request, *args, **kwargs)
+        represent = compile_representation(serializer_class, fields, documents=True)
+        return self.get_paginated_response([represent(document) for document in documents])
+
+
+class WindowedLeaderboardMixin:
+    """
+    Adds ``?window=day|week|month`` and ``?type=user|team`` to a leaderboard
+    list. The default ``all`` window is the stored all-time leaderboard; the
+    others are read from the activity rollups of the current period, one
+    index range per page.
+    """
+    window_query_param = 'window'
+    type_query_param = 'type'
+
+    def get_window(self):
+        window = self.request.query_params.get(self.window_query_param) or leaderboard.ALL_TIME
+        if window != leaderboard.ALL_TIME and window not in leaderboard.WINDOWS:
+            choices = ', '.join([leaderboard.ALL_TIME, *leaderboard.WINDOWS])
+            raise ValidationError({self.window_query_param: [f'Expected one of: {choices}.']})
+        return window
+
+    def get_entry_type(self, default=None):
+        entry_type = self.request.query_params.get(self.type_query_param) or default
+        if entry_type not in (None, leaderboard.USER, leaderboard.TEAM):
+            raise ValidationError({
+                self.type_query_param: [f'Expected {leaderboard.USER!r} or {leaderboard.TEAM!r}.'],
+            })
+        return entry_type
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        entry_type = self.get_entry_type() if self.request is not None else None
+        return queryset if entry_type is None else queryset.filter(type=entry_type)
+
+    def get_native_query(self):
+        entry_type = self.get_entry_type()
+        return {} if entry_type is None else {'type': entry_type}
+
+    def list(self, request, *args, **kwargs):
+        window = self.get_window()
+        if window == leaderboard.ALL_TIME:
+            return super().list(request, *args, **kwargs)
+
+        paginator = WindowLeaderboardPagination()
+        query = leaderboard.window_query(window, self.get_entry_type(leaderboard.USER))
+        db = read_db(rollups.COLLECTION)
+        collection = db[rollups.COLLECTION]
+
+        def fetch(position, limit):
+            return find_sorted(collection, query, paginator.ordering, limit, position)
+
+        documents = paginator.paginate_documents(fetch, request, self.get_serializer_class().Meta.model)
+        first_page = not request.query_params.get(paginator.cursor_query_param)
+        entries = leaderboard.window_entries(documents, query, first_page, db)
+        represent = compile_representation(
+            self.get_serializer_class(), self.get_requested_fields(), documents=True
+        )
+        return paginator.get_paginated_response([represent(entry) for entry in entries])
@@ -0,0 +1,130 @@
+from datetime import timedelta, timezone as dt_timezone
+from functools import lru_cache
+from operator import attrgetter, methodcaller
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from djongo.models import ObjectIdField
+from rest_framework import ISO_8601, fields as drf_fields
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+ZERO = timedelta(0)
+
+
+def _is_utc(tz):
+    return tz is dt_timezone.utc or getattr(tz, 'key', None) in ('UTC', 'Etc/UTC')
+
+
+def _datetime_converter(field, current_timezone):
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    field_timezone = field.timezone if hasattr(field, 'timezone') else current_timezone
+    if output_format is None or output_format.lower() != ISO_8601 or not _is_utc(field_timezone):
+        return field.to_representation
+
+    def convert(value):
+        if isinstance(value, str):
+            return value
+        # UTC output: skip the astimezone/make_aware round trip
+        offset = value.utcoffset()
+        if offset is None:
+            return value.isoformat() + 'Z'
+        if offset == ZERO:
+            return value.replace(tzinfo=None).isoformat() + 'Z'
+        return field.to_representation(value)
+    return convert
+
+
+def _converter(field, documents, current_timezone):
+    """
+    Return a value -> representation function equivalent to
+    field.to_representation, or None for a field read from the whole object.
+    """
+    if isinstance(field, drf_fields.ModelField):
+        if isinstance(field.model_field, ObjectIdField):
+            return str
+        if documents:
+            raise ImproperlyConfigured(
+                f'Cannot compile ModelField {field.field_name!r} for raw documents.'
+            )
+        return None
+    if type(field) in (drf_fields.CharField, drf_fields.EmailField):
+        return str
+    if type(field) is drf_fields.IntegerField:
+        return int
+    if type(field) is drf_fields.DateTimeField:
+        return _datetime_converter(field, current_timezone)
+    return field.to_representation
+
+
+@lru_cache(maxsize=None)
+def _compile(serializer_class, fields, documents, current_timezone):
+    """
+    Build the per-row function for compile_representation, cached per
+    serializer, field subset, input kind and active timezone.
+    """
+    serializer_fields = serializer_class().fields
+    names = fields if fields is not None else tuple(serializer_fields)
+    plan = []
+    for name in names:
+        field = serializer_fields[name]
+        convert = _converter(field, documents, current_timezone)
+        if convert is None:
+            plan.append((name, None, field.to_representation))
+            continue
+        if '.' in field.source or field.source == '*':
+            raise ImproperlyConfigured(f'Cannot compile field {name!r} with source {field.source!r}.')
+        get = methodcaller('get', field.source) if documents else attrgetter(field.source)
+        plan.append((name, get, convert))
+    plan = tuple(plan)
+
+    def represent(obj):
+        row = {}
+        for name, get, convert in plan:
+            if get is None:
+                row[name] = convert(obj)
+                continue
+            value = get(obj)
+            row[name] = None if value is None else convert(value)
+        return row
+    return represent
+
+
+def compile_representation(serializer_class, fields=None, documents=False):
+    """
+    Compile a read-only fast path for ``serializer_class``.
+
+    The returned function turns a model instance (or, with ``documents``, a
+    raw Mongo document) into the same data as ``serializer_class(obj).data``,
+    using field accessors and converters looked up once instead of per row.
+    ``fields`` is an optional tuple restricting and ordering the output
+    fields. Compile once per request or batch: the active timezone is
+    resolved here, not per row.
+    """
+    current_timezone = timezone.get_current_timezone() if settings.USE_TZ else None
+    return _compile(serializer_class, fields, documents, current_timezone)
+
+
+def represent_many(serializer_class, objects, fields=None, documents=False):
+    represent = compile_representation(serializer_class, fields, documents)
+    return [represent(obj) for obj in objects]
+
+
+class FastListMixin:
+    """
+    Serves list responses through the compiled representation of the
+    viewset's serializer instead of per-field ModelSerializer calls.
+    """
+
+    def get_requested_fields(self):
+        return None
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        serializer_class = self.get_serializer_class()
+        fields = self.get_requested_fields()
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(represent_many(serializer_class, page, fields))
+        return Response(represent_many(serializer_class, queryset, fields))
@@ -0,0 +1,213 @@
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from bson import ObjectId
+from django.utils import timezone
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from .indexes import COLLECTION_INDEXES
+from .mongo import get_db
+
+COLLECTION = 'activity_rollups'
+USER = 'user'
+TEAM = 'team'
+DAY = 'day'
+WEEK = 'week'
+MONTH = 'month'
+PERIODS = (DAY, WEEK, MONTH)
+TOTALS = ('duration', 'calories', 'points', 'activities')
+BACKFILL_CHUNK_SIZE = 5000
+DUPLICATE_KEY = 11000
+
+
+def _utc(value):
+    if value.tzinfo is None:
+        return value.replace(tzinfo=dt_timezone.utc)
+    return value.astimezone(dt_timezone.utc)
+
+
+def period_start(value, period):
+    """
+    The UTC start of the day, ISO week (Monday) or month containing
+    ``value``.
+    """
+    value = _utc(value)
+    day = datetime(value.year, value.month, value.day, tzinfo=dt_timezone.utc)
+    if period == WEEK:
+        return day - timedelta(days=day.weekday())
+    if period == MONTH:
+        return day.replace(day=1)
+    return day
+
+
+def _increments(activities, teams, sign, increments):
+    for activity in activities:
+        team = teams.get(activity['user_email'])
+        values = {
+            'duration': sign * activity.get('duration', 0),
+            'calories': sign * activity.get('calories', 0),
+            'points': sign * activity['points'],
+            'activities': sign,
+        }
+        for period in PERIODS:
+            start = period_start(activity['date'], period)
+            targets = [(USER, activity['user_email'])]
+            if team is not None:
+                targets.append((TEAM, team))
+            for scope, key in targets:
+                totals = increments[(scope, key, period, start)]
+                for name, value in values.items():
+                    totals[name] += value
+
+
+def _teams_of(emails, db, known=None):
+    known = {} if known is None else known
+    missing = [email for email in set(emails) if email not in known]
+    if missing:
+        for user in db.users.find({'email': {'$in': missing}}, {'email': 1, 'team': 1}):
+            known[user['email']] = user['team']
+    return known
+
+
+def _write(collection, increments):
+    now = timezone.now()
+    requests = [
+        UpdateOne(
+            {'scope': scope, 'key': key, 'period': period, 'start': start},
+            {
+                '$inc': {name: value for name, value in totals.items() if value},
+                '$set': {'updated_at': now},
+            },
+            upsert=True,
+        )
+        for (scope, key, period, start), totals in increments.items()
+        if any(totals.values())
+    ]
+    if not requests:
+        return
+    try:
+        collection.bulk_write(requests, ordered=False)
+    except BulkWriteError as exc:
+        # Two upserts of a new bucket can race on the unique index; the loser
+        # retries as an update of the bucket the winner created
+        errors = exc.details['writeErrors']
+        if any(error['code'] != DUPLICATE_KEY for error in errors):
+            raise
+        collection.bulk_write([requests[error['index']] for error in errors], ordered=False)
+
+
+def apply(added=(), removed=(), db=None):
+    """
+    Add activities to, and subtract removed ones from, the day, week and
+    month rollups of their user and the user's team.
+
+    Activities are mappings with ``user_email``, ``date``, ``points`` and
+    optionally ``duration`` and ``calories``. Every bucket is changed with one
+    atomic $inc upsert. A team rollup counts the activities of the team's
+    current members: like the team's total_points, a user's buckets move
+    with them when they change team (see move_user), so an activity edited
+    or deleted later is always subtracted from the team that counts it.
+    """
+    if db is None:
+        db = get_db()
+    added, removed = list(added), list(removed)
+    if not added and not removed:
+        return
+    teams = _teams_of((a['user_email'] for a in added + removed), db)
+    increments = defaultdict(lambda: dict.fromkeys(TOTALS, 0))
+    _increments(added, teams, 1, increments)
+    _increments(removed, teams, -1, increments)
+    _apply_increments(db[COLLECTION], increments)
+
+
+def move_user(email, old_team, new_team, db=None):
+    """
+    Move a user's rollups from ``old_team``'s buckets to ``new_team``'s.
+    Either team may be None, for a user created for existing activities or
+    deleted while they remain.
+    """
+    if db is None:
+        db = get_db()
+    increments = defaultdict(lambda: dict.fromkeys(TOTALS, 0))
+    for bucket in db[COLLECTION].find({'scope': USER, 'key': email}):
+        for sign, team in ((-1, old_team), (1, new_team)):
+            if team is None:
+                continue
+            totals = increments[(TEAM, team, bucket['period'], bucket['start'])]
+            for name in TOTALS:
+                totals[name] += sign * bucket.get(name, 0)
+    _apply_increments(db[COLLECTION], increments)
+
+
+def _apply_increments(collection, increments):
+    _write(collection, increments)
+    emptied = [
+        {'scope': scope, 'key': key, 'period': period, 'start': start}
+        for (scope, key, period, start), totals in increments.items()
+        if totals['activities'] < 0
+    ]
+    if emptied:
+        collection.delete_many({'$or': emptied, 'activities': {'$lte': 0}})
+
+
+def backfill(chunk_size=BACKFILL_CHUNK_SIZE, db=None, progress=None):
+    """
+    Rebuild the rollups from every activity.
+
+    Activities are read in _id order, ``chunk_size`` at a time, into a
+    scratch collection that then replaces the live one in a single rename.
+    Activities written while the backfill runs are not included, so run it
+    while writes are quiet. ``progress`` is called with the running count
+    after each chunk. Returns the number of activities read.
+    """
+    if db is None:
+        db = get_db()
+    scratch = db[f'{COLLECTION}_backfill']
+    scratch.drop()
+    scratch.create_indexes([index.model() for index in COLLECTION_INDEXES[COLLECTION]])
+
+    teams = {}
+    projection = {'user_email': 1, 'date': 1, 'duration': 1, 'calories': 1, 'points': 1}
+    last_id = ObjectId('0' * 24)
+    count = 0
+    while True:
+        chunk = list(db.activities.find(
+            {'_id': {'$gt': last_id}}, projection,
+            sort=[('_id', ASCENDING)], limit=chunk_size,
+        ))
+        if not chunk:
+            break
+        last_id = chunk[-1]['_id']
+        _teams_of((activity['user_email'] for activity in chunk), db, teams)
+        increments = defaultdict(lambda: dict.fromkeys(TOTALS, 0))
+        _increments(chunk, teams, 1, increments)
+        _write(scratch, increments)
+        count += len(chunk)
+        if progress is not None:
+            progress(count)
+
+    if count:
+        scratch.rename(COLLECTION, dropTarget=True)
+    else:
+        scratch.drop()
+        db[COLLECTION].delete_many({})
+    return count
+
+
+def totals(scope, key, since, until=None, period=DAY, db=None):
+    """
+    Sum the rollups of one user or team over the buckets starting in
+    [since, until). Day buckets give day precision without reading
+    activities.
+    """
+    if db is None:
+        db = get_db()
+    start = {'$gte': period_start(since, period)}
+    if until is not None:
+        start['$lt'] = _utc(until)
+    result = dict.fromkeys(TOTALS, 0)
+    for bucket in db[COLLECTION].find({'scope': scope, 'key': key, 'period': period, 'start': start}):
+        for name in TOTALS:
+            result[name] += bucket.get(name, 0)
+    return result
@@ -0,0 +1,115 @@
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+
+from . import rollups
+from .mongo import get_db
+
+PRIMARY = 'default'
+REPLICA = 'replica'
+PIN_COOKIE = 'octofit_primary'
+PIN_HEADER = 'Read-Your-Writes-Until'
+DEFAULT_PIN_SECONDS = 10
+
+# Collections whose safe reads may be served by a secondary. A few seconds of
+# lag on the leaderboard, workouts or activity history is harmless; users and
+# teams are read back by the flows that write them, so they stay primary.
+REPLICA_COLLECTIONS = frozenset({'activities', 'leaderboard', 'workouts', rollups.COLLECTION})
+
+_replica_reads = ContextVar('replica_reads', default=False)
+
+
+def replica_configured():
+    return REPLICA in settings.DATABASES
+
+
+def pin_seconds():
+    return getattr(settings, 'READ_YOUR_WRITES_SECONDS', DEFAULT_PIN_SECONDS)
+
+
+def pin_until():
+    """
+    The deadline, in Unix seconds, until which a client that writes now
+    should read from the primary.
+    """
+    return int(time.time()) + pin_seconds()
+
+
+def pinned(request):
+    """
+    Whether the client wrote recently: it sends back the pin cookie or, from
+    another origin where the cookie is not sent, the PIN_HEADER deadline.
+    """
+    if PIN_COOKIE in request.COOKIES:
+        return True
+    try:
+        until = float(request.headers.get(PIN_HEADER, ''))
+    except ValueError:
+        return False
+    now = time.time()
+    # A deadline further out than one window was not set by this server
+    return now < until <= now + pin_seconds()
+
+
+def allow_replica_reads():
+    """
+    Let the current request read REPLICA_COLLECTIONS from the replica alias.
+    Returns a token for reset_replica_reads.
+    """
+    return _replica_reads.set(True)
+
+
+def reset_replica_reads(token):
+    _replica_reads.reset(token)
+
+
+def read_alias(collection):
+    """
+    The database alias to read ``collection`` from: the replica for the
+    routed collections during a request that allows it, otherwise the
+    primary. Code outside a request, such as management commands and the
+    write queue's flusher, always reads the primary.
+    """
+    if _replica_reads.get() and collection in REPLICA_COLLECTIONS and replica_configured():
+        return REPLICA
+    return PRIMARY
+
+
+def read_db(collection):
+    """
+    The pymongo Database to read ``collection`` from.
+    """
+    return get_db(read_alias(collection))
+
+
+def cache_variant(collection):
+    """
+    Keeps cached responses and ETags of replica reads apart from primary
+    ones, and rolls them over every pin window. A body read from a lagging
+    secondary is never served to a client reading its own writes, and is not
+    served at all once the window it was read in has passed.
+    """
+    if read_alias(collection) == PRIMARY:
+        return ''
+    return f'{REPLICA}:{int(time.time() // pin_seconds())}'
+
+
+class ReadPreferenceRouter:
+    """
+    Sends ORM reads of the routed collections to the secondaryPreferred
+    replica alias when the request allows it, and every write to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        return read_alias(model._meta.db_table)
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same replica set
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY
@@ -2,35 +2,49 @@ from rest_framework import serializers
 from .models import User, Team, Activity, Leaderboard, Workout
 
 
-class UserSerializer(serializers.ModelSerializer):
+class DynamicFieldsModelSerializer(serializers.ModelSerializer):
+    """
+    A ModelSerializer that takes an additional `fields` argument that
+    controls which fields should be displayed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for field_name in set(self.fields) - set(fields):
+                self.fields.pop(field_name)
+
+
+class UserSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = User
         fields = ['_id', 'name', 'email', 'team', 'total_points', 'created_at']
         read_only_fields = ['_id', 'created_at']
 
 
-class TeamSerializer(serializers.ModelSerializer):
+class TeamSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Team
         fields = ['_id', 'name', 'description', 'total_points', 'member_count', 'created_at']
         read_only_fields = ['_id', 'created_at']
 
 
-class ActivitySerializer(serializers.ModelSerializer):
+class ActivitySerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Activity
         fields = ['_id', 'user_email', 'activity_type', 'duration', 'calories', 'points', 'date', 'notes']
         read_only_fields = ['_id']
 
 
-class LeaderboardSerializer(serializers.ModelSerializer):
+class LeaderboardSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Leaderboard
         fields = ['_id', 'type', 'name', 'email', 'team', 'points', 'rank', 'updated_at']
         read_only_fields = ['_id', 'updated_at']
 
 
-class WorkoutSerializer(serializers.ModelSerializer):
+class WorkoutSerializer(DynamicFieldsModelSerializer):
     class Meta:
         model = Workout
         fields = ['_id', 'name', 'description', 'category', 'difficulty', 'duration', 'calories_per_session', 'points_per_session', 'created_at']
@@ -0,0 +1,166 @@
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from .mongo import get_db
+
+TOTALS = {
+    'duration': {'$sum': '$duration'},
+    'calories': {'$sum': '$calories'},
+    'points': {'$sum': '$points'},
+    'activities': {'$sum': 1},
+}
+
+
+def parse_bound(params, name, end_of_day=False):
+    """
+    Parse a date or datetime query param into an aware datetime and whether
+    it was a bare date. With ``end_of_day`` a bare date becomes the start of
+    the next day.
+    """
+    value = params.get(name)
+    if not value:
+        return None, False
+    try:
+        day = parse_date(value)
+        whole_day = day is not None
+        if whole_day:
+            if end_of_day:
+                day += timedelta(days=1)
+            parsed = datetime.combine(day, time.min)
+        else:
+            parsed = parse_datetime(value)
+            if parsed is None:
+                raise ValueError
+    except ValueError:
+        raise ValidationError({name: 'Expected an ISO 8601 date or datetime.'})
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed, dt_timezone.utc)
+    return parsed, whole_day
+
+
+def date_range_match(params):
+    """
+    Build a Mongo filter on ``date`` from ``from`` and ``to`` query params.
+
+    Both bounds are inclusive and accept a date or a datetime; a bare ``to``
+    date covers that whole day. Naive values are taken as UTC.
+    """
+    start, _ = parse_bound(params, 'from')
+    end, whole_day = parse_bound(params, 'to', end_of_day=True)
+    date = {}
+    if start is not None:
+        date['$gte'] = start
+    if end is not None:
+        date['$lt' if whole_day else '$lte'] = end
+    return {'date': date} if date else {}
+
+
+def limit_param(params):
+    """
+    The optional positive ``limit`` query param of the breakdowns.
+    """
+    limit = params.get('limit')
+    if not limit:
+        return None
+    try:
+        limit = int(limit)
+    except ValueError:
+        limit = 0
+    if limit < 1:
+        raise ValidationError({'limit': 'Expected a positive integer.'})
+    return limit
+
+
+def _limit(limit):
+    return [{'$limit': limit}] if limit else []
+
+
+def overall_pipeline(match):
+    return [
+        {'$match': match},
+        {'$group': dict(_id=None, **TOTALS)},
+        {'$project': {'_id': 0}},
+    ]
+
+
+def user_pipeline(match, limit=None):
+    """
+    Totals per user, joined to the user's name and team.
+    """
+    return [
+        {'$match': match},
+        {'$group': dict(_id='$user_email', **TOTALS)},
+        {'$sort': {'points': -1, '_id': 1}},
+        *_limit(limit),
+        {'$lookup': {
+            'from': 'users',
+            'localField': '_id',
+            'foreignField': 'email',
+            'as': 'user',
+        }},
+        {'$unwind': {'path': '$user', 'preserveNullAndEmptyArrays': True}},
+        {'$project': dict(
+            {'_id': 0, 'email': '$_id', 'name': '$user.name', 'team': '$user.team'},
+            **{name: 1 for name in TOTALS}
+        )},
+    ]
+
+
+def team_pipeline(match, limit=None):
+    """
+    Totals per team. Activities are reduced per user before the join, so the
+    users lookup runs once per active user rather than once per activity.
+    Activities whose email has no user document have no team and are skipped.
+    """
+    return [
+        {'$match': match},
+        {'$group': dict(_id='$user_email', **TOTALS)},
+        {'$lookup': {
+            'from': 'users',
+            'localField': '_id',
+            'foreignField': 'email',
+            'as': 'user',
+        }},
+        {'$unwind': '$user'},
+        {'$group': {
+            '_id': '$user.team',
+            'duration': {'$sum': '$duration'},
+            'calories': {'$sum': '$calories'},
+            'points': {'$sum': '$points'},
+            'activities': {'$sum': '$activities'},
+            'active_members': {'$sum': 1},
+        }},
+        {'$sort': {'points': -1, '_id': 1}},
+        *_limit(limit),
+        {'$project': dict(
+            {'_id': 0, 'team': '$_id', 'active_members': 1},
+            **{name: 1 for name in TOTALS}
+        )},
+    ]
+
+
+def activity_type_pipeline(match, limit=None):
+    return [
+        {'$match': match},
+        {'$group': dict(_id='$activity_type', **TOTALS)},
+        {'$sort': {'points': -1, '_id': 1}},
+        *_limit(limit),
+        {'$project': dict(
+            {'_id': 0, 'activity_type': '$_id'},
+            **{name: 1 for name in TOTALS}
+        )},
+    ]
+
+
+def aggregate(pipeline, db=None):
+    if db is None:
+        db = get_db()
+    return list(db.activities.aggregate(pipeline, allowDiskUse=True))
+
+
+def overall(match, db=None):
+    rows = aggregate(overall_pipeline(match), db)
+    return rows[0] if rows else {name: 0 for name in TOTALS}
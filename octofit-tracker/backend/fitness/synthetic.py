@@ -0,0 +1,167 @@
+import random
+from collections import Counter
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from itertools import islice
+
+from django.db import connections
+
+from .mongo import get_db
+
+ACTIVITY_TYPES = ['Running', 'Swimming', 'Cycling', 'Weight Training', 'Yoga', 'Boxing', 'HIIT']
+INSERT_CHUNK_SIZE = 5000
+SHARD_SIZE = 1000
+
+
+def team_name(number):
+    return f'Team {number:03d}'
+
+
+def end_of_window(today=None):
+    """
+    Midnight UTC at the end of today, the anchor for generated dates.
+
+    Anchoring on a whole day (rather than now()) keeps runs with the same seed
+    identical for the whole day.
+    """
+    today = today or datetime.now(dt_timezone.utc).date()
+    return datetime.combine(today + timedelta(days=1), time(), tzinfo=dt_timezone.utc)
+
+
+def shards(users, size=SHARD_SIZE):
+    """
+    Split user numbers 0..users-1 into (start, stop) ranges.
+    """
+    return [(start, min(start + size, users)) for start in range(0, users, size)]
+
+
+def generate_user(number, seed, teams, activities_per_user, days, end):
+    """
+    Return (user document, activity documents) for one synthetic user.
+
+    Every user draws from its own Random seeded with (seed, number), so the
+    data does not depend on how users are split across shards or workers.
+    """
+    rng = random.Random(f'{seed}:{number}')
+    email = f'athlete{number}@octofit.app'
+    activities = []
+    for _ in range(activities_per_user):
+        duration = rng.randint(20, 90)
+        calories = duration * rng.randint(8, 15)
+        activities.append({
+            'user_email': email,
+            'activity_type': rng.choice(ACTIVITY_TYPES),
+            'duration': duration,
+            'calories': calories,
+            'points': calories // 10,
+            'date': end - timedelta(seconds=rng.randrange(days * 86400)),
+            'notes': f'Training session for Athlete {number}',
+        })
+    user = {
+        'name': f'Athlete {number}',
+        'email': email,
+        'team': team_name(number % teams + 1),
+        'total_points': sum(activity['points'] for activity in activities),
+        'created_at': end - timedelta(days=days),
+    }
+    return user, activities
+
+
+def _insert_chunked(collection, documents, chunk_size):
+    documents = iter(documents)
+    inserted = 0
+    while True:
+        chunk = list(islice(documents, chunk_size))
+        if not chunk:
+            return inserted
+        collection.insert_many(chunk, ordered=False)
+        inserted += len(chunk)
+
+
+def populate_shard(shard, seed, teams, activities_per_user, days, end,
+                   chunk_size=INSERT_CHUNK_SIZE, db=None):
+    """
+    Generate and insert the users of one shard and their activities.
+
+    Returns (users, activities, team points, team members) so the caller can
+    create the teams once every shard is done.
+    """
+    if db is None:
+        db = get_db()
+    users = []
+    team_points = Counter()
+    team_members = Counter()
+
+    def activities():
+        for number in range(*shard):
+            user, user_activities = generate_user(number, seed, teams, activities_per_user, days, end)
+            users.append(user)
+            team_points[user['team']] += user['total_points']
+            team_members[user['team']] += 1
+            yield from user_activities
+
+    inserted = _insert_chunked(db.activities, activities(), chunk_size)
+    _insert_chunked(db.users, users, chunk_size)
+    return len(users), inserted, team_points, team_members
+
+
+def init_worker():
+    # Forked workers must not reuse the parent's MongoClient sockets
+    connections.close_all()
+
+
+def _populate_shard(args):
+    return populate_shard(*args)
+
+
+def populate(users, teams, activities_per_user, days, seed,
+             workers=1, chunk_size=INSERT_CHUNK_SIZE, end=None, db=None):
+    """
+    Insert ``users`` synthetic users, their activities and ``teams`` teams.
+
+    Shards of users are generated in-process or across ``workers`` processes.
+    Yields (users done, activities done) after each shard for progress
+    reporting.
+    """
+    end = end or end_of_window()
+    jobs = [
+        (shard, seed, teams, activities_per_user, days, end, chunk_size)
+        for shard in shards(users)
+    ]
+    team_points = Counter()
+    team_members = Counter()
+    users_done = activities_done = 0
+
+    if workers > 1:
+        import multiprocessing
+
+        connections.close_all()
+        pool = multiprocessing.get_context('fork').Pool(workers, initializer=init_worker)
+        results = pool.imap_unordered(_populate_shard, jobs)
+    else:
+        pool = None
+        results = (populate_shard(*job, db=db) for job in jobs)
+
+    try:
+        for shard_users, shard_activities, points, members in results:
+            users_done += shard_users
+            activities_done += shard_activities
+            team_points.update(points)
+            team_members.update(members)
+            yield users_done, activities_done
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    if db is None:
+        db = get_db()
+    db.teams.insert_many([
+        {
+            'name': team_name(number),
+            'description': f'Synthetic team {number}',
+            'total_points': team_points[team_name(number)],
+            'member_count': team_members[team_name(number)],
+            'created_at': end - timedelta(days=days),
+        }
+        for number in range(1, teams + 1)
+    ])
@@ -1,9 +1,38 @@
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
 from rest_framework.test import APITestCase
 from rest_framework import status
+from rest_framework.exceptions import ParseError
 from django.urls import reverse
-from datetime import datetime
+from datetime import datetime, timedelta, timezone as dt_timezone
+import importlib.util
+import io
+import json
+import threading
+from unittest import mock, skipUnless
+from urllib.parse import parse_qs, urlparse
+from bson import ObjectId
+from pymongo.errors import AutoReconnect
+from . import benchmarks, cache, filters, indexes, leaderboard, metrics, repository, rollups, routing, synthetic, writequeue
+from .ingest import ingest_activities
+from .middleware import ReadRoutingMiddleware
+from .mongo import get_client, get_db
 from .models import User, Team, Activity, Leaderboard, Workout
+from .pagination import mongo_sort
+from .parsers import CBORParser, MessagePackParser
+from .renderers import CBORRenderer, MessagePackRenderer
+from .representation import compile_representation, represent_many
+from .serializers import (
+    UserSerializer,
+    TeamSerializer,
+    ActivitySerializer,
+    LeaderboardSerializer,
+    WorkoutSerializer
+)
 
 
 class UserModelTest(TestCase):
@@ -152,6 +181,14 @@ class ActivityAPITest(APITestCase):
         response = self.client.get(self.url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
 
+    def test_detail_routes_look_up_by_object_id(self):
+        url = reverse('activity-detail', args=[str(self.activity._id)])
+        self.assertEqual(self.client.get(url).data['activity_type'], 'Swimming')
+        response = self.client.patch(url, {'points': 50}, format='json')
+        self.assertEqual(response.data['points'], 50)
+        self.assertEqual(self.client.get(reverse('activity-detail', args=['not-an-id'])).status_code,
+                         status.HTTP_404_NOT_FOUND)
+
 
 class WorkoutAPITest(APITestCase):
     def setUp(self):
@@ -181,3 +218,1185 @@ class APIRootTest(APITestCase):
         self.assertIn('activities', response.data)
         self.assertIn('leaderboard', response.data)
         self.assertIn('workouts', response.data)
+        self.assertIn('stats', response.data)
+
+
+class LeaderboardEngineTest(APITestCase):
+    def setUp(self):
+        Team.objects.create(name='Team A', description='A')
+        User.objects.create(name='Alpha', email='alpha@hero.com', team='Team A', total_points=100)
+        User.objects.create(name='Beta', email='beta@hero.com', team='Team A', total_points=50)
+        User.objects.create(name='Gamma', email='gamma@hero.com', team='Team A', total_points=10)
+        leaderboard.rebuild()
+        self.url = reverse('activity-list')
+
+    def post_activity(self, email, points):
+        return self.client.post(self.url, {
+            'user_email': email,
+            'activity_type': 'Running',
+            'duration': 30,
+            'calories': 300,
+            'points': points,
+            'date': '2024-01-01T10:00:00Z',
+        })
+
+    def ranks(self):
+        return {
+            entry.email: (entry.points, entry.rank)
+            for entry in Leaderboard.objects.filter(type='user')
+        }
+
+    def test_create_updates_points_and_ranks(self):
+        response = self.post_activity('gamma@hero.com', 60)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(User.objects.get(email='gamma@hero.com').total_points, 70)
+        self.assertEqual(self.ranks(), {
+            'alpha@hero.com': (100, 1),
+            'gamma@hero.com': (70, 2),
+            'beta@hero.com': (50, 3),
+        })
+        team_entry = Leaderboard.objects.get(type='team', name='Team A')
+        self.assertEqual(team_entry.points, 60)
+
+    def test_ties_share_a_rank(self):
+        self.post_activity('beta@hero.com', 50)
+        self.assertEqual(self.ranks(), {
+            'alpha@hero.com': (100, 1),
+            'beta@hero.com': (100, 1),
+            'gamma@hero.com': (10, 3),
+        })
+
+    def test_destroy_reverts_points_and_ranks(self):
+        response = self.post_activity('gamma@hero.com', 60)
+        detail = reverse('activity-detail', args=[response.data['_id']])
+        self.client.delete(detail)
+        self.assertEqual(User.objects.get(email='gamma@hero.com').total_points, 10)
+        self.assertEqual(self.ranks(), {
+            'alpha@hero.com': (100, 1),
+            'beta@hero.com': (50, 2),
+            'gamma@hero.com': (10, 3),
+        })
+
+
+    def test_concurrent_moves_keep_ranks_consistent(self):
+        for number in range(6):
+            User.objects.create(name=f'Racer {number}', email=f'racer{number}@hero.com', team='Team A',
+                                total_points=number * 5)
+        leaderboard.rebuild()
+        start = threading.Barrier(6)
+
+        def race(number):
+            start.wait()
+            for step in range(10):
+                leaderboard.apply_point_deltas({f'racer{number}@hero.com': (step * 7 + number * 3) % 11 - 5})
+
+        threads = [threading.Thread(target=race, args=(number,)) for number in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(list(leaderboard.rank_drift()), [])
+
+    def test_check_leaderboard_command_repairs_drift(self):
+        get_db().leaderboard.update_one({'type': 'user', 'email': 'beta@hero.com'}, {'$set': {'rank': 3}})
+        with self.assertRaises(CommandError):
+            call_command('check_leaderboard', stdout=io.StringIO())
+        call_command('check_leaderboard', repair=True, stdout=io.StringIO())
+        self.assertEqual(list(leaderboard.rank_drift()), [])
+        self.assertEqual(self.ranks()['beta@hero.com'], (50, 2))
+
+
+class KeysetPaginationTest(APITestCase):
+    def setUp(self):
+        for day in (1, 2, 2, 3, 4):
+            Activity.objects.create(
+                user_email='page@hero.com',
+                activity_type='Cycling',
+                duration=30,
+                calories=300,
+                points=30,
+                date=datetime(2024, 1, day, 10, 0)
+            )
+        self.url = reverse('activity-list')
+
+    def test_pages_follow_date_then_id_without_overlap(self):
+        seen = []
+        response = self.client.get(self.url, {'page_size': 2})
+        while True:
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            seen.extend(response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+
+        expected = Activity.objects.order_by('-date', '-_id')
+        self.assertEqual([row['_id'] for row in seen], [str(a._id) for a in expected])
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get(self.url, {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class StatsAPITest(APITestCase):
+    def setUp(self):
+        User.objects.create(name='Alpha', email='alpha@hero.com', team='Team A')
+        User.objects.create(name='Beta', email='beta@hero.com', team='Team A')
+        User.objects.create(name='Gamma', email='gamma@hero.com', team='Team B')
+        for email, activity_type, points, day in [
+            ('alpha@hero.com', 'Running', 10, 1),
+            ('alpha@hero.com', 'Yoga', 5, 2),
+            ('beta@hero.com', 'Running', 20, 3),
+            ('gamma@hero.com', 'Yoga', 8, 20),
+        ]:
+            Activity.objects.create(
+                user_email=email,
+                activity_type=activity_type,
+                duration=30,
+                calories=points * 10,
+                points=points,
+                date=datetime(2024, 1, day, 12, 0)
+            )
+
+    def test_overall_totals(self):
+        response = self.client.get(reverse('stats-list'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['points'], 43)
+        self.assertEqual(response.data['activities'], 4)
+
+    def test_team_totals_join_users(self):
+        response = self.client.get(reverse('stats-teams'))
+        self.assertEqual(
+            [(row['team'], row['points'], row['active_members']) for row in response.data],
+            [('Team A', 35, 2), ('Team B', 8, 1)]
+        )
+
+    def test_user_totals_respect_date_range(self):
+        response = self.client.get(reverse('stats-users'), {'from': '2024-01-02', 'to': '2024-01-03'})
+        self.assertEqual(
+            [(row['email'], row['points'], row['team']) for row in response.data],
+            [('beta@hero.com', 20, 'Team A'), ('alpha@hero.com', 5, 'Team A')]
+        )
+
+    def test_activity_type_totals(self):
+        response = self.client.get(reverse('stats-activity-types'), {'limit': 1})
+        self.assertEqual(response.data, [{
+            'activity_type': 'Running',
+            'duration': 60,
+            'calories': 300,
+            'points': 30,
+            'activities': 2,
+        }])
+
+    def test_invalid_date_is_rejected(self):
+        response = self.client.get(reverse('stats-users'), {'from': 'yesterday'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class BulkActivityAPITest(APITestCase):
+    def setUp(self):
+        Team.objects.create(name='Bulk Team', description='Bulk')
+        User.objects.create(name='Bulk Hero', email='bulk@hero.com', team='Bulk Team')
+        self.url = reverse('activity-bulk')
+        self.row = {
+            'user_email': 'bulk@hero.com',
+            'activity_type': 'Rowing',
+            'duration': 20,
+            'calories': 200,
+            'points': 20,
+            'date': '2024-01-01T08:00:00Z',
+        }
+
+    def test_json_array_reports_row_errors(self):
+        rows = [self.row, {'user_email': 'bulk@hero.com'}, self.row]
+        response = self.client.post(self.url, rows, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['inserted'], 2)
+        self.assertEqual([error['index'] for error in response.data['errors']], [1])
+        self.assertEqual(Activity.objects.filter(user_email='bulk@hero.com').count(), 2)
+        self.assertEqual(User.objects.get(email='bulk@hero.com').total_points, 40)
+        self.assertEqual(Team.objects.get(name='Bulk Team').total_points, 40)
+
+    def test_ndjson_stream(self):
+        body = '\n'.join([json.dumps(self.row)] * 3 + ['{not json'])
+        response = self.client.post(self.url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['inserted'], 3)
+        self.assertEqual(response.data['errors'][0]['index'], 3)
+
+    def test_object_body_is_rejected(self):
+        response = self.client.post(self.url, self.row, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_stream_failure_keeps_written_chunks_consistent(self):
+        def rows():
+            yield from [self.row] * 3
+            raise UnicodeDecodeError('utf-8', b'\xff', 0, 1, 'invalid start byte')
+
+        with self.assertRaises(UnicodeDecodeError):
+            ingest_activities(rows(), chunk_size=2)
+        self.assertEqual(Activity.objects.filter(user_email='bulk@hero.com').count(), 2)
+        self.assertEqual(User.objects.get(email='bulk@hero.com').total_points, 40)
+
+
+class ActivityExportAPITest(APITestCase):
+    def setUp(self):
+        for day in (1, 2, 3):
+            Activity.objects.create(
+                user_email='export@hero.com',
+                activity_type='Hiking',
+                duration=60,
+                calories=500,
+                points=50,
+                date=datetime(2024, 1, day, 9, 0),
+                notes='Trail'
+            )
+        self.url = reverse('activity-export')
+
+    def test_csv_uses_serializer_columns(self):
+        response = self.client.get(self.url, {'format': 'csv', 'from': '2024-01-02'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], ','.join(ActivitySerializer.Meta.fields))
+        self.assertEqual(len(lines), 3)
+
+    def test_ndjson_rows_match_api_representation(self):
+        response = self.client.get(self.url, {'format': 'ndjson'})
+        rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        expected = ActivitySerializer(Activity.objects.all(), many=True).data
+        self.assertEqual(
+            sorted(rows, key=lambda row: row['_id']),
+            sorted((dict(row) for row in expected), key=lambda row: row['_id'])
+        )
+
+
+class ResponseCacheTest(APITestCase):
+    def setUp(self):
+        caches[cache.CACHE_ALIAS].clear()
+        Workout.objects.create(
+            name='Cached Workout',
+            description='Cached',
+            category='Core',
+            difficulty='Easy',
+            duration=15,
+            calories_per_session=100,
+            points_per_session=10
+        )
+        self.url = reverse('workout-list')
+
+    def workouts_stats(self):
+        return cache.cache_stats().get('workouts', {'hits': 0, 'misses': 0})
+
+    def test_second_read_is_a_hit(self):
+        before = self.workouts_stats()
+        first = self.client.get(self.url)
+        second = self.client.get(self.url)
+        after = self.workouts_stats()
+        self.assertEqual(first.data, second.data)
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+
+    def test_write_through_viewset_invalidates(self):
+        self.client.get(self.url)
+        response = self.client.post(self.url, {
+            'name': 'New Workout',
+            'description': 'New',
+            'category': 'Cardio',
+            'difficulty': 'Hard',
+            'duration': 20,
+            'calories_per_session': 200,
+            'points_per_session': 20
+        })
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        names = [row['name'] for row in self.client.get(self.url).data['results']]
+        self.assertIn('New Workout', names)
+
+    def test_invalidation_from_another_process(self):
+        self.client.get(self.url)
+        # populate_db and the repair commands write with pymongo, then invalidate
+        get_db().workouts.insert_one({'name': 'Seeded Workout', 'description': 'Seeded', 'category': 'Core',
+                                      'difficulty': 'Easy', 'duration': 10, 'calories_per_session': 50,
+                                      'points_per_session': 5})
+        cache.invalidate_all()
+        names = [row['name'] for row in self.client.get(self.url).data['results']]
+        self.assertIn('Seeded Workout', names)
+
+    def test_stats_endpoint(self):
+        self.client.get(self.url)
+        response = self.client.get(reverse('cache-stats'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('workouts', response.data)
+
+
+class ConditionalGetTest(APITestCase):
+    def setUp(self):
+        Team.objects.create(name='Etag Team', description='Conditional')
+        self.url = reverse('team-list')
+
+    def test_unchanged_collection_answers_304(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+
+        not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(not_modified.content, b'')
+
+        since = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(since.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_write_changes_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.client.post(self.url, {'name': 'Other Team', 'description': 'Other'})
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_versions_are_shared_between_processes(self):
+        etag = self.client.get(self.url)['ETag']
+        # Another worker has its own, empty response cache but the same versions
+        caches[cache.CACHE_ALIAS].clear()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        # A write from outside the API, such as populate_db, reaches every process
+        cache.invalidate_all()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_detail_endpoint_is_conditional(self):
+        team = Team.objects.get(name='Etag Team')
+        url = reverse('team-detail', args=[str(team._id)])
+        etag = self.client.get(url)['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+
+class SerializerParityTest(SimpleTestCase):
+    """
+    The compiled representation must produce exactly the DRF serializer output.
+    """
+
+    def assertParity(self, serializer_class, instances):
+        expected = [dict(row) for row in serializer_class(instances, many=True).data]
+        self.assertEqual(represent_many(serializer_class, instances), expected)
+        documents = [benchmarks.as_document(instance) for instance in instances]
+        self.assertEqual(represent_many(serializer_class, documents, documents=True), expected)
+
+    def test_activity(self):
+        instances = [benchmarks.make_activity(i) for i in range(50)]
+        instances.append(Activity(
+            _id=ObjectId(),
+            user_email='naive@hero.com',
+            activity_type='Yoga',
+            duration=10,
+            calories=50,
+            points=5,
+            date=datetime(2024, 3, 1, 7, 30, 15, 250),
+        ))
+        instances.append(Activity(
+            _id=ObjectId(),
+            user_email='offset@hero.com',
+            activity_type='Yoga',
+            duration=10,
+            calories=50,
+            points=5,
+            date=datetime(2024, 3, 1, 7, 30, tzinfo=dt_timezone(timedelta(hours=-5))),
+            notes='',
+        ))
+        self.assertParity(ActivitySerializer, instances)
+
+    def test_user(self):
+        self.assertParity(UserSerializer, [benchmarks.make_user(i) for i in range(50)])
+
+    def test_team(self):
+        self.assertParity(TeamSerializer, [
+            Team(_id=ObjectId(), name='Team A', description='A', total_points=10,
+                 member_count=2, created_at=datetime(2024, 1, 1, tzinfo=dt_timezone.utc)),
+            Team(name='Unsaved', description='', created_at=None),
+        ])
+
+    def test_leaderboard(self):
+        self.assertParity(LeaderboardSerializer, [
+            Leaderboard(_id=ObjectId(), type='user', name='A', email='a@hero.com', team='T',
+                        points=10, rank=1, updated_at=datetime(2024, 1, 1, 12, 0)),
+            Leaderboard(_id=ObjectId(), type='team', name='T', email=None, team='T',
+                        points=10, rank=1, updated_at=datetime(2024, 1, 1, 12, 0)),
+        ])
+
+    def test_workout(self):
+        self.assertParity(WorkoutSerializer, [
+            Workout(_id=ObjectId(), name='W', description='Long description', category='Core',
+                    difficulty='Easy', duration=10, calories_per_session=100,
+                    points_per_session=10, created_at=datetime(2024, 1, 1, 8, 0)),
+        ])
+
+    def test_field_subset(self):
+        instance = benchmarks.make_user(1)
+        represent = compile_representation(UserSerializer, ('name', 'total_points'))
+        self.assertEqual(represent(instance), {'name': instance.name, 'total_points': instance.total_points})
+
+
+class SparseFieldsetTest(APITestCase):
+    def setUp(self):
+        caches[cache.CACHE_ALIAS].clear()
+        self.user = User.objects.create(name='Sparse Hero', email='sparse@hero.com', team='Sparse Team', total_points=7)
+        Activity.objects.create(
+            user_email='sparse@hero.com',
+            activity_type='Climbing',
+            duration=90,
+            calories=800,
+            points=80,
+            date=datetime(2024, 2, 1, 10, 0),
+            notes='A very long description of the climb'
+        )
+
+    def test_fields_trim_list_output(self):
+        response = self.client.get(reverse('user-list'), {'fields': 'name,total_points'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [{'name': 'Sparse Hero', 'total_points': 7}])
+
+    def test_exclude_drops_large_text_field(self):
+        response = self.client.get(reverse('activity-list'), {'exclude': 'notes'})
+        row = response.data['results'][0]
+        self.assertNotIn('notes', row)
+        self.assertEqual(row['points'], 80)
+
+    def test_fields_apply_to_detail(self):
+        url = reverse('user-detail', args=[str(self.user._id)])
+        response = self.client.get(url, {'fields': 'email'})
+        self.assertEqual(response.data, {'email': 'sparse@hero.com'})
+
+    def test_queryset_is_projected(self):
+        response = self.client.get(reverse('activity-list'), {'fields': 'points'})
+        self.assertEqual(response.data['results'], [{'points': 80}])
+
+    def test_unknown_field_is_rejected(self):
+        response = self.client.get(reverse('workout-list'), {'fields': 'name,secret'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class IndexCoverageTest(TestCase):
+    def setUp(self):
+        self.db = get_db()
+        indexes.sync(self.db)
+
+    def test_sync_is_idempotent(self):
+        self.assertEqual(indexes.sync(self.db), [])
+
+    def test_every_declared_index_serves_a_query(self):
+        for collection, declared in indexes.declared_indexes().items():
+            for index in declared:
+                self.assertTrue(index.serves, f'{collection}.{index.name} serves no query')
+
+    def test_served_queries_use_an_index(self):
+        for collection, declared in indexes.declared_indexes().items():
+            for index in declared:
+                for query in index.serves:
+                    stages = [stage for stage, _ in indexes.winning_plan(self.db[collection], query)]
+                    self.assertNotIn('COLLSCAN', stages, f'{collection}: {query.description}')
+
+
+class SyntheticDataTest(TestCase):
+    end = datetime(2024, 3, 1, tzinfo=dt_timezone.utc)
+
+    def test_users_are_deterministic_for_a_seed(self):
+        first = synthetic.generate_user(7, 42, 3, 5, 10, self.end)
+        self.assertEqual(first, synthetic.generate_user(7, 42, 3, 5, 10, self.end))
+        self.assertNotEqual(first, synthetic.generate_user(7, 43, 3, 5, 10, self.end))
+
+    def test_populate_inserts_consistent_totals(self):
+        progress = list(synthetic.populate(30, 3, 4, 10, 42, chunk_size=7, end=self.end))
+        self.assertEqual(progress[-1], (30, 120))
+        db = get_db()
+        self.assertEqual(db.users.count_documents({}), 30)
+        self.assertEqual(db.activities.count_documents({}), 120)
+        user_points = sum(user['total_points'] for user in db.users.find())
+        team_points = sum(team['total_points'] for team in db.teams.find())
+        self.assertEqual(user_points, team_points)
+        self.assertEqual(sum(team['member_count'] for team in db.teams.find()), 30)
+
+    def test_hero_data_is_deterministic_for_a_seed(self):
+        def activities():
+            call_command('populate_db', seed=42, stdout=io.StringIO())
+            return list(get_db().activities.find({}, {'_id': 0}).sort([('user_email', 1), ('date', 1)]))
+
+        self.assertEqual(activities(), activities())
+
+
+class BenchmarkComparisonTest(SimpleTestCase):
+    def test_timings_and_rates_are_compared_per_case(self):
+        baseline = [
+            {'suite': 'ingest', 'case': 'activities', 'rows': 10,
+             'bulk_ingest_seconds': 1.0, 'bulk_ingest_per_second': 100.0},
+            {'suite': 'api', 'case': 'users', 'rows': 10, 'list_seconds': 1.0},
+        ]
+        current = [
+            {'suite': 'ingest', 'case': 'activities', 'rows': 10,
+             'bulk_ingest_seconds': 1.5, 'bulk_ingest_per_second': 95.0},
+            {'suite': 'api', 'case': 'users', 'rows': 20, 'list_seconds': 9.0},
+        ]
+        rows = benchmarks.compare(baseline, current, threshold=0.1)
+        self.assertEqual(rows, [
+            (('ingest', 'activities', 10), 'bulk_ingest_seconds', 1.0, 1.5, True),
+            (('ingest', 'activities', 10), 'bulk_ingest_per_second', 100.0, 95.0, False),
+        ])
+
+
+    @skipUnless(importlib.util.find_spec('mongomock'), 'mongomock is not installed')
+    def test_in_memory_suites_stay_off_the_default_database(self):
+        # SimpleTestCase fails any use of the default connection
+        out = io.StringIO()
+        call_command('benchmark', in_memory=True, sizes=[20], stdout=out)
+        self.assertIn('Running ingest benchmarks...', out.getvalue())
+
+
+class HistogramTest(SimpleTestCase):
+    def test_exposition_is_cumulative(self):
+        histogram = metrics.Histogram('test_seconds', 'Test.', (0.1, 1))
+        histogram.observe(('GET', 'user-list'), 0.05)
+        histogram.observe(('GET', 'user-list'), 0.5)
+        lines = histogram.exposition()
+        self.assertIn('test_seconds_bucket{method="GET",view="user-list",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{method="GET",view="user-list",le="1"} 2', lines)
+        self.assertIn('test_seconds_bucket{method="GET",view="user-list",le="+Inf"} 2', lines)
+        self.assertIn('test_seconds_count{method="GET",view="user-list"} 2', lines)
+
+
+class ServerTimingTest(APITestCase):
+    def setUp(self):
+        User.objects.create(name='Timed Hero', email='timed@hero.com', team='Team Marvel', total_points=5)
+
+    def test_api_responses_carry_server_timing(self):
+        response = self.client.get(reverse('user-list'))
+        timing = response['Server-Timing']
+        for metric in ('db;dur=', 'orm;dur=', 'serialize;dur=', 'render;dur=', 'total;dur='):
+            self.assertIn(metric, timing)
+        self.assertNotIn('db;dur=0.00;desc="0 ops"', timing)
+        self.assertIn(f'size;desc="{len(response.content)} bytes"', timing)
+
+    def test_metrics_endpoint_exposes_histograms(self):
+        self.client.get(reverse('user-list'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        body = response.content.decode()
+        self.assertIn('octofit_db_operations_bucket{method="GET",view="user-list"', body)
+        self.assertIn('# TYPE octofit_response_bytes histogram', body)
+
+    def test_both_mounts_are_timed(self):
+        self.assertIn('total;dur=', self.client.get('/api/users/')['Server-Timing'])
+        self.assertIn('total;dur=', self.client.get('/users/')['Server-Timing'])
+
+    def test_metrics_endpoint_after_a_cached_read(self):
+        self.client.get(reverse('workout-list'))
+        self.client.get(reverse('workout-list'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('octofit_response_cache_total{collection="workouts",outcome="miss"}', response.content.decode())
+
+
+class RepositoryTest(APITestCase):
+    def setUp(self):
+        cache.invalidate_all()
+        self.user = User.objects.create(name='Native Hero', email='native@hero.com', team='Team Marvel', total_points=0)
+        Team.objects.create(name='Team Marvel', description='Marvel', total_points=0)
+        for day in range(1, 6):
+            Activity.objects.create(
+                user_email='native@hero.com',
+                activity_type='Running',
+                duration=30,
+                calories=300,
+                points=day * 10,
+                date=datetime(2024, 1, day, 8, 0, tzinfo=dt_timezone.utc),
+            )
+        leaderboard.rebuild()
+
+    def list_pages(self, native_list):
+        from .views import ActivityViewSet
+        ActivityViewSet.native_list = native_list
+        try:
+            pages, params = [], {'page_size': 2}
+            while True:
+                response = self.client.get(reverse('activity-list'), params)
+                pages.append(response.data['results'])
+                if not response.data['next']:
+                    return pages
+                params['cursor'] = parse_qs(urlparse(response.data['next']).query)['cursor'][0]
+                cache.invalidate_all()
+        finally:
+            del ActivityViewSet.native_list
+
+    def test_native_list_matches_orm_pages(self):
+        self.assertEqual(self.list_pages(True), self.list_pages(False))
+
+    def test_activities_by_user_match_serializer(self):
+        expected = ActivitySerializer(
+            Activity.objects.filter(user_email='native@hero.com').order_by('-date', '-_id')[:3], many=True
+        ).data
+        self.assertEqual(repository.activities('native@hero.com', limit=3), [dict(row) for row in expected])
+
+    def test_user_by_email_endpoint(self):
+        response = self.client.get(reverse('user-by-email'), {'email': 'native@hero.com'})
+        # MongoDB keeps milliseconds, so compare with the stored user
+        self.assertEqual(response.data, UserSerializer(User.objects.get(email='native@hero.com')).data)
+        response = self.client.get(reverse('user-by-email'), {'email': 'nobody@hero.com'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_leaderboard_top(self):
+        response = self.client.get(reverse('leaderboard-top'), {'type': 'user', 'limit': 1})
+        self.assertEqual([entry['email'] for entry in response.data], ['native@hero.com'])
+        response = self.client.get(reverse('leaderboard-top'), {'type': 'planet'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AsyncReadEndpointTest(APITestCase):
+    def setUp(self):
+        cache.invalidate_all()
+        User.objects.create(name='Async Hero', email='async@hero.com', team='Team DC', total_points=0)
+        Team.objects.create(name='Team DC', description='DC', total_points=0)
+        for day in range(1, 4):
+            Activity.objects.create(
+                user_email='async@hero.com',
+                activity_type='Cycling',
+                duration=40,
+                calories=400,
+                points=40,
+                date=datetime(2024, 1, day, 8, 0, tzinfo=dt_timezone.utc),
+            )
+        leaderboard.apply_point_deltas({'async@hero.com': 120})
+
+    async def test_async_leaderboard_matches_sync(self):
+        response = await self.async_client.get('/api/async/leaderboard/')
+        self.assertEqual(response.status_code, 200)
+        sync = await sync_to_async(self.client.get)(reverse('leaderboard-list'))
+        self.assertEqual(response.json()['results'], json.loads(sync.content)['results'])
+
+    async def test_async_activities_filter_and_paginate(self):
+        response = await self.async_client.get(
+            '/api/async/activities/', {'user_email': 'async@hero.com', 'page_size': 2}
+        )
+        body = response.json()
+        self.assertEqual([row['date'] for row in body['results']], ['2024-01-03T08:00:00Z', '2024-01-02T08:00:00Z'])
+        self.assertIsNotNone(body['next'])
+
+    async def test_async_stats(self):
+        response = await self.async_client.get('/api/async/stats/', {'from': '2024-01-02'})
+        self.assertEqual(response.json()['points'], 80)
+        response = await self.async_client.get('/api/async/stats/users/', {'limit': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+
+class MongoClientRegistryTest(SimpleTestCase):
+    def test_client_is_shared_and_configured_from_settings(self):
+        client = get_client()
+        self.assertIs(get_client(), client)
+        self.assertEqual(client.max_pool_size, settings.MONGO_CLIENT['maxPoolSize'])
+        self.assertEqual(client.read_concern.level, settings.MONGO_CLIENT['readConcernLevel'])
+
+    def test_unknown_alias_shares_the_default_client(self):
+        # Django creates the test database over a '__no_db__' connection
+        self.assertIs(get_client('__no_db__'), get_client())
+
+    def test_pool_monitor_tracks_checkouts(self):
+        from pymongo import monitoring as events
+        monitor = metrics.PoolMonitor()
+        address = ('db.example', 27017)
+        monitor.connection_check_out_started(events.ConnectionCheckOutStartedEvent(address))
+        monitor.connection_checked_out(events.ConnectionCheckedOutEvent(address, 1))
+        monitor.connection_check_out_started(events.ConnectionCheckOutStartedEvent(address))
+        monitor.connection_checked_out(events.ConnectionCheckedOutEvent(address, 2))
+        monitor.connection_checked_in(events.ConnectionCheckedInEvent(address, 1))
+        self.assertIn('octofit_mongo_pool_in_use{address="db.example:27017"} 1', monitor.exposition())
+
+
+class RollupTest(APITestCase):
+    def setUp(self):
+        User.objects.create(name='Rollup Hero', email='rollup@hero.com', team='Team Marvel', total_points=0)
+        Team.objects.create(name='Team Marvel', description='Marvel', total_points=0)
+        self.db = get_db()
+        # Not a model, so the per-test flush leaves it alone
+        self.db[rollups.COLLECTION].drop()
+
+    def tearDown(self):
+        self.db[rollups.COLLECTION].drop()
+
+    def create(self, day, points):
+        response = self.client.post(reverse('activity-list'), {
+            'user_email': 'rollup@hero.com',
+            'activity_type': 'Running',
+            'duration': 30,
+            'calories': 300,
+            'points': points,
+            'date': f'2024-01-{day:02d}T08:00:00Z',
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return response.data['_id']
+
+    def bucket(self, scope, key, period, start):
+        return self.db[rollups.COLLECTION].find_one(
+            {'scope': scope, 'key': key, 'period': period, 'start': start}
+        )
+
+    def snapshot(self):
+        return sorted(
+            (doc['scope'], doc['key'], doc['period'], doc['start'], doc['points'], doc['activities'])
+            for doc in self.db[rollups.COLLECTION].find()
+        )
+
+    def test_writes_update_day_and_week_rollups(self):
+        monday = datetime(2024, 1, 1)
+        first = self.create(1, 10)
+        self.create(3, 20)
+        week = self.bucket('team', 'Team Marvel', 'week', monday)
+        self.assertEqual((week['points'], week['activities'], week['duration']), (30, 2, 60))
+        self.assertEqual(self.bucket('user', 'rollup@hero.com', 'day', monday)['points'], 10)
+
+        url = reverse('activity-detail', args=[first])
+        self.client.patch(url, {'points': 15}, format='json')
+        self.assertEqual(self.bucket('user', 'rollup@hero.com', 'week', monday)['points'], 35)
+
+        self.client.delete(url)
+        self.assertIsNone(self.bucket('user', 'rollup@hero.com', 'day', monday))
+        self.assertEqual(self.bucket('user', 'rollup@hero.com', 'week', monday)['activities'], 1)
+
+    def test_backfill_matches_incremental_rollups(self):
+        for day, points in ((1, 10), (2, 20), (9, 5)):
+            self.create(day, points)
+        incremental = self.snapshot()
+        self.assertEqual(rollups.backfill(chunk_size=2), 3)
+        self.assertEqual(self.snapshot(), incremental)
+
+    def test_totals_over_a_window(self):
+        self.create(1, 10)
+        self.create(9, 5)
+        since = datetime(2024, 1, 2, tzinfo=dt_timezone.utc)
+        self.assertEqual(rollups.totals('user', 'rollup@hero.com', since)['points'], 5)
+
+    def test_team_change_moves_rollups_with_the_user(self):
+        Team.objects.create(name='Team DC', description='DC', total_points=0)
+        monday = datetime(2024, 1, 1)
+        first = self.create(1, 10)
+        user = User.objects.get(email='rollup@hero.com')
+        response = self.client.patch(
+            reverse('user-detail', args=[str(user._id)]), {'team': 'Team DC'}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIsNone(self.bucket('team', 'Team Marvel', 'week', monday))
+        self.assertEqual(self.bucket('team', 'Team DC', 'week', monday)['points'], 10)
+
+        # Deleting the older activity subtracts it from the team now counting it
+        self.client.delete(reverse('activity-detail', args=[first]))
+        self.assertIsNone(self.bucket('team', 'Team Marvel', 'week', monday))
+        self.assertIsNone(self.bucket('team', 'Team DC', 'week', monday))
+
+
+class WindowedLeaderboardTest(APITestCase):
+    def setUp(self):
+        for name, team in (('Ana', 'Team Marvel'), ('Bo', 'Team Marvel'), ('Cy', 'Team DC')):
+            User.objects.create(name=name, email=f'{name.lower()}@hero.com', team=team, total_points=0)
+        for name in ('Team Marvel', 'Team DC'):
+            Team.objects.create(name=name, description=name, total_points=0)
+        get_db()[rollups.COLLECTION].drop()
+
+    def tearDown(self):
+        get_db()[rollups.COLLECTION].drop()
+
+    def create(self, name, points, date=None):
+        response = self.client.post(reverse('activity-list'), {
+            'user_email': f'{name.lower()}@hero.com',
+            'activity_type': 'Running',
+            'duration': 30,
+            'calories': 300,
+            'points': points,
+            'date': (date or datetime.now(dt_timezone.utc)).isoformat(),
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    def board(self, **params):
+        response = self.client.get(reverse('leaderboard-list'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_day_window_ranks_only_todays_points(self):
+        self.create('Ana', 10)
+        self.create('Bo', 30)
+        self.create('Cy', 30)
+        self.create('Ana', 100, datetime.now(dt_timezone.utc) - timedelta(days=40))
+        results = self.board(window='day')['results']
+        self.assertEqual([(r['email'], r['points'], r['rank']) for r in results], [
+            ('bo@hero.com', 30, 1), ('cy@hero.com', 30, 1), ('ana@hero.com', 10, 3),
+        ])
+        self.assertEqual(results[0]['name'], 'Bo')
+
+    def test_ranks_carry_across_pages(self):
+        for name, points in (('Ana', 30), ('Bo', 30), ('Cy', 10)):
+            self.create(name, points)
+        first = self.board(window='week', page_size=1)
+        cursor = parse_qs(urlparse(first['next']).query)['cursor'][0]
+        second = self.board(window='week', page_size=2, cursor=cursor)
+        self.assertEqual([r['rank'] for r in first['results'] + second['results']], [1, 1, 3])
+
+    def test_team_window(self):
+        self.create('Ana', 10)
+        self.create('Bo', 5)
+        self.create('Cy', 20)
+        results = self.board(window='month', type='team')['results']
+        self.assertEqual([(r['name'], r['points'], r['rank']) for r in results], [
+            ('Team DC', 20, 1), ('Team Marvel', 15, 2),
+        ])
+
+    def test_unknown_window_is_rejected(self):
+        response = self.client.get(reverse('leaderboard-list'), {'window': 'year'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TeamCounterTest(APITestCase):
+    def setUp(self):
+        for name in ('Team Marvel', 'Team DC'):
+            Team.objects.create(name=name, description=name, total_points=0, member_count=0)
+        self.db = get_db()
+
+    def team(self, name):
+        return self.db.teams.find_one({'name': name}, {'member_count': 1, 'total_points': 1, '_id': 0})
+
+    def entry(self, **key):
+        return self.db.leaderboard.find_one(key, {'points': 1, 'rank': 1, 'team': 1, '_id': 0})
+
+    def test_user_writes_keep_team_counters(self):
+        response = self.client.post(reverse('user-list'), {
+            'name': 'Thor', 'email': 'thor@hero.com', 'team': 'Team Marvel', 'total_points': 40,
+        }, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.client.post(reverse('user-list'), {
+            'name': 'Flash', 'email': 'flash@hero.com', 'team': 'Team DC', 'total_points': 10,
+        }, format='json')
+        self.assertEqual(self.team('Team Marvel'), {'member_count': 1, 'total_points': 40})
+        self.assertEqual(self.entry(type='team', name='Team Marvel')['rank'], 1)
+
+        url = reverse('user-detail', args=[response.data['_id']])
+        response = self.client.patch(url, {'team': 'Team DC'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.team('Team Marvel'), {'member_count': 0, 'total_points': 0})
+        self.assertEqual(self.team('Team DC'), {'member_count': 2, 'total_points': 50})
+        self.assertEqual(self.entry(type='user', email='thor@hero.com')['team'], 'Team DC')
+        self.assertEqual(self.entry(type='team', name='Team DC')['rank'], 1)
+
+        self.assertEqual(self.client.delete(url).status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(self.team('Team DC'), {'member_count': 1, 'total_points': 10})
+        self.assertIsNone(self.entry(type='user', email='thor@hero.com'))
+        self.assertEqual(self.entry(type='user', email='flash@hero.com')['rank'], 1)
+        self.assertEqual(list(leaderboard.team_drift()), [])
+
+    def test_repair_fixes_drift(self):
+        User.objects.create(name='Thor', email='thor@hero.com', team='Team Marvel', total_points=40)
+        drift = list(leaderboard.team_drift())
+        self.assertEqual(drift, [
+            ('Team Marvel', {'member_count': 0, 'total_points': 0}, {'member_count': 1, 'total_points': 40}),
+        ])
+        self.assertEqual(leaderboard.repair_teams(drift), 1)
+        self.assertEqual(self.team('Team Marvel'), {'member_count': 1, 'total_points': 40})
+        self.assertEqual(list(leaderboard.team_drift()), [])
+
+
+class LeaderboardAroundTest(APITestCase):
+    def setUp(self):
+        cache.invalidate_all()
+        for number, points in enumerate((50, 40, 40, 40, 30, 20), start=1):
+            User.objects.create(name=f'Hero {number}', email=f'hero{number}@hero.com',
+                                team='Team Marvel', total_points=points)
+        Team.objects.create(name='Team Marvel', description='Marvel', total_points=220)
+        leaderboard.rebuild()
+
+    def around(self, **params):
+        return self.client.get(reverse('leaderboard-around'), params)
+
+    def test_neighbours_in_board_order(self):
+        response = self.around(email='hero3@hero.com', size=1)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        board = self.client.get(reverse('leaderboard-list'), {'type': 'user'}).data['results']
+        emails = [entry['email'] for entry in board]
+        middle = emails.index('hero3@hero.com')
+        self.assertEqual([entry['email'] for entry in response.data], emails[middle - 1:middle + 2])
+        self.assertEqual([entry['rank'] for entry in response.data], [2, 2, 2])
+
+    def test_edges_and_teams(self):
+        response = self.around(email='hero1@hero.com', size=2, fields='email,rank')
+        self.assertEqual(response.data[0], {'email': 'hero1@hero.com', 'rank': 1})
+        self.assertEqual(len(response.data), 3)
+        response = self.around(team='Team Marvel')
+        self.assertEqual([entry['name'] for entry in response.data], ['Team Marvel'])
+
+    def test_bad_requests(self):
+        self.assertEqual(self.around().status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.around(email='hero1@hero.com', size=500).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.around(email='nobody@hero.com').status_code, status.HTTP_404_NOT_FOUND)
+
+
+class BatchEndpointTest(APITestCase):
+    def setUp(self):
+        cache.invalidate_all()
+        for number in range(1, 4):
+            User.objects.create(name=f'Hero {number}', email=f'hero{number}@hero.com',
+                                team='Team Marvel', total_points=number * 10)
+        Team.objects.create(name='Team Marvel', description='Marvel', total_points=60, member_count=3)
+        for day in range(1, 4):
+            Activity.objects.create(user_email='hero1@hero.com', activity_type='Running', duration=30,
+                                    calories=300, points=10, date=datetime(2024, 1, day, tzinfo=dt_timezone.utc))
+        leaderboard.rebuild()
+
+    def test_parts_match_their_endpoints(self):
+        response = self.client.get(reverse('batch'), {'include': 'users,teams,leaderboard:top2,activities:recent1'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['users'], self.client.get(reverse('user-list')).data['results'])
+        self.assertEqual([team['name'] for team in response.data['teams']], ['Team Marvel'])
+        top = self.client.get(reverse('leaderboard-top'), {'limit': 2}).data
+        self.assertEqual(response.data['leaderboard:top2'], top)
+        self.assertEqual(response.data['activities:recent1'],
+                         self.client.get(reverse('activity-list'), {'page_size': 1}).data['results'])
+
+    def test_parts_are_cached_until_a_write(self):
+        self.client.get(reverse('batch'), {'include': 'teams'})
+        before = cache.cache_stats()['teams']['hits']
+        self.client.get(reverse('batch'), {'include': 'teams'})
+        self.assertEqual(cache.cache_stats()['teams']['hits'], before + 1)
+        self.client.post(reverse('user-list'), {
+            'name': 'Hero 4', 'email': 'hero4@hero.com', 'team': 'Team Marvel', 'total_points': 5,
+        }, format='json')
+        response = self.client.get(reverse('batch'), {'include': 'teams'})
+        self.assertEqual(response.data['teams'][0]['member_count'], 4)
+
+    def test_rejects_unknown_parts_and_limits(self):
+        for include in ('', 'planets', 'leaderboard:recent5', 'leaderboard:top1000'):
+            response = self.client.get(reverse('batch'), {'include': include})
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, include)
+
+
+class ActivityFilterTest(APITestCase):
+    def setUp(self):
+        cache.invalidate_all()
+        indexes.sync(get_db())
+        for day, (email, activity_type, points) in enumerate((
+            ('ana@hero.com', 'Running', 10),
+            ('ana@hero.com', 'Cycling', 40),
+            ('bo@hero.com', 'Running', 30),
+            ('ana@hero.com', 'Running', 20),
+        ), start=1):
+            Activity.objects.create(user_email=email, activity_type=activity_type, duration=30, calories=300,
+                                    points=points, date=datetime(2024, 1, day, 8, tzinfo=dt_timezone.utc))
+
+    def points(self, **params):
+        response = self.client.get(reverse('activity-list'), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [activity['points'] for activity in response.data['results']]
+
+    def test_filters_and_ordering(self):
+        self.assertEqual(self.points(user_email='ana@hero.com'), [20, 40, 10])
+        self.assertEqual(self.points(activity_type='Running', ordering='points'), [10, 20, 30])
+        self.assertEqual(self.points(date__gte='2024-01-02', date__lte='2024-01-03'), [30, 40])
+        self.assertEqual(self.points(min_points=25, ordering='-points'), [40, 30])
+
+    def test_native_and_orm_lists_agree(self):
+        from .views import ActivityViewSet
+        params = {'user_email': 'ana@hero.com', 'min_points': 15, 'ordering': 'date'}
+        native = self.points(**params)
+        ActivityViewSet.native_list = False
+        try:
+            cache.invalidate_all()
+            self.assertEqual(self.points(**params), native)
+        finally:
+            del ActivityViewSet.native_list
+
+    def test_invalid_params_are_rejected(self):
+        for params in ({'ordering': 'notes'}, {'min_points': 'many'}, {'date__gte': 'soon'}):
+            response = self.client.get(reverse('activity-list'), params)
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, params)
+
+    def test_filtered_queries_use_an_index(self):
+        for params in (
+            {'user_email': 'ana@hero.com'},
+            {'user_email': 'ana@hero.com', 'ordering': 'date', 'min_points': '5'},
+            {'activity_type': 'Running', 'date__gte': '2024-01-01'},
+            {'date__gte': '2024-01-01', 'date__lte': '2024-01-31'},
+            {'min_points': '20', 'ordering': '-points'},
+        ):
+            query = filters.mongo_query(filters.activity_filters(params))
+            sort = mongo_sort(filters.activity_ordering(params))
+            stages = [stage for stage, _ in indexes.winning_plan(
+                get_db().activities, indexes.ServedQuery('activity list', query, sort),
+            )]
+            self.assertIn('IXSCAN', stages, params)
+            self.assertNotIn('COLLSCAN', stages, params)
+
+
+class BinaryFormatTest(SimpleTestCase):
+    document = {
+        '_id': ObjectId('65a000000000000000000001'),
+        'date': datetime(2024, 1, 1, 8, tzinfo=dt_timezone.utc),
+        'points': 10,
+        'tags': ['run', None],
+    }
+
+    def round_trip(self, renderer, parser):
+        body = renderer.render(self.document)
+        return parser.parse(io.BytesIO(body), parser.media_type, {})
+
+    @skipUnless(MessagePackParser.available, 'msgpack is not installed')
+    def test_msgpack_round_trip(self):
+        self.assertEqual(self.round_trip(MessagePackRenderer(), MessagePackParser()), self.document)
+        with self.assertRaises(ParseError):
+            MessagePackParser().parse(io.BytesIO(b'\xc1'))
+
+    @skipUnless(CBORParser.available, 'cbor2 is not installed')
+    def test_cbor_round_trip(self):
+        self.assertEqual(self.round_trip(CBORRenderer(), CBORParser()), self.document)
+
+
+class WriteQueueTest(SimpleTestCase):
+    def test_flushes_on_size_and_time(self):
+        batches = []
+        queue = writequeue.WriteQueue('test', batches.append, max_size=10, batch_size=3, flush_interval=0.05)
+        queue.put([1, 2, 3, 4])
+        self.assertTrue(queue.join(timeout=5))
+        self.assertEqual(batches, [[1, 2, 3], [4]])
+        queue.close()
+
+    def test_backpressure_and_close(self):
+        release = threading.Event()
+        written = []
+
+        def write(batch):
+            release.wait(5)
+            written.extend(batch)
+
+        queue = writequeue.WriteQueue('test', write, max_size=2, batch_size=10, flush_interval=60)
+        queue.put([1, 2])
+        with self.assertRaises(writequeue.QueueFull):
+            queue.put([3])
+        release.set()
+        queue.close(timeout=5)
+        self.assertEqual(written, [1, 2])
+        with self.assertRaises(writequeue.QueueClosed):
+            queue.put([4])
+        self.assertEqual(queue.counts['rejected'], 2)
+
+    def test_failed_batches_are_dead_lettered(self):
+        dead = []
+
+        def write(batch):
+            raise RuntimeError('down')
+
+        queue = writequeue.WriteQueue('test', write, max_size=10, batch_size=2, flush_interval=0.05,
+                                      dead_letter=lambda batch, error: dead.append((batch, str(error))))
+        queue.put([1, 2, 3])
+        self.assertTrue(queue.join(timeout=5))
+        queue.close()
+        self.assertEqual(dead, [([1, 2], 'down'), ([3], 'down')])
+        self.assertEqual(queue.counts['dropped'], 3)
+
+
+@override_settings(ACTIVITY_WRITE_QUEUE={'ENABLED': True, 'BATCH_SIZE': 10, 'FLUSH_INTERVAL': 0.05})
+class AsyncActivityCreateTest(APITestCase):
+    def setUp(self):
+        User.objects.create(name='Queue Hero', email='queue@hero.com', team='Team Marvel', total_points=0)
+        self.queue = writequeue.activity_queue()
+
+    def post(self, **headers):
+        return self.client.post(reverse('activity-list'), {
+            'user_email': 'queue@hero.com',
+            'activity_type': 'Running',
+            'duration': 30,
+            'calories': 300,
+            'points': 5,
+            'date': '2024-01-01T08:00:00Z',
+        }, format='json', **headers)
+
+    def test_respond_async_is_queued_and_merged(self):
+        responses = [self.post(HTTP_PREFER='respond-async') for _ in range(12)]
+        self.assertEqual({response.status_code for response in responses}, {status.HTTP_202_ACCEPTED})
+        self.assertEqual(responses[0]['Preference-Applied'], 'respond-async')
+        self.assertTrue(self.queue.join(timeout=5))
+        self.assertEqual(Activity.objects.filter(user_email='queue@hero.com').count(), 12)
+        self.assertEqual(User.objects.get(email='queue@hero.com').total_points, 60)
+        self.assertIn('octofit_write_queue_depth{queue="activities"} 0', metrics.exposition())
+
+    def test_without_preference_writes_synchronously(self):
+        self.assertEqual(self.post().status_code, status.HTTP_201_CREATED)
+
+    def test_unwritable_batch_is_dead_lettered(self):
+        dropped = self.queue.counts['dropped']
+        with self.settings(ACTIVITY_WRITE_QUEUE={'ENABLED': True, 'RETRIES': 0}), \
+                mock.patch.object(writequeue, 'insert_documents', side_effect=AutoReconnect('down')):
+            response = self.post(HTTP_PREFER='respond-async')
+            self.assertTrue(self.queue.join(timeout=5))
+        self.assertEqual(self.queue.counts['dropped'], dropped + 1)
+        entry = get_db()[writequeue.DEAD_LETTER_COLLECTION].find_one({'_id': ObjectId(response.data['_id'])})
+        self.assertEqual((entry['document']['user_email'], entry['error']), ('queue@hero.com', 'down'))
+        self.assertFalse(Activity.objects.filter(user_email='queue@hero.com').exists())
+
+    def test_failed_documents_and_effects_are_dead_lettered_apart(self):
+        dead = get_db()[writequeue.DEAD_LETTER_COLLECTION]
+        stored = {'_id': ObjectId(), 'user_email': 'queue@hero.com', 'activity_type': 'Running', 'duration': 30,
+                  'calories': 300, 'points': 5, 'date': datetime(2024, 1, 1, tzinfo=dt_timezone.utc), 'notes': ''}
+        get_db().activities.insert_one(dict(stored))
+        duplicate, fresh = dict(stored), dict(stored, _id=ObjectId())
+        self.assertEqual(writequeue.write_activities([duplicate, fresh], retries=0), 1)
+        self.assertEqual(dead.find_one({'_id': duplicate['_id']})['stage'], writequeue.INSERT)
+        self.assertIsNone(dead.find_one({'_id': fresh['_id']}))
+
+        late = dict(stored, _id=ObjectId())
+        with mock.patch.object(writequeue, 'activities_changed', side_effect=AutoReconnect('down')):
+            self.assertEqual(writequeue.write_activities([late], retries=0), 0)
+        self.assertIsNotNone(get_db().activities.find_one({'_id': late['_id']}))
+        self.assertEqual(dead.find_one({'_id': late['_id']})['stage'], writequeue.EFFECTS)
+
+
+@mock.patch.object(routing, 'replica_configured', return_value=True)
+class ReadRoutingTest(SimpleTestCase):
+    def route(self, request):
+        seen = {}
+
+        def get_response(request):
+            seen['activities'] = routing.read_alias('activities')
+            seen['users'] = routing.read_alias('users')
+            seen['workouts'] = routing.ReadPreferenceRouter().db_for_read(Workout)
+            return HttpResponse()
+
+        response = ReadRoutingMiddleware(get_response)(request)
+        return seen, response
+
+    def test_safe_reads_of_routed_collections_use_the_replica(self, configured):
+        seen, response = self.route(RequestFactory().get('/api/activities/'))
+        self.assertEqual(seen, {'activities': routing.REPLICA, 'users': routing.PRIMARY, 'workouts': routing.REPLICA})
+        self.assertNotIn(routing.PIN_COOKIE, response.cookies)
+        self.assertEqual(routing.read_alias('activities'), routing.PRIMARY)
+        self.assertEqual(routing.ReadPreferenceRouter().db_for_write(Activity), routing.PRIMARY)
+
+    def test_writes_pin_the_client_to_the_primary(self, configured):
+        seen, response = self.route(RequestFactory().post('/api/activities/'))
+        self.assertEqual(seen['activities'], routing.PRIMARY)
+        cookie = response.cookies[routing.PIN_COOKIE]
+        self.assertEqual(cookie['max-age'], settings.READ_YOUR_WRITES_SECONDS)
+
+        request = RequestFactory().get('/api/activities/')
+        request.COOKIES[routing.PIN_COOKIE] = cookie.value
+        seen, response = self.route(request)
+        self.assertEqual(seen['activities'], routing.PRIMARY)
+
+    def test_cross_origin_clients_pin_with_the_header(self, configured):
+        seen, response = self.route(RequestFactory().patch('/users/1/'))
+        until = response[routing.PIN_HEADER]
+        seen, response = self.route(RequestFactory().get('/leaderboard/', HTTP_READ_YOUR_WRITES_UNTIL=until))
+        self.assertEqual(seen['activities'], routing.PRIMARY)
+        # The root mount is routed too, and an expired or forged pin is ignored
+        for value in ('', '0', str(int(until) + 3600)):
+            seen, response = self.route(RequestFactory().get('/leaderboard/', HTTP_READ_YOUR_WRITES_UNTIL=value))
+            self.assertEqual(seen['activities'], routing.REPLICA)
+
+    def test_replica_reads_are_cached_apart(self, configured):
+        self.assertEqual(routing.cache_variant('activities'), '')
+        token = routing.allow_replica_reads()
+        try:
+            self.assertTrue(routing.cache_variant('activities').startswith(f'{routing.REPLICA}:'))
+            self.assertEqual(routing.cache_variant('users'), '')
+        finally:
+            routing.reset_replica_reads(token)
@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
-from . import views
+from . import async_views, views
 import os
 
 router = DefaultRouter()
@@ -11,6 +11,7 @@ router.register(r'teams', views.TeamViewSet, basename='team')
 router.register(r'activities', views.ActivityViewSet, basename='activity')
 router.register(r'leaderboard', views.LeaderboardViewSet, basename='leaderboard')
 router.register(r'workouts', views.WorkoutViewSet, basename='workout')
+router.register(r'stats', views.StatsViewSet, basename='stats')
 
 
 @api_view(['GET'])
@@ -31,10 +32,19 @@ def api_root(request, format=None):
         'activities': f'{base_url}/activities/',
         'leaderboard': f'{base_url}/leaderboard/',
         'workouts': f'{base_url}/workouts/',
+        'stats': f'{base_url}/stats/',
+        'batch': f'{base_url}/batch/',
     })
 
 
 urlpatterns = [
     path('', api_root, name='api-root'),
+    path('_cache/', views.cache_stats, name='cache-stats'),
+    path('_metrics', views.metrics_view, name='metrics'),
+    path('batch/', views.batch_view, name='batch'),
+    path('async/leaderboard/', async_views.leaderboard_list, name='async-leaderboard'),
+    path('async/activities/', async_views.activity_list, name='async-activities'),
+    path('async/stats/', async_views.stats_view, name='async-stats'),
+    path('async/stats/<str:breakdown>/', async_views.stats_view, name='async-stats-breakdown'),
     path('', include(router.urls)),
 ]
@@ -1,8 +1,26 @@
+from collections.abc import Iterator
+from bson import ObjectId
+from django.http import HttpResponse, StreamingHttpResponse
 from rest_framework import viewsets, status
-from rest_framework.decorators import api_view
+from rest_framework.decorators import action, api_view
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 from rest_framework.reverse import reverse
+from . import batch, cache, filters, leaderboard, metrics, repository, stats, writequeue
+from .cache import CachedResponseMixin
+from .conditional import ConditionalGetMixin
+from .effects import activities_changed, activity_snapshot, user_snapshot, users_changed
+from .export import activity_rows, export_fields
+from .fieldsets import SparseFieldsMixin
+from .ingest import ingest_activities
+from .lookups import ObjectIdLookupMixin
 from .models import User, Team, Activity, Leaderboard, Workout
+from .pagination import ActivityPagination, LeaderboardPagination, UserPagination
+from .parsers import BINARY_PARSERS, NDJSONParser
+from .renderers import CSVRenderer, NDJSONRenderer
+from .repository import NativeListMixin, WindowedLeaderboardMixin
+from .representation import FastListMixin, compile_representation
 from .serializers import (
     UserSerializer,
     TeamSerializer,
@@ -23,19 +41,82 @@ def api_root(request, format=None):
         'activities': reverse('activity-list', request=request, format=format),
         'leaderboard': reverse('leaderboard-list', request=request, format=format),
         'workouts': reverse('workout-list', request=request, format=format),
+        'stats': reverse('stats-list', request=request, format=format),
     })
 
 
-class UserViewSet(viewsets.ModelViewSet):
+@api_view(['GET'])
+def cache_stats(request, format=None):
+    """
+    Response cache hit and miss counters per collection
+    """
+    return Response(cache.cache_stats())
+
+
+def metrics_view(request):
+    """
+    Request timing histograms and cache counters in Prometheus text format
+    """
+    return HttpResponse(metrics.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@api_view(['GET'])
+def batch_view(request):
+    """
+    Several resources in one response: ``?include=users,teams,leaderboard:top10,activities:recent20``.
+    Parts are read concurrently and each is cached like the list endpoints.
+    """
+    parsed = batch.parse(request.query_params.get('include', ''))
+    return Response(batch.read(parsed))
+
+
+def prefers_async(request):
+    """
+    Whether the request's Prefer header (RFC 7240) asks for respond-async.
+    """
+    preferences = request.headers.get('Prefer', '').split(',')
+    return any(p.split(';')[0].strip().lower() == 'respond-async' for p in preferences)
+
+
+class UserViewSet(ObjectIdLookupMixin, ConditionalGetMixin, SparseFieldsMixin, NativeListMixin, FastListMixin,
+                  viewsets.ModelViewSet):
     """
     API endpoint for users
     """
     queryset = User.objects.all()
     serializer_class = UserSerializer
     lookup_field = '_id'
+    pagination_class = UserPagination
 
+    def perform_create(self, serializer):
+        user = serializer.save()
+        users_changed(added=[user_snapshot(user)])
 
-class TeamViewSet(viewsets.ModelViewSet):
+    def perform_update(self, serializer):
+        previous = user_snapshot(serializer.instance)
+        user = serializer.save()
+        users_changed(added=[user_snapshot(user)], removed=[previous])
+
+    def perform_destroy(self, instance):
+        previous = user_snapshot(instance)
+        instance.delete()
+        users_changed(removed=[previous])
+
+    @action(detail=False, url_path='by-email')
+    def by_email(self, request):
+        """
+        Look a user up by ``email``.
+        """
+        email = request.query_params.get('email')
+        if not email:
+            raise ValidationError({'email': ['This query parameter is required.']})
+        user = repository.user_by_email(email, self.get_requested_fields())
+        if user is None:
+            raise NotFound()
+        return Response(user)
+
+
+class TeamViewSet(ObjectIdLookupMixin, ConditionalGetMixin, SparseFieldsMixin, FastListMixin, viewsets.ModelViewSet):
     """
     API endpoint for teams
     """
@@ -44,28 +125,214 @@ class TeamViewSet(viewsets.ModelViewSet):
     lookup_field = '_id'
 
 
-class ActivityViewSet(viewsets.ModelViewSet):
+class ActivityViewSet(ObjectIdLookupMixin, ConditionalGetMixin, SparseFieldsMixin, NativeListMixin, FastListMixin,
+                      viewsets.ModelViewSet):
     """
     API endpoint for activities
+
+    Lists take ``user_email``, ``activity_type``, ``date__gte``,
+    ``date__lte`` and ``min_points`` filters and an ``ordering`` of
+    ``-date`` (the default), ``date``, ``-points`` or ``points``.
     """
     queryset = Activity.objects.all()
     serializer_class = ActivitySerializer
     lookup_field = '_id'
+    pagination_class = ActivityPagination
+
+    def create(self, request, *args, **kwargs):
+        """
+        With the write queue enabled, a create sent with ``Prefer:
+        respond-async`` is validated, queued and acknowledged with 202; the
+        activity is written with the next batch, or kept in the dead-letter
+        collection if it cannot be.
+        """
+        if not writequeue.enabled() or not prefers_async(request):
+            return super().create(request, *args, **kwargs)
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        document = dict(serializer.validated_data, _id=ObjectId())
+        document.setdefault('notes', '')
+        try:
+            writequeue.activity_queue().put([document])
+        except writequeue.QueueFull:
+            return Response({'detail': 'Too many queued activities, retry shortly.'},
+                            status=status.HTTP_429_TOO_MANY_REQUESTS, headers={'Retry-After': '1'})
+        except writequeue.QueueClosed:
+            return Response({'detail': 'Shutting down, retry shortly.'},
+                            status=status.HTTP_503_SERVICE_UNAVAILABLE, headers={'Retry-After': '5'})
+        data = compile_representation(ActivitySerializer, documents=True)(document)
+        return Response(data, status=status.HTTP_202_ACCEPTED,
+                        headers={'Preference-Applied': 'respond-async'})
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'list':
+            queryset = queryset.filter(**filters.activity_filters(self.request.query_params))
+        return queryset
 
-class LeaderboardViewSet(viewsets.ModelViewSet):
+    def get_native_query(self):
+        return filters.mongo_query(filters.activity_filters(self.request.query_params))
+
+    def list(self, request, *args, **kwargs):
+        self.paginator.ordering = filters.activity_ordering(request.query_params)
+        return super().list(request, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        activity = serializer.save()
+        activities_changed(added=[activity_snapshot(activity)])
+
+    def perform_update(self, serializer):
+        previous = activity_snapshot(serializer.instance)
+        activity = serializer.save()
+        activities_changed(added=[activity_snapshot(activity)], removed=[previous])
+
+    def perform_destroy(self, instance):
+        previous = activity_snapshot(instance)
+        instance.delete()
+        activities_changed(removed=[previous])
+
+    @action(detail=False, methods=['post'], parser_classes=[JSONParser, NDJSONParser, *BINARY_PARSERS])
+    def bulk(self, request):
+        """
+        Ingest many activities from a JSON array, a streamed NDJSON body or a
+        MessagePack / CBOR array.
+        """
+        rows = request.data
+        if not isinstance(rows, (list, Iterator)):
+            raise ValidationError({'non_field_errors': ['Expected a list of activities.']})
+        inserted, errors = ingest_activities(rows)
+        if not errors:
+            response_status = status.HTTP_201_CREATED
+        elif inserted:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_400_BAD_REQUEST
+        return Response({'inserted': inserted, 'errors': errors}, status=response_status)
+
+    @action(detail=False, renderer_classes=[CSVRenderer, NDJSONRenderer])
+    def export(self, request):
+        """
+        Stream activities as CSV or NDJSON, optionally bounded by from/to.
+        """
+        match = stats.date_range_match(request.query_params)
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(export_fields(), activity_rows(match)),
+            content_type=f'{renderer.media_type}; charset={renderer.charset}',
+        )
+        response['Content-Disposition'] = f'attachment; filename="activities.{renderer.format}"'
+        return response
+
+
+class LeaderboardViewSet(ObjectIdLookupMixin, ConditionalGetMixin, CachedResponseMixin, SparseFieldsMixin,
+                         WindowedLeaderboardMixin, NativeListMixin, FastListMixin, viewsets.ModelViewSet):
     """
     API endpoint for leaderboard
+
+    ``?window=day|week|month`` ranks the current period from the activity
+    rollups; ``?type=user|team`` picks one board. ``around/`` returns the
+    slice of a board around one user or team.
     """
     queryset = Leaderboard.objects.all()
     serializer_class = LeaderboardSerializer
     lookup_field = '_id'
+    pagination_class = LeaderboardPagination
+    top_default_limit = 10
+    top_max_limit = 100
+    around_default_size = 5
+    around_max_size = 50
+
+    def get_cache_variant(self, request):
+        # A windowed board changes when its period rolls over, with no write
+        window = self.get_window() if self.action == 'list' else leaderboard.ALL_TIME
+        if window == leaderboard.ALL_TIME:
+            return super().get_cache_variant(request)
+        return leaderboard.window_start(window).isoformat()
+
+    @action(detail=False)
+    def top(self, request):
+        """
+        The best ``limit`` entries, optionally of one ``type`` (user or team).
+        """
+        return self.cached_response(self.top_entries, request)
+
+    def top_entries(self, request):
+        entry_type = self.get_entry_type()
+        try:
+            limit = int(request.query_params.get('limit', self.top_default_limit))
+        except ValueError:
+            limit = 0
+        if not 1 <= limit <= self.top_max_limit:
+            raise ValidationError({'limit': [f'Expected an integer from 1 to {self.top_max_limit}.']})
+        return Response(repository.leaderboard_top(entry_type, limit, self.get_requested_fields()))
 
+    @action(detail=False)
+    def around(self, request):
+        """
+        The entry for a user ``email`` or a ``team`` name with up to ``size``
+        entries above and below it.
+        """
+        return self.cached_response(self.around_entries, request)
 
-class WorkoutViewSet(viewsets.ModelViewSet):
+    def around_entries(self, request):
+        email, team = request.query_params.get('email'), request.query_params.get('team')
+        if bool(email) == bool(team):
+            raise ValidationError({'non_field_errors': ['Expected exactly one of email or team.']})
+        try:
+            size = int(request.query_params.get('size', self.around_default_size))
+        except ValueError:
+            size = -1
+        if not 0 <= size <= self.around_max_size:
+            raise ValidationError({'size': [f'Expected an integer from 0 to {self.around_max_size}.']})
+        if email:
+            entry_type, key = leaderboard.USER, {'email': email}
+        else:
+            entry_type, key = leaderboard.TEAM, {'name': team}
+        entries = repository.leaderboard_around(entry_type, key, size, self.get_requested_fields())
+        if entries is None:
+            raise NotFound()
+        return Response(entries)
+
+
+class WorkoutViewSet(ObjectIdLookupMixin, ConditionalGetMixin, CachedResponseMixin, SparseFieldsMixin, FastListMixin,
+                     viewsets.ModelViewSet):
     """
     API endpoint for workouts
     """
     queryset = Workout.objects.all()
     serializer_class = WorkoutSerializer
     lookup_field = '_id'
+
+
+class StatsViewSet(viewsets.ViewSet):
+    """
+    API endpoint for activity totals, aggregated inside MongoDB
+
+    Every action accepts ``from`` and ``to`` (ISO dates or datetimes) and the
+    breakdowns also accept ``limit``.
+    """
+
+    def get_limit(self, request):
+        return stats.limit_param(request.query_params)
+
+    def list(self, request):
+        match = stats.date_range_match(request.query_params)
+        return Response(stats.overall(match))
+
+    @action(detail=False)
+    def users(self, request):
+        match = stats.date_range_match(request.query_params)
+        pipeline = stats.user_pipeline(match, self.get_limit(request))
+        return Response(stats.aggregate(pipeline))
+
+    @action(detail=False)
+    def teams(self, request):
+        match = stats.date_range_match(request.query_params)
+        pipeline = stats.team_pipeline(match, self.get_limit(request))
+        return Response(stats.aggregate(pipeline))
+
+    @action(detail=False, url_path='activity-types')
+    def activity_types(self, request):
+        match = stats.date_range_match(request.query_params)
+        pipeline = stats.activity_type_pipeline(match, self.get_limit(request))
+        return Response(stats.aggregate(pipeline))
@@ -0,0 +1,298 @@
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter, deque
+
+from bson import json_util
+from django.conf import settings
+from django.utils import timezone
+from pymongo.errors import PyMongoError
+
+from . import metrics
+from .effects import activities_changed, document_snapshot
+from .ingest import insert_documents
+from .mongo import get_db
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'ENABLED': False,
+    'MAX_SIZE': 10000,
+    'BATCH_SIZE': 500,
+    'FLUSH_INTERVAL': 0.25,
+    'RETRIES': 3,
+}
+DEAD_LETTER_COLLECTION = 'activity_dead_letters'
+# Dead-letter stages: the activity was never stored, or it was stored but its
+# derived updates (points, ranks, rollups) were not applied
+INSERT = 'insert'
+EFFECTS = 'effects'
+
+
+class QueueFull(Exception):
+    pass
+
+
+class QueueClosed(Exception):
+    pass
+
+
+class WriteQueue:
+    """
+    A bounded in-process queue drained by one background flusher thread.
+
+    The flusher hands ``write`` a batch once ``batch_size`` items are waiting
+    or the oldest has waited ``flush_interval`` seconds, whichever comes
+    first. ``put`` never blocks: it raises QueueFull rather than let the
+    queue grow past ``max_size``, and QueueClosed once close() has begun.
+
+    ``write`` returns how many items of the batch it could not write (and
+    kept aside itself), if any. A batch it raises on is handed to
+    ``dead_letter`` with the error, so items already acknowledged are kept
+    somewhere they can be replayed.
+    """
+
+    def __init__(self, name, write, max_size, batch_size, flush_interval, dead_letter=None):
+        self.name = name
+        self.write = write
+        self.dead_letter = dead_letter
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.counts = Counter()
+        self._items = deque()
+        self._in_flight = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._thread = None
+        self._pid = None
+
+    def depth(self):
+        with self._condition:
+            return len(self._items) + self._in_flight
+
+    def put(self, items):
+        with self._condition:
+            if self._closed:
+                self.counts['rejected'] += len(items)
+                raise QueueClosed()
+            if len(self._items) + self._in_flight + len(items) > self.max_size:
+                self.counts['rejected'] += len(items)
+                raise QueueFull()
+            self._start()
+            now = time.monotonic()
+            self._items.extend((now, item) for item in items)
+            self.counts['accepted'] += len(items)
+            self._condition.notify()
+
+    def _start(self):
+        if self._pid != os.getpid():
+            # A forked child inherits the parent's items but not its thread;
+            # the parent still owns and flushes those items
+            self._items.clear()
+            self._in_flight = 0
+            self._thread = None
+            self._pid = os.getpid()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f'{self.name}-flusher', daemon=True)
+            self._thread.start()
+
+    def _next_batch(self):
+        with self._condition:
+            while True:
+                if self._items:
+                    wait = self._items[0][0] + self.flush_interval - time.monotonic()
+                    if self._closed or len(self._items) >= self.batch_size or wait <= 0:
+                        break
+                elif self._closed:
+                    return None
+                else:
+                    wait = None
+                self._condition.wait(wait)
+            size = min(self.batch_size, len(self._items))
+            batch = [self._items.popleft()[1] for _ in range(size)]
+            self._in_flight = size
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            started = time.perf_counter()
+            try:
+                dropped = self.write(batch) or 0
+            except Exception as exc:
+                dropped = len(batch)
+                logger.exception('%s: failed to write a batch of %d', self.name, len(batch))
+                if self.dead_letter is not None:
+                    try:
+                        self.dead_letter(batch, exc)
+                    except Exception:
+                        logger.exception('%s: failed to dead-letter a batch of %d', self.name, len(batch))
+            outcome = 'dropped' if dropped else 'written'
+            metrics.WRITE_QUEUE_FLUSH_SECONDS.observe((self.name, outcome), time.perf_counter() - started)
+            metrics.WRITE_QUEUE_BATCH_SIZE.observe((self.name,), len(batch))
+            with self._condition:
+                self.counts['written'] += len(batch) - dropped
+                self.counts['dropped'] += dropped
+                self._in_flight = 0
+                self._condition.notify_all()
+
+    def join(self, timeout=None):
+        """
+        Wait until every queued item has been written. Returns False on
+        timeout.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._items or self._in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition.wait(remaining)
+            return True
+
+    def close(self, timeout=None):
+        """
+        Stop accepting items and write everything already queued, without
+        waiting for the size or time threshold.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+            thread = self._thread if self._pid == os.getpid() else None
+        if thread is not None:
+            thread.join(timeout)
+
+    def exposition(self):
+        with self._condition:
+            depth = len(self._items) + self._in_flight
+            counts = dict(self.counts)
+        lines = [
+            '# HELP octofit_write_queue_depth Items waiting to be written.',
+            '# TYPE octofit_write_queue_depth gauge',
+            f'octofit_write_queue_depth{{queue="{self.name}"}} {depth}',
+            '# HELP octofit_write_queue_items_total Items by outcome: accepted, rejected, written or dropped.',
+            '# TYPE octofit_write_queue_items_total counter',
+        ]
+        lines.extend(
+            f'octofit_write_queue_items_total{{queue="{self.name}",outcome="{outcome}"}} {counts.get(outcome, 0)}'
+            for outcome in ('accepted', 'rejected', 'written', 'dropped')
+        )
+        return lines
+
+
+def write_activities(documents, retries=None, db=None):
+    """
+    Insert a batch of validated activity documents and apply their derived
+    updates once for the whole batch, so each user's points, leaderboard
+    entries and rollup buckets are written once however many of the user's
+    activities the batch holds.
+
+    Documents carry their own _id, so a write retried after a network error
+    skips the ones that already made it. Documents that still cannot be
+    inserted are dead-lettered at the INSERT stage and the rest of the batch
+    goes ahead. If the derived updates fail, the activities are already
+    stored, so they are dead-lettered at the EFFECTS stage instead, marking
+    derived data to recompute (backfill_rollups, check_leaderboard) rather
+    than activities to replay.
+
+    Returns the number of documents that were not inserted.
+    """
+    if db is None:
+        db = get_db()
+    if retries is None:
+        retries = _config()['RETRIES']
+    pending, inserted, failed = list(documents), [], []
+    for attempt in range(retries + 1):
+        try:
+            if attempt:
+                ids = [document['_id'] for document in pending]
+                existing = {d['_id'] for d in db.activities.find({'_id': {'$in': ids}}, {'_id': 1})}
+                inserted.extend(document_snapshot(d) for d in pending if d['_id'] in existing)
+                pending = [d for d in pending if d['_id'] not in existing]
+            added, errors = insert_documents(pending, db) if pending else ([], {})
+        except PyMongoError as exc:
+            if attempt == retries:
+                failed.extend((document, str(exc)) for document in pending)
+                break
+            time.sleep(0.1 * 2 ** attempt)
+            continue
+        inserted.extend(added)
+        failed.extend((pending[position], message) for position, message in errors.items())
+        break
+
+    if failed:
+        for document, message in failed:
+            logger.error('activities: could not write %s: %s', document['_id'], message)
+        _dead_letter(failed, INSERT, db)
+    try:
+        activities_changed(added=inserted, db=db)
+    except Exception as exc:
+        logger.exception('activities: derived updates failed for %d written activities', len(inserted))
+        failed_ids = {document['_id'] for document, _ in failed}
+        written = [document for document in documents if document['_id'] not in failed_ids]
+        _dead_letter([(document, str(exc)) for document in written], EFFECTS, db)
+    return len(failed)
+
+
+def dead_letter_activities(documents, error, db=None):
+    """
+    Keep activity documents that could not be written in the dead-letter
+    collection, with the error, for inspection and replay.
+    """
+    _dead_letter([(document, str(error)) for document in documents], INSERT, db)
+
+
+def _dead_letter(entries, stage, db=None):
+    """
+    Store (document, error message) pairs in the dead-letter collection at
+    ``stage``. When MongoDB cannot take them either, they are logged instead.
+    """
+    if db is None:
+        db = get_db()
+    failed_at = timezone.now()
+    documents = [
+        {'_id': document['_id'], 'stage': stage, 'document': document, 'error': message, 'failed_at': failed_at}
+        for document, message in entries
+    ]
+    try:
+        db[DEAD_LETTER_COLLECTION].insert_many(documents, ordered=False)
+    except PyMongoError:
+        logger.error('activities: could not dead-letter %d documents (%s): %s',
+                     len(entries), stage, json_util.dumps([document for document, _ in entries]))
+
+
+def _config():
+    return dict(DEFAULTS, **getattr(settings, 'ACTIVITY_WRITE_QUEUE', {}))
+
+
+def enabled():
+    return _config()['ENABLED']
+
+
+_activities = None
+_lock = threading.Lock()
+
+
+def activity_queue():
+    """
+    The process-wide activity write queue, configured from
+    settings.ACTIVITY_WRITE_QUEUE and flushed at interpreter exit.
+    """
+    global _activities
+    if _activities is None:
+        with _lock:
+            if _activities is None:
+                config = _config()
+                _activities = WriteQueue(
+                    'activities', write_activities,
+                    config['MAX_SIZE'], config['BATCH_SIZE'], config['FLUSH_INTERVAL'],
+                    dead_letter=dead_letter_activities,
+                )
+                atexit.register(_activities.close)
+                metrics.QUEUES.append(_activities)
+    return _activities
@@ -210,9 +210,8 @@ class Command(BaseCommand):
         # Create unique index on email field
         self.stdout.write('Creating unique index on user email...')
         try:
-            from pymongo import MongoClient
-            client = MongoClient('localhost', 27017)
-            db = client.octofit_db
+            from fitness.mongo import get_db
+            db = get_db()
             db.users.create_index('email', unique=True)
             self.stdout.write(self.style.SUCCESS('Unique index created on email field'))
         except Exception as e:
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 
 from pathlib import Path
+import importlib.util
 import os
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -57,6 +58,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'fitness.middleware.ServerTimingMiddleware',
+    'fitness.middleware.ReadRoutingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -90,18 +93,136 @@ WSGI_APPLICATION = 'octofit_tracker.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# fitness.mongo_backend is djongo on one shared, pooled MongoClient per
+# process; direct pymongo code uses the same client through fitness.mongo.
+# Pool size, timeouts, compression and read/write concerns come from the
+# MONGO_* environment variables.
+
+MONGO_WRITE_CONCERN = os.environ.get('MONGO_WRITE_CONCERN', '1')
+
+MONGO_CLIENT = {
+    'host': os.environ.get('MONGO_HOST', 'localhost'),
+    'port': int(os.environ.get('MONGO_PORT', 27017)),
+    'maxPoolSize': int(os.environ.get('MONGO_MAX_POOL_SIZE', 100)),
+    'minPoolSize': int(os.environ.get('MONGO_MIN_POOL_SIZE', 0)),
+    'waitQueueTimeoutMS': int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 5000)),
+    'readConcernLevel': os.environ.get('MONGO_READ_CONCERN', 'local'),
+    'w': int(MONGO_WRITE_CONCERN) if MONGO_WRITE_CONCERN.isdigit() else MONGO_WRITE_CONCERN,
+}
+if os.environ.get('MONGO_COMPRESSORS'):
+    # e.g. 'zstd,zlib'; zstd and snappy need their optional packages
+    MONGO_CLIENT['compressors'] = os.environ['MONGO_COMPRESSORS']
+
+MONGO_REPLICA_SET = os.environ.get('MONGO_REPLICA_SET')
+if MONGO_REPLICA_SET:
+    MONGO_CLIENT['replicaSet'] = MONGO_REPLICA_SET
+
 DATABASES = {
     'default': {
-        'ENGINE': 'djongo',
+        'ENGINE': 'fitness.mongo_backend',
         'NAME': 'octofit_db',
         'ENFORCE_SCHEMA': False,
-        'CLIENT': {
-            'host': 'localhost',
-            'port': 27017,
-        }
+        'CLIENT': MONGO_CLIENT,
     }
 }
 
+# Read routing
+# With MONGO_REPLICA_SET set, safe API reads of activities, the leaderboard
+# and workouts go to the 'replica' alias: a secondaryPreferred client on the
+# same set. Writes stay on 'default', and a client that has just written
+# reads from the primary for READ_YOUR_WRITES_SECONDS (by a cookie, or by the
+# Read-Your-Writes-Until header the frontend echoes back). A single-host set
+# (mongod --replSet rs0, then rs.initiate()) is enough to try it: with no
+# secondary, secondaryPreferred reads fall back to the primary.
+
+if MONGO_REPLICA_SET:
+    MONGO_REPLICA_CLIENT = dict(MONGO_CLIENT, readPreference='secondaryPreferred')
+    if os.environ.get('MONGO_MAX_STALENESS_SECONDS'):
+        # MongoDB requires at least 90 seconds
+        MONGO_REPLICA_CLIENT['maxStalenessSeconds'] = int(os.environ['MONGO_MAX_STALENESS_SECONDS'])
+    DATABASES['replica'] = dict(
+        DATABASES['default'],
+        CLIENT=MONGO_REPLICA_CLIENT,
+        TEST={'MIRROR': 'default'},
+    )
+
+DATABASE_ROUTERS = ['fitness.routing.ReadPreferenceRouter']
+
+READ_YOUR_WRITES_SECONDS = int(os.environ.get('READ_YOUR_WRITES_SECONDS', 10))
+
+
+# Caches
+# The 'api' cache holds API responses, keyed by collection versions that are
+# kept in MongoDB, so every process sees every write. Set API_CACHE_BACKEND to
+# 'file' or 'redis' (any Redis-compatible server) to share the responses
+# between worker processes; API_CACHE_LOCATION overrides the location.
+
+API_CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'octofit-api'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', '/tmp/octofit-api-cache'),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+}
+API_CACHE_BACKEND, API_CACHE_DEFAULT_LOCATION = API_CACHE_BACKENDS[
+    os.environ.get('API_CACHE_BACKEND', 'locmem')
+]
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'api': {
+        'BACKEND': API_CACHE_BACKEND,
+        'LOCATION': os.environ.get('API_CACHE_LOCATION', API_CACHE_DEFAULT_LOCATION),
+        'TIMEOUT': 300,
+    },
+}
+
+
+# Async read endpoints run their blocking pymongo calls on a thread pool of
+# this size, which also bounds the connections they hold
+
+ASYNC_DB_WORKERS = int(os.environ.get('ASYNC_DB_WORKERS', 16))
+
+
+# Activity write queue: with ENABLED, POST /api/activities/ sent with
+# "Prefer: respond-async" is acknowledged with 202 and written in batches of
+# BATCH_SIZE, or after FLUSH_INTERVAL seconds, by a background thread. A full
+# queue (MAX_SIZE) answers 429. Queued activities are written at shutdown.
+
+ACTIVITY_WRITE_QUEUE = {
+    'ENABLED': os.environ.get('ACTIVITY_WRITE_QUEUE') == '1',
+    'MAX_SIZE': int(os.environ.get('ACTIVITY_WRITE_QUEUE_MAX_SIZE', 10000)),
+    'BATCH_SIZE': int(os.environ.get('ACTIVITY_WRITE_QUEUE_BATCH_SIZE', 500)),
+    'FLUSH_INTERVAL': float(os.environ.get('ACTIVITY_WRITE_QUEUE_FLUSH_INTERVAL', 0.25)),
+}
+
+
+# Django REST framework
+# Keyset pagination keeps deep pages as cheap as the first one on MongoDB.
+# MessagePack and CBOR are negotiated (Accept / Content-Type, or ?format=)
+# when the optional msgpack / cbor2 packages are installed
+
+BINARY_FORMATS = [
+    name for module, name in (('msgpack', 'MessagePack'), ('cbor2', 'CBOR'))
+    if importlib.util.find_spec(module) is not None
+]
+
+REST_FRAMEWORK = {
+    'DEFAULT_PAGINATION_CLASS': 'fitness.pagination.KeysetPagination',
+    'PAGE_SIZE': 50,
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        *(f'fitness.renderers.{name}Renderer' for name in BINARY_FORMATS),
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        *(f'fitness.parsers.{name}Parser' for name in BINARY_FORMATS),
+    ],
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -165,4 +286,13 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'if-none-match',
+    'if-modified-since',
+    'read-your-writes-until',
+]
+CORS_EXPOSE_HEADERS = [
+    'etag',
+    'last-modified',
+    'server-timing',
+    'read-your-writes-until',
 ]
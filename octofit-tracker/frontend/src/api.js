@@ -0,0 +1,35 @@
+// fetch() for the OctoFit API that keeps read-your-writes working.
+//
+// After a write the API answers with a Read-Your-Writes-Until header, the
+// time until which this client's reads should come from the primary. The app
+// is served from another origin, so the API's cookie never comes back;
+// echoing the header on later requests pins them instead.
+const PIN_HEADER = 'Read-Your-Writes-Until';
+const STORAGE_KEY = 'octofit.readYourWritesUntil';
+
+function pinnedUntil() {
+  try {
+    return Number(sessionStorage.getItem(STORAGE_KEY)) || 0;
+  } catch (e) {
+    return 0;
+  }
+}
+
+export function apiFetch(url, options = {}) {
+  const headers = { ...(options.headers || {}) };
+  const until = pinnedUntil();
+  if (until > Date.now() / 1000) {
+    headers[PIN_HEADER] = String(until);
+  }
+  return fetch(url, { ...options, headers }).then(response => {
+    const pin = response.headers.get(PIN_HEADER);
+    if (pin) {
+      try {
+        sessionStorage.setItem(STORAGE_KEY, pin);
+      } catch (e) {
+        // Storage is unavailable (private mode); reads may see a secondary
+      }
+    }
+    return response;
+  });
+}
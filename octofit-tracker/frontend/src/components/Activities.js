@@ -1,4 +1,5 @@
 import React, { useState, useEffect } from 'react';
+import { apiFetch } from '../api';
 
 function Activities() {
   const [activities, setActivities] = useState([]);
@@ -10,7 +11,7 @@ function Activities() {
   useEffect(() => {
     console.log('Fetching activities from:', API_URL);
     
-    fetch(API_URL)
+    apiFetch(API_URL)
       .then(response => {
         if (!response.ok) {
           throw new Error(`HTTP error! status: ${response.status}`);
@@ -1,4 +1,5 @@
 import React, { useState, useEffect } from 'react';
+import { apiFetch } from '../api';
 
 function Leaderboard() {
   const [leaderboard, setLeaderboard] = useState([]);
@@ -10,7 +11,7 @@ function Leaderboard() {
   useEffect(() => {
     console.log('Fetching leaderboard from:', API_URL);
     
-    fetch(API_URL)
+    apiFetch(API_URL)
       .then(response => {
         if (!response.ok) {
           throw new Error(`HTTP error! status: ${response.status}`);
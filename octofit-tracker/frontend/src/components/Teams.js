@@ -1,4 +1,5 @@
 import React, { useState, useEffect } from 'react';
+import { apiFetch } from '../api';
 
 function Teams() {
   const [teams, setTeams] = useState([]);
@@ -10,7 +11,7 @@ function Teams() {
   useEffect(() => {
     console.log('Fetching teams from:', API_URL);
     
-    fetch(API_URL)
+    apiFetch(API_URL)
       .then(response => {
         if (!response.ok) {
           throw new Error(`HTTP error! status: ${response.status}`);
@@ -1,4 +1,5 @@
 import React, { useState, useEffect } from 'react';
+import { apiFetch } from '../api';
 
 // OctoFit Users Component
 function Users() {
@@ -11,13 +12,13 @@ function Users() {
   const [saving, setSaving] = useState(false);
 
   const API_URL = `https://${process.env.REACT_APP_CODESPACE_NAME}-8000.app.github.dev/api/users/`;
-  const TEAMS_URL = `https://${process.env.REACT_APP_CODESPACE_NAME}-8000.app.github.dev/api/teams/`;
+  const BATCH_URL = `https://${process.env.REACT_APP_CODESPACE_NAME}-8000.app.github.dev/api/batch/?include=users,teams`;
 
   useEffect(() => {
-    console.log('Fetching users from:', API_URL);
-    
-    // Fetch users
-    fetch(API_URL)
+    console.log('Fetching users and teams from:', BATCH_URL);
+
+    // Fetch users and teams in one request
+    apiFetch(BATCH_URL)
       .then(response => {
         if (!response.ok) {
           throw new Error(`HTTP error! status: ${response.status}`);
@@ -25,10 +26,9 @@ function Users() {
         return response.json();
       })
       .then(data => {
-        console.log('Users API response:', data);
-        const usersData = data.results || data;
-        console.log('Users data:', usersData);
-        setUsers(Array.isArray(usersData) ? usersData : []);
+        console.log('Batch API response:', data);
+        setUsers(Array.isArray(data.users) ? data.users : []);
+        setTeams(Array.isArray(data.teams) ? data.teams : []);
         setLoading(false);
       })
       .catch(error => {
@@ -36,16 +36,7 @@ function Users() {
         setError(error.message);
         setLoading(false);
       });
-
-    // Fetch teams
-    fetch(TEAMS_URL)
-      .then(response => response.json())
-      .then(data => {
-        const teamsData = data.results || data;
-        setTeams(Array.isArray(teamsData) ? teamsData : []);
-      })
-      .catch(error => console.error('Error fetching teams:', error));
-  }, [API_URL, TEAMS_URL]);
+  }, [BATCH_URL]);
 
   const handleEdit = (user) => {
     setEditingUser(user);
@@ -74,7 +65,7 @@ function Users() {
     setSaving(true);
 
     try {
-      const response = await fetch(`${API_URL}${editingUser._id}/`, {
+      const response = await apiFetch(`${API_URL}${editingUser._id}/`, {
         method: 'PATCH',
         headers: {
           'Content-Type': 'application/json',
@@ -1,4 +1,5 @@
 import React, { useState, useEffect } from 'react';
+import { apiFetch } from '../api';
 
 function Workouts() {
   const [workouts, setWorkouts] = useState([]);
@@ -10,7 +11,7 @@ function Workouts() {
   useEffect(() => {
     console.log('Fetching workouts from:', API_URL);
     
-    fetch(API_URL)
+    apiFetch(API_URL)
       .then(response => {
         if (!response.ok) {
           throw new Error(`HTTP error! status: ${response.status}`);